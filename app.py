@@ -2,19 +2,39 @@
 # Imports
 #----------------------------------------------------------------------------#
 
+import os
 import sys
+import io
+import csv
 import json
+import click
 import dateutil.parser
 import babel
-from flask import Flask, render_template, request, Response, flash, redirect, url_for
+import babel.dates
+from flask.cli import AppGroup
+from flask import Flask, Blueprint, render_template, request, Response, flash, redirect, url_for, abort, jsonify, g, session, stream_with_context
 from flask_moment import Moment
-from flask_sqlalchemy import SQLAlchemy
+from routing import RoutingSQLAlchemy
 import logging
 from logging import Formatter, FileHandler
 from flask_wtf import Form
 from forms import *
+from wtforms import DateTimeField
+from search import TrigramIndex, SuggestIndex
+from intervals import BookingCalendar
+from cache import create_cache
+from feed import HomeFeed
+from dbpool import PoolMonitor, engine_options
+from profiler import QueryProfiler, query_budget
+from jobs import JobQueue
+from assets import AssetPipeline
+from functools import wraps, lru_cache
 from flask_migrate import Migrate
-from datetime import datetime
+from werkzeug.datastructures import MultiDict
+from sqlalchemy.exc import IntegrityError
+from datetime import datetime, timedelta, timezone
+import hashlib
+from itertools import groupby
 #----------------------------------------------------------------------------#
 # App Config.
 #----------------------------------------------------------------------------#
@@ -22,7 +42,10 @@ from datetime import datetime
 app = Flask(__name__)
 moment = Moment(app)
 app.config.from_object('config')
-db = SQLAlchemy(app)
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(app.config)
+# GET requests read from the replicas in SQLALCHEMY_REPLICA_URIS, if any.
+db = RoutingSQLAlchemy(app)
+profiler = QueryProfiler(app)
 
 # TODO: connect to a local postgresql database
 migration = Migrate(app, db)
@@ -30,6 +53,25 @@ migration = Migrate(app, db)
 # Models.
 #----------------------------------------------------------------------------#
 
+class Genre(db.Model):
+    __tablename__ = 'genres'
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(50), nullable=False, unique=True)
+
+# genre_id leads the primary keys so ?genre= filters are index lookups; the
+# second index serves loading the genres of one venue/artist.
+venue_genres = db.Table('venue_genres',
+    db.Column('genre_id', db.Integer, db.ForeignKey('genres.id'),
+              primary_key=True),
+    db.Column('venue_id', db.Integer, db.ForeignKey('Venue.id'),
+              primary_key=True, index=True))
+
+artist_genres = db.Table('artist_genres',
+    db.Column('genre_id', db.Integer, db.ForeignKey('genres.id'),
+              primary_key=True),
+    db.Column('artist_id', db.Integer, db.ForeignKey('Artist.id'),
+              primary_key=True, index=True))
+
 class Venue(db.Model):
     __tablename__ = 'Venue'
     id = db.Column(db.Integer, primary_key=True)
@@ -42,12 +84,14 @@ class Venue(db.Model):
     facebook_link = db.Column(db.String(120))
 
     # TODO: implement any missing fields, as a database migration using Flask-Migrate
-    genres = db.Column(db.String(120),nullable=False)
+    genres = db.relationship('Genre', secondary=venue_genres, order_by=Genre.name)
     website = db.Column(db.String(120))
     seeking_talent = db.Column(db.Boolean,default=False)
     seeking_description = db.Column(db.Text)
     upcoming_shows_count = db.Column(db.Integer, default=0)
     past_shows_count = db.Column(db.Integer, default=0)
+    updated_at = db.Column(db.DateTime, nullable=False, index=True,
+                           default=datetime.utcnow, onupdate=datetime.utcnow)
     shows = db.relationship('Show',backref='venue',lazy=True,
                         cascade="save-update, merge, delete")
 
@@ -59,7 +103,7 @@ class Artist(db.Model):
     city = db.Column(db.String(120), nullable=False)
     state = db.Column(db.String(120), nullable=False)
     phone = db.Column(db.String(120), nullable=False)
-    genres = db.Column(db.String(120), nullable=False)
+    genres = db.relationship('Genre', secondary=artist_genres, order_by=Genre.name)
     image_link = db.Column(db.String(500))
     facebook_link = db.Column(db.String(120))
 
@@ -69,6 +113,8 @@ class Artist(db.Model):
     seeking_description = db.Column(db.Text)
     upcoming_shows_count = db.Column(db.Integer, default=0)
     past_shows_count = db.Column(db.Integer, default=0)
+    updated_at = db.Column(db.DateTime, nullable=False, index=True,
+                           default=datetime.utcnow, onupdate=datetime.utcnow)
     shows = db.relationship('Show',backref='artist',lazy=True,
                         cascade="save-update, merge, delete")
 
@@ -76,73 +122,898 @@ class Artist(db.Model):
 # TODO Implement Show and Artist models, and complete all model relationships and properties, as a database migration.
 class Show(db.Model):
     __tablename__ = 'shows'
+    __table_args__ = (
+        db.Index('ix_shows_venue_id_start_time', 'venue_id', 'start_time'),
+        db.Index('ix_shows_artist_id_start_time', 'artist_id', 'start_time'),
+        # on PostgreSQL the migrations also exclude overlapping
+        # [start_time, end_time) ranges per venue and per artist.
+        db.CheckConstraint('end_time > start_time',
+                           name='ck_shows_end_after_start'),
+    )
     id = db.Column(db.Integer, primary_key=True)
-    start_time = db.Column(db.DateTime, nullable=False)
+    start_time = db.Column(db.DateTime, nullable=False, index=True)
+    end_time = db.Column(db.DateTime, nullable=False)
     artist_id = db.Column(db.Integer,db.ForeignKey('Artist.id')
                           ,nullable=False)
     venue_id = db.Column(db.Integer,db.ForeignKey('Venue.id')
                           ,nullable=False)
+    # which of the artist/venue counters this show is currently counted in.
+    # pages classify shows by start_time; rollover_shows() moves the counters
+    # once the show has started.
     upcoming = db.Column(db.Boolean, nullable=False, default=True)
+    updated_at = db.Column(db.DateTime, nullable=False, index=True,
+                           default=datetime.utcnow, onupdate=datetime.utcnow)
+
+# background work queued by the views and run by `flask worker`; see jobs.py.
+class Job(db.Model):
+    __tablename__ = 'jobs'
+    __table_args__ = (
+        db.Index('ix_jobs_status_run_at', 'status', 'run_at'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), nullable=False)
+    payload = db.Column(db.Text, nullable=False, default='{}')
+    idempotency_key = db.Column(db.String(200), unique=True)
+    # queued, running, done or failed
+    status = db.Column(db.String(20), nullable=False, default='queued')
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False)
+    run_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    locked_by = db.Column(db.String(200))
+    locked_at = db.Column(db.DateTime)
+    last_error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    finished_at = db.Column(db.DateTime)
 
             
+#----------------------------------------------------------------------------#
+# Show counters.
+#----------------------------------------------------------------------------#
+
+# the venue and artist counters follow every show inserted, updated or
+# deleted through the ORM. each change is a single UPDATE ... SET n = n + 1
+# run in the flush, so concurrent writers never lose an increment. bulk
+# statements (rollover, import, venue/artist deletes) adjust the counters
+# themselves.
+
+def bump_show_counters(connection, venue_id, artist_id, upcoming, step):
+  column = 'upcoming_shows_count' if upcoming else 'past_shows_count'
+  for model, entity_id in ((Venue, venue_id), (Artist, artist_id)):
+    table = model.__table__
+    result = connection.execute(table.update().where(
+      table.c.id == entity_id).values({
+        column: db.func.coalesce(table.c[column], 0) + step,
+        'updated_at': datetime.utcnow()
+      }))
+    if result.rowcount != 1:
+      raise ValueError('no {} with id {!r}'.format(table.name, entity_id))
+
+@db.event.listens_for(Show, 'after_insert')
+def count_inserted_show(mapper, connection, show):
+  bump_show_counters(connection, show.venue_id, show.artist_id,
+    show.upcoming, 1)
+
+@db.event.listens_for(Show, 'after_delete')
+def count_deleted_show(mapper, connection, show):
+  bump_show_counters(connection, show.venue_id, show.artist_id,
+    show.upcoming, -1)
+
+@db.event.listens_for(Show, 'after_update')
+def count_updated_show(mapper, connection, show):
+  state = db.inspect(show)
+  def before(name):
+    history = state.attrs[name].history
+    return history.deleted[0] if history.deleted else getattr(show, name)
+  old = (before('venue_id'), before('artist_id'), before('upcoming'))
+  if old != (show.venue_id, show.artist_id, show.upcoming):
+    bump_show_counters(connection, *(old + (-1,)))
+    bump_show_counters(connection, show.venue_id, show.artist_id,
+      show.upcoming, 1)
+
 #----------------------------------------------------------------------------#
 # Filters.
 #----------------------------------------------------------------------------#
 
+# babel patterns parsed once, not on every call.
+DATETIME_FORMATS = {
+  'full': babel.dates.parse_pattern("EEEE MMMM, d, y 'at' h:mma"),
+  'medium': babel.dates.parse_pattern("EE MM, dd, y h:mma")
+}
+DATETIME_LOCALE = babel.Locale.parse(babel.dates.LC_TIME)
+
 def format_datetime(value, format='medium'):
-  date = dateutil.parser.parse(value)
-  if format == 'full':
-      format="EEEE MMMM, d, y 'at' h:mma"
-  elif format == 'medium':
-      format="EE MM, dd, y h:mma"
-  return babel.dates.format_datetime(date, format)
+  # accepts datetimes as well as the strings older callers pass; a page lists
+  # the same start times over and over, so results are memoized. aware
+  # datetimes at the same instant are equal whatever their offsets, so the
+  # offset is part of the key.
+  offset = value.utcoffset() if isinstance(value, datetime) else None
+  return cached_datetime(value, format, offset)
+
+@lru_cache(maxsize=4096)
+def cached_datetime(value, format, offset):
+  if not isinstance(value, datetime):
+    value = dateutil.parser.parse(value)
+  if format in ('long', 'short'):
+    # babel's own locale formats, which are not patterns
+    return babel.dates.format_datetime(value, format, locale=DATETIME_LOCALE)
+  pattern = DATETIME_FORMATS.get(format) or babel.dates.parse_pattern(format)
+  return pattern.apply(value, DATETIME_LOCALE)
 
 app.jinja_env.filters['datetime'] = format_datetime
 
+#----------------------------------------------------------------------------#
+# Assets.
+#----------------------------------------------------------------------------#
+
+# what layouts/main.html and layouts/form.html link, built by `flask assets
+# build` into one stylesheet and two scripts. the page's scripts all ran after
+# parsing already, so they share one deferred bundle in their old order.
+ASSET_BUNDLES = {
+  'main.css': ['css/bootstrap.min.css', 'css/layout.main.css', 'css/main.css',
+    'css/main.responsive.css', 'css/main.quickfix.css'],
+  'head.js': ['js/libs/modernizr-2.8.2.min.js'],
+  'main.js': ['js/libs/jquery-1.11.1.min.js', 'js/libs/moment.min.js',
+    'js/script.js', 'js/libs/bootstrap-3.1.1.min.js', 'js/plugins.js'],
+}
+
+assets = AssetPipeline(ASSET_BUNDLES, app)
+
+#----------------------------------------------------------------------------#
+# Queries.
+#----------------------------------------------------------------------------#
+
+def genre_names(entity):
+  return [genre.name for genre in entity.genres]
+
+def genres_from_names(names):
+  # Genre rows for the submitted names, creating any valid genre the table
+  # does not hold yet. names outside forms.GENRES are dropped.
+  names = [name for name in GENRES if name in names]
+  genres = Genre.query.filter(Genre.name.in_(names)).all() if names else []
+  known = set(genre.name for genre in genres)
+  for name in names:
+    if name not in known:
+      genre = Genre(name=name)
+      db.session.add(genre)
+      genres.append(genre)
+  return genres
+
+def genre_filter():
+  # the ?genre= argument of the listing pages, validated against the form
+  # choices.
+  genre = request.args.get('genre')
+  if genre is not None and genre not in GENRES:
+    abort(400)
+  return genre
+
+def venue_directory(genre=None):
+  # builds the city/state -> venues tree for /venues from a single ordered
+  # query; num_upcoming_shows is counted live from the shows table.
+  now = datetime.now()
+  query = db.session.query(Venue.city, Venue.state, Venue.id, Venue.name,
+    db.func.count(Show.id)).outerjoin(Show, db.and_(Show.venue_id == Venue.id,
+    Show.start_time > now))
+  if genre is not None:
+    query = query.filter(Venue.genres.any(Genre.name == genre))
+  rows = query.group_by(Venue.id).order_by(Venue.state, Venue.city,
+    Venue.id).all()
+  areas = []
+  for (city, state), venues in groupby(rows, key=lambda row: (row[0], row[1])):
+    areas.append({
+      "city": city,
+      "state": state,
+      "venues": [{
+        "id": venue[2],
+        "name": venue[3],
+        "num_upcoming_shows": venue[4]
+      } for venue in venues]
+    })
+  return areas
+
+AVAILABILITY_COLUMNS = ('id', 'name', 'city', 'state', 'address',
+  'image_link', 'seeking_talent')
+
+def available_venues(start_time, end_time, city=None, state=None,
+    seeking_talent=None, genre=None, after=None, limit=None):
+  # venues matching the filters with no show overlapping [start_time,
+  # end_time), in one query: a NOT EXISTS anti-join whose probe is a range
+  # scan of ix_shows_venue_id_start_time. no show is longer than
+  # MAX_SHOW_MINUTES, so only shows starting that long before the window
+  # can reach into it.
+  busy = db.session.query(Show.id).filter(Show.venue_id == Venue.id,
+    Show.start_time > start_time - timedelta(minutes=MAX_SHOW_MINUTES),
+    Show.start_time < end_time, Show.end_time > start_time)
+  query = db.session.query(*[getattr(Venue, name)
+    for name in AVAILABILITY_COLUMNS]).filter(~busy.exists())
+  if city:
+    query = query.filter(db.func.lower(Venue.city) == city.lower())
+  if state:
+    query = query.filter(Venue.state == state)
+  if seeking_talent is not None:
+    query = query.filter(Venue.seeking_talent == seeking_talent)
+  if genre is not None:
+    query = query.filter(Venue.genres.any(Genre.name == genre))
+  if after is not None:
+    query = query.filter(Venue.id > after)
+  query = query.order_by(Venue.id)
+  if limit is not None:
+    query = query.limit(limit + 1)
+  rows = query.all()
+  page = Page()
+  if limit is not None and len(rows) > limit:
+    del rows[limit:]
+    page.next_cursor = str(rows[-1].id)
+  page.extend(dict(zip(AVAILABILITY_COLUMNS, row)) for row in rows)
+  return page
+
+def availability_filters():
+  # the ?start=&end=&city=&state=&seeking_talent=&genre= arguments shared by
+  # /venues/available and its API; None when no window was asked for.
+  if not request.args.get('start') and not request.args.get('end'):
+    return None
+  try:
+    start_time = dateutil.parser.parse(request.args['start'])
+    end_time = dateutil.parser.parse(request.args['end'])
+  except (KeyError, ValueError, OverflowError):
+    abort(400)
+  if end_time <= start_time:
+    abort(400)
+  seeking_talent = request.args.get('seeking_talent')
+  # shows are stored in naive local time; astimezone() converts a window
+  # given with an offset and leaves a naive one as it is.
+  return {
+    "start_time": start_time.astimezone().replace(tzinfo=None),
+    "end_time": end_time.astimezone().replace(tzinfo=None),
+    "city": request.args.get('city', '').strip() or None,
+    "state": request.args.get('state') or None,
+    "seeking_talent": seeking_talent in ('1', 'true', 'on') if seeking_talent
+      else None,
+    "genre": genre_filter()
+  }
+
+#----------------------------------------------------------------------------#
+# Serialization.
+#----------------------------------------------------------------------------#
+
+# dicts built here back both the templates and the JSON API. plain column
+# fields are selected directly and the genres are aggregated into the same
+# SELECT; shows are filled in with one batched query for all the rows at once.
+ENTITY_COLUMNS = {
+  Venue: ('id', 'name', 'city', 'state', 'address', 'phone', 'website',
+    'facebook_link', 'seeking_talent', 'seeking_description', 'image_link'),
+  Artist: ('id', 'name', 'city', 'state', 'phone', 'website',
+    'facebook_link', 'seeking_venue', 'seeking_description', 'image_link')
+}
+SHOW_LIST_FIELDS = ('past_shows', 'upcoming_shows')
+SHOW_COUNT_FIELDS = ('past_shows_count', 'upcoming_shows_count')
+GENRE_TABLES = {Venue: venue_genres, Artist: artist_genres}
+# a venue's shows are listed with their artist and the other way round
+COUNTERPARTS = {Venue: Artist, Artist: Venue}
+
+SHOW_COLUMNS = {
+  'id': Show.id,
+  'start_time': Show.start_time,
+  'end_time': Show.end_time,
+  'venue_id': Show.venue_id,
+  'venue_name': Venue.name,
+  'venue_image_link': Venue.image_link,
+  'artist_id': Show.artist_id,
+  'artist_name': Artist.name,
+  'artist_image_link': Artist.image_link
+}
+
+def json_default(value):
+  # datetimes go out as ISO 8601, for json.dumps(default=), rather than in
+  # the HTTP date format jsonify() would use.
+  if isinstance(value, datetime):
+    return value.isoformat()
+  raise TypeError('{!r} is not JSON serializable'.format(value))
+
+class Page(list):
+  # rows of one keyset page; next_cursor is None on the last page.
+  next_cursor = None
+
+def prefix(model):
+  return model.__tablename__.lower()
+
+def show_key(model):
+  # shows.venue_id or shows.artist_id
+  return getattr(Show, prefix(model) + '_id')
+
+def entity_fields(model):
+  return ENTITY_COLUMNS[model] + ('genres',) + SHOW_LIST_FIELDS + \
+    SHOW_COUNT_FIELDS
+
+def entity_genres(model, ids):
+  association = GENRE_TABLES[model]
+  key = association.c[prefix(model) + '_id']
+  genres = {}
+  for entity_id, name in db.session.query(key, Genre.name).join(Genre,
+      Genre.id == association.c.genre_id).filter(key.in_(ids)).order_by(
+      Genre.name):
+    genres.setdefault(entity_id, []).append(name)
+  return genres
+
+def genre_list(model):
+  # the genre names of each row, comma-joined by a correlated subquery so they
+  # come back with the row itself. the aggregates do not order their input
+  # everywhere, so callers sort the names.
+  association = GENRE_TABLES[model]
+  if db.engine.dialect.name == 'postgresql':
+    joined = db.func.string_agg(Genre.name, ',')
+  else:
+    joined = db.func.group_concat(Genre.name, ',')
+  return db.select([joined]).select_from(association.join(Genre,
+    Genre.id == association.c.genre_id)).where(
+    association.c[prefix(model) + '_id'] == model.id).label('genres')
+
+def entity_shows(model, ids):
+  # {id: (past, upcoming)} with the counterpart columns joined in and past
+  # and upcoming told apart by the database.
+  counterpart = COUNTERPARTS[model]
+  name = prefix(counterpart)
+  now = datetime.now()
+  shows = {}
+  for row in db.session.query(show_key(model).label('owner_id'),
+      Show.start_time, show_key(counterpart).label('counterpart_id'),
+      counterpart.name, counterpart.image_link,
+      (Show.start_time > now).label('upcoming')).join(counterpart,
+      show_key(counterpart) == counterpart.id).filter(
+      show_key(model).in_(ids)).order_by(Show.start_time, Show.id):
+    past, upcoming = shows.setdefault(row.owner_id, ([], []))
+    (upcoming if row.upcoming else past).append({
+      name + "_id": row.counterpart_id,
+      name + "_name": row.name,
+      name + "_image_link": row.image_link,
+      "start_time": row.start_time
+    })
+  return shows
+
+def entity_show_counts(model, ids):
+  # {id: (past, upcoming)} counted in one grouped query.
+  now = datetime.now()
+  key = show_key(model)
+  return dict((entity_id, (total - upcoming, upcoming)) for entity_id, total,
+    upcoming in db.session.query(key, db.func.count(Show.id),
+    db.func.sum(db.case([(Show.start_time > now, 1)], else_=0))).filter(
+    key.in_(ids)).group_by(key))
+
+def serialize_entities(model, fields, ids=None, after=None, limit=None):
+  # venues/artists as dicts holding only the requested fields and the id,
+  # ordered by id; with a limit, one keyset page after the id given as after.
+  columns = ['id'] + [name for name in ENTITY_COLUMNS[model]
+    if name in fields and name != 'id']
+  selected = [getattr(model, name) for name in columns]
+  if 'genres' in fields:
+    selected.append(genre_list(model))
+  query = db.session.query(*selected)
+  if ids is not None:
+    query = query.filter(model.id.in_(ids))
+  if after is not None:
+    query = query.filter(model.id > after)
+  query = query.order_by(model.id)
+  if limit is not None:
+    query = query.limit(limit + 1)
+  rows = query.all()
+  page = Page()
+  if limit is not None and len(rows) > limit:
+    del rows[limit:]
+    page.next_cursor = str(rows[-1].id)
+  row_ids = [row.id for row in rows]
+  shows, counts = {}, {}
+  if row_ids and any(name in fields for name in SHOW_LIST_FIELDS):
+    shows = entity_shows(model, row_ids)
+    counts = dict((entity_id, (len(past), len(upcoming)))
+      for entity_id, (past, upcoming) in shows.items())
+  elif row_ids and any(name in fields for name in SHOW_COUNT_FIELDS):
+    counts = entity_show_counts(model, row_ids)
+  for row in rows:
+    # id comes along with any projection, to tell the rows apart
+    data = dict((name, getattr(row, name)) for name in columns)
+    if 'genres' in fields:
+      data['genres'] = sorted(row.genres.split(',')) if row.genres else []
+    past, upcoming = shows.get(row.id, ([], []))
+    past_count, upcoming_count = counts.get(row.id, (0, 0))
+    for name, value in (('past_shows', past), ('upcoming_shows', upcoming),
+        ('past_shows_count', past_count),
+        ('upcoming_shows_count', upcoming_count)):
+      if name in fields:
+        data[name] = value
+    page.append(data)
+  return page
+
+def serialize_entity(model, entity_id, fields=None):
+  page = serialize_entities(model, fields or entity_fields(model),
+    ids=[entity_id])
+  if not page:
+    abort(404)
+  return page[0]
+
+def encode_cursor(start_time, show_id):
+  return '{}_{}'.format(start_time.isoformat(), show_id)
+
+def decode_cursor(cursor):
+  start_time, _, show_id = cursor.rpartition('_')
+  return (datetime.strptime(start_time, '%Y-%m-%dT%H:%M:%S.%f'
+    if '.' in start_time else '%Y-%m-%dT%H:%M:%S'), int(show_id))
+
+def serialize_shows(fields, after=None, limit=None, upcoming=True):
+  # keyset pagination over (start_time, id): every page is an index range
+  # scan on shows.start_time, however deep the reader has paged. venue and
+  # artist columns are joined in only when asked for.
+  columns = ['id', 'start_time'] + [name for name in fields
+    if name not in ('id', 'start_time')]
+  query = db.session.query(*[SHOW_COLUMNS[name].label(name)
+    for name in columns])
+  if 'venue_name' in fields or 'venue_image_link' in fields:
+    query = query.join(Venue, Show.venue_id == Venue.id)
+  if 'artist_name' in fields or 'artist_image_link' in fields:
+    query = query.join(Artist, Show.artist_id == Artist.id)
+  if upcoming:
+    query = query.filter(Show.start_time > datetime.now())
+  if after is not None:
+    start_time, show_id = after
+    query = query.filter(db.or_(Show.start_time > start_time,
+      db.and_(Show.start_time == start_time, Show.id > show_id)))
+  query = query.order_by(Show.start_time, Show.id)
+  if limit is not None:
+    query = query.limit(limit + 1)
+  rows = query.all()
+  page = Page()
+  if limit is not None and len(rows) > limit:
+    del rows[limit:]
+    page.next_cursor = encode_cursor(rows[-1].start_time, rows[-1].id)
+  names = ['id'] + [name for name in fields if name != 'id']
+  for row in rows:
+    page.append(dict((name, getattr(row, name)) for name in names))
+  return page
+
+#----------------------------------------------------------------------------#
+# Search.
+#----------------------------------------------------------------------------#
+
+# in-process stand-ins for the pg_trgm indexes, used when the database is not
+# PostgreSQL. they are loaded before the first search, outside the search
+# views' query budgets, and kept current by the create/edit/delete views.
+search_indexes = {Venue: TrigramIndex(), Artist: TrigramIndex()}
+
+# name indexes behind /search/suggest, loaded the same way so suggestions
+# never touch the database.
+suggest_indexes = {Venue: SuggestIndex(), Artist: SuggestIndex()}
+
+# both kinds of index only see the writes of their own process. every write
+# to a venue's or artist's search document invalidates its model's tag, and a
+# process whose indexes were loaded under an older version of the tag reloads
+# them before its next search; see sync_search_indexes().
+SEARCH_INDEX_TAGS = {Venue: 'search:venues', Artist: 'search:artists'}
+SEARCH_ENDPOINTS = ('search_venues', 'search_artists', 'search_suggest')
+# the tag version each model's indexes were loaded under; a model missing
+# here has not been loaded by this process yet.
+search_index_versions = {}
+
+def load_search_indexes(models=(Venue, Artist)):
+  # the versions are read before the load, so a write in between makes the
+  # next search reload again rather than keep the older names.
+  versions = response_cache.versions(SEARCH_INDEX_TAGS[model]
+    for model in models)
+  for model in models:
+    suggest_indexes[model].load(db.session.query(model.id, model.name))
+    if db.engine.dialect.name != 'postgresql':
+      search_indexes[model].load(search_document(entity) for entity in
+        model.query.options(db.selectinload(model.genres)))
+    search_index_versions[model] = versions[SEARCH_INDEX_TAGS[model]]
+
+def sync_search_indexes():
+  # loads the indexes on the first search of this process. a per-process
+  # cache backend has no other process to hear from after that: this one's
+  # own writes already updated its indexes.
+  if request.endpoint not in SEARCH_ENDPOINTS:
+    return
+  versions = response_cache.versions(SEARCH_INDEX_TAGS.values())
+  stale = tuple(model for model, tag in SEARCH_INDEX_TAGS.items()
+    if model not in search_index_versions or (response_cache.shared and
+    versions[tag] != search_index_versions[model]))
+  if stale:
+    load_search_indexes(stale)
+
+# ahead of the profiler's own hook, so a load is not counted against the
+# search views' query budgets.
+app.before_request_funcs.setdefault(None, []).insert(0, sync_search_indexes)
+
+def search_document(entity):
+  return (entity.id, entity.name, entity.city, entity.state,
+    ','.join(genre_names(entity)))
+
+def index_entity(entity):
+  index = search_indexes[type(entity)]
+  if index.loaded:
+    index.add(*search_document(entity))
+  suggest_indexes[type(entity)].add(entity.id, entity.name)
+  response_cache.invalidate(SEARCH_INDEX_TAGS[type(entity)])
+
+def unindex_entity(model, entity_id):
+  search_indexes[model].remove(entity_id)
+  suggest_indexes[model].remove(entity_id)
+  response_cache.invalidate(SEARCH_INDEX_TAGS[model])
+
+def search(model, term):
+  # venues/artists whose name, city, state or genres contain term, best name
+  # match first. PostgreSQL answers from the trigram GIN indexes, anything
+  # else from the in-process index.
+  limit = app.config['SEARCH_RESULTS_LIMIT']
+  columns = (model.id, model.name, model.upcoming_shows_count)
+  if db.engine.dialect.name == 'postgresql':
+    pattern = '%{}%'.format(term.replace('\\', '\\\\').replace('%', '\\%')
+      .replace('_', '\\_'))
+    # a UNION of two index scans: the trigram indexes for the text fields,
+    # and the genre tables' primary keys for the genres, resolved to ids
+    # first. the genres as an EXISTS in the same OR would make the planner
+    # give up the trigram indexes for a sequential scan.
+    matches = db.session.query(model.id).filter(db.or_(*[
+      field.ilike(pattern, escape='\\') for field in
+      (model.name, model.city, model.state)]))
+    genre_ids = [genre_id for genre_id, in db.session.query(Genre.id).filter(
+      Genre.name.ilike(pattern, escape='\\'))]
+    if genre_ids:
+      association = GENRE_TABLES[model]
+      matches = matches.union(db.session.query(
+        association.c[prefix(model) + '_id']).filter(
+        association.c.genre_id.in_(genre_ids)))
+    return db.session.query(*columns).filter(model.id.in_(
+      matches.subquery())).order_by(db.func.similarity(model.name,
+      term).desc(), model.name).limit(limit).all()
+  ids = search_indexes[model].search(term, limit)
+  rows = dict((row.id, row) for row in
+    db.session.query(*columns).filter(model.id.in_(ids))) if ids else {}
+  return [rows[entity_id] for entity_id in ids if entity_id in rows]
+
+#----------------------------------------------------------------------------#
+# Home feed.
+#----------------------------------------------------------------------------#
+
+HOME_SHOW_FIELDS = ('id', 'venue_id', 'venue_name', 'artist_id',
+  'artist_name', 'artist_image_link', 'start_time')
+
+def feed_entry(entity):
+  return {"id": entity.id, "name": entity.name,
+    "image_link": entity.image_link}
+
+def feed_version(venue_ids=(), artist_ids=()):
+  # the latest updated_at of the venues, artists and shows, and how many of
+  # venue_ids and artist_ids still exist, in one query. every write the feed
+  # shows moves an updated_at, except deleting a venue or artist without
+  # shows, which the counts catch.
+  def latest(model):
+    return db.select([db.func.max(model.updated_at)]).as_scalar()
+  def present(model, ids):
+    if not ids:
+      return db.literal(0)
+    return db.select([db.func.count(model.id)]).where(
+      model.id.in_(ids)).as_scalar()
+  row = db.session.query(latest(Venue), latest(Artist), latest(Show),
+    present(Venue, venue_ids), present(Artist, artist_ids)).one()
+  return [stamp.isoformat() if stamp is not None else None
+    for stamp in row[:3]] + [int(row[3]), int(row[4])]
+
+def home_feed_version(data):
+  return feed_version([venue['id'] for venue in data['venues']],
+    [artist['id'] for artist in data['artists']])
+
+def load_home_feed(size, shows):
+  # the version is read before the rows, so a write in between makes the
+  # next get() rebuild again rather than keep the older rows.
+  version = feed_version()
+  def recent(model):
+    return [feed_entry(row) for row in db.session.query(model.id, model.name,
+      model.image_link).order_by(db.desc(model.id)).limit(size)]
+  venues, artists = recent(Venue), recent(Artist)
+  upcoming = serialize_shows(HOME_SHOW_FIELDS, limit=shows)
+  return {"venues": venues, "artists": artists, "shows": list(upcoming),
+    "more_shows": upcoming.next_cursor is not None,
+    "version": version[:3] + [len(venues), len(artists)]}
+
+# what / renders. the home_feed.* jobs of the create/edit/delete views keep it
+# current, and a feed found older than the database, as when no worker runs
+# the jobs, is rebuilt; once built the page needs a single query.
+home_feed = HomeFeed(app.config['HOME_FEED_PATH'], load_home_feed,
+  app.config['HOME_FEED_SIZE'], version=home_feed_version)
+
+#----------------------------------------------------------------------------#
+# Background jobs.
+#----------------------------------------------------------------------------#
+
+# work derived from a write that the request does not wait for. the views
+# enqueue it in the transaction of the write and `flask worker` runs it. the
+# show counters still change in the write's own transaction, and the page
+# cache, search indexes and booking calendar, which live in the memory of the
+# web process, are still updated by the request.
+jobs = JobQueue(Job.__table__, db.session, app)
+
+HOME_FEED_MODELS = {'venues': Venue, 'artists': Artist}
+
+@jobs.task('home_feed.entity')
+def refresh_feed_entity(payload):
+  # reads the venue/artist as it is now, so a job that runs late or after a
+  # later change still leaves the feed right.
+  model = HOME_FEED_MODELS[payload['section']]
+  row = db.session.query(model.id, model.name, model.image_link).filter(
+    model.id == payload['id']).first()
+  if row is None:
+    home_feed.entity_removed(payload['section'], payload['id'])
+  else:
+    home_feed.entity_changed(payload['section'], feed_entry(row))
+
+@jobs.task('home_feed.show')
+def add_feed_show(payload):
+  row = db.session.query(*[SHOW_COLUMNS[name] for name in HOME_SHOW_FIELDS]
+    ).join(Venue, Show.venue_id == Venue.id).join(Artist,
+    Show.artist_id == Artist.id).filter(Show.id == payload['id'],
+    Show.start_time > datetime.now()).first()
+  if row is not None:
+    home_feed.show_added(dict(zip(HOME_SHOW_FIELDS, row)))
+
+@jobs.task('home_feed.rebuild')
+def rebuild_home_feed(payload):
+  home_feed.invalidate()
+
+def enqueue_feed_entity(section, entity_id, change):
+  # one job per change of a venue/artist; change is its updated_at, or
+  # 'deleted'.
+  jobs.enqueue('home_feed.entity', {'section': section, 'id': entity_id},
+    key='home_feed:{}:{}:{}'.format(section, entity_id, change))
+
+@jobs.task('images.cache')
+def cache_image(payload):
+  # thumbnails of a venue/artist image link, for responsive_image(); until
+  # they exist, and for links that cannot be fetched, pages link the image
+  # itself.
+  try:
+    assets.cache_image(payload['url'])
+  except ValueError as e:
+    app.logger.warning('image %s not cached: %s', payload['url'], e)
+
+def enqueue_image(url):
+  # one job per link, however many venues/artists share it. the fetch is
+  # left to a worker, never run in the request that saved the link.
+  if url and url.startswith(('http://', 'https://')):
+    jobs.enqueue('images.cache', {'url': url},
+      key='images:' + hashlib.sha256(url.encode('utf-8')).hexdigest(),
+      eager=False)
+
+#----------------------------------------------------------------------------#
+# Cache.
+#----------------------------------------------------------------------------#
+
+# rendered pages, tagged with the entities they show: 'venues', 'artists' and
+# 'shows' for the listings, 'venue:<id>' and 'artist:<id>' for one entity.
+# the write views invalidate exactly the tags their change touches.
+response_cache = create_cache(app.config)
+
+def cache_tag(*tags):
+  # adds tags to the page being rendered, for data only known once queried.
+  if 'cache_tags' in g:
+    g.cache_tags.update(tags)
+    g.cache_versions.update(response_cache.versions(
+      tag for tag in tags if tag not in g.cache_versions))
+
+def replica_may_lag(versions):
+  # whether a tag of versions changed recently enough for a replica in use
+  # to be behind it still.
+  if not db.replicas:
+    return False
+  return response_cache.changed_within(versions, db.replicas.lag_bound or
+    app.config['REPLICA_STICKY_SECONDS'])
+
+def cached_page(*tags):
+  def decorator(view):
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+      # pages carrying flashed messages are personal, never share them.
+      if session.get('_flashes'):
+        return view(*args, **kwargs)
+      key = 'page:' + request.full_path
+      page = response_cache.get(key)
+      if page is not None:
+        return Response(page, mimetype='text/html')
+      page_tags = set(tag.format(**kwargs) for tag in tags)
+      g.cache_tags = page_tags
+      g.cache_versions = response_cache.versions(page_tags)
+      # a replica may not have replayed a write yet; right after one the
+      # page is read from the primary, so a stale copy is never cached.
+      if replica_may_lag(g.cache_versions):
+        db.use_primary()
+      response = app.make_response(view(*args, **kwargs))
+      if response.status_code == 200 and not session.get('_flashes') and \
+          not (db.read_replica() and replica_may_lag(g.cache_versions)):
+        response_cache.set(key, response.get_data(), g.cache_tags,
+          versions=g.cache_versions)
+      return response
+    return wrapper
+  return decorator
+
+#----------------------------------------------------------------------------#
+# Conditional requests.
+#----------------------------------------------------------------------------#
+
+def page_validators(model, counterpart, key, entity_id):
+  # (etag, last_modified) of a detail page from one aggregate query over the
+  # updated_at timestamps it is built from. the start_time of the latest show
+  # that has already begun is included as well: that is when the page last
+  # moved a show from upcoming to past.
+  now = datetime.now()
+  shows = db.session.query(db.func.count(Show.id).label('count'),
+    db.func.max(Show.updated_at).label('updated_at'),
+    db.func.max(counterpart.updated_at).label('counterpart_updated_at'),
+    db.func.max(db.case([(Show.start_time <= now, Show.start_time)])).label(
+    'started')).join(counterpart, show_key(counterpart) == counterpart.id
+    ).filter(key == entity_id).subquery()
+  row = db.session.query(model.updated_at, shows).filter(
+    model.id == entity_id).first()
+  if row is None:
+    abort(404)
+  modified = [stamp for stamp in (row[0], row.updated_at,
+    row.counterpart_updated_at) if stamp is not None]
+  if row.started is not None:
+    modified.append(row.started.astimezone(timezone.utc).replace(tzinfo=None))
+  etag = hashlib.sha1(repr(tuple(row)).encode('utf-8')).hexdigest()
+  return etag, max(modified)
+
+def conditional_page(validators):
+  # answers If-None-Match/If-Modified-Since with a 304 before the view runs
+  # any of its queries or renders a template.
+  def decorator(view):
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+      if session.get('_flashes'):
+        return view(*args, **kwargs)
+      etag, last_modified = validators(**kwargs)
+      response = Response()
+      response.set_etag(etag)
+      response.last_modified = last_modified
+      response.cache_control.no_cache = True
+      if response.make_conditional(request).status_code == 304:
+        return response
+      response = app.make_response(view(*args, **kwargs))
+      if response.status_code == 200:
+        response.set_etag(etag)
+        response.last_modified = last_modified
+        response.cache_control.no_cache = True
+      return response
+    return wrapper
+  return decorator
+
+def venue_validators(venue_id):
+  return page_validators(Venue, Artist, Show.venue_id, venue_id)
+
+def artist_validators(artist_id):
+  return page_validators(Artist, Venue, Show.artist_id, artist_id)
+
+def touch_counterparts(model, key, counterpart_key, entity_id):
+  # takes the shows of a venue/artist about to be deleted off the counters of
+  # the venues/artists it shares them with, and bumps their updated_at as
+  # their pages lose those shows. one UPDATE for all of them.
+  def counted(upcoming):
+    return db.select([db.func.count(Show.id)]).where(db.and_(key == entity_id,
+      counterpart_key == model.id, Show.upcoming == upcoming)).as_scalar()
+  model.query.filter(model.id.in_(db.select([counterpart_key]).where(
+    key == entity_id))).update({
+      model.upcoming_shows_count:
+        db.func.coalesce(model.upcoming_shows_count, 0) - counted(True),
+      model.past_shows_count:
+        db.func.coalesce(model.past_shows_count, 0) - counted(False),
+      model.updated_at: datetime.utcnow()
+    }, synchronize_session=False)
+
+#----------------------------------------------------------------------------#
+# Bookings.
+#----------------------------------------------------------------------------#
+
+def booked_intervals(resource):
+  # (start_time, end_time, show id) of every show of a ('venue', id) or
+  # ('artist', id) resource.
+  kind, resource_id = resource
+  key = Show.venue_id if kind == 'venue' else Show.artist_id
+  return db.session.query(Show.start_time, Show.end_time, Show.id).filter(
+    key == resource_id).all()
+
+def booking_version(resource):
+  # every show written for a venue or artist invalidates its page tag, in
+  # whichever process wrote it, so the tag's version dates its tree.
+  return response_cache.versions(['{}:{}'.format(*resource)]).popitem()[1]
+
+def standing_bookings(resource, intervals):
+  # those of the tree's intervals still in the database as they are there;
+  # negative keys stand for shows of an import chunk not written yet.
+  ids = [key for _, _, key in intervals if key > 0]
+  stored = set(db.session.query(Show.start_time, Show.end_time, Show.id).filter(
+    Show.id.in_(ids)).all()) if ids else set()
+  return [interval for interval in intervals
+    if interval[2] < 0 or tuple(interval) in stored]
+
+# per-process interval trees of the venues' and artists' shows. They are a
+# pre-filter: conflicts are confirmed against the database, and trees older
+# than their resource's cache tag are reloaded. On PostgreSQL the exclusion
+# constraints on shows are the final word across processes; elsewhere
+# hold_bookings() is.
+bookings = BookingCalendar(booked_intervals,
+  app.config['BOOKING_CALENDAR_SIZE'], version=booking_version,
+  confirm=standing_bookings)
+
+# SQLSTATE of an exclusion constraint violation on PostgreSQL
+EXCLUSION_VIOLATION = '23P01'
+
+def show_resources(venue_id, artist_id):
+  return [('venue', venue_id), ('artist', artist_id)]
+
+def hold_bookings(resources):
+  # without the exclusion constraints another process could book the same
+  # slot between the check and the commit, and with a per-process cache this
+  # one's trees never hear of it. an UPDATE of the venue and artist rows
+  # makes other bookings of them wait for this transaction (on SQLite, every
+  # write does), and their trees are reloaded inside it, so the check that
+  # follows sees every show committed before. returns False when a venue or
+  # artist does not exist.
+  if db.engine.dialect.name == 'postgresql':
+    return True
+  now = datetime.utcnow()
+  for model, kind in ((Venue, 'venue'), (Artist, 'artist')):
+    ids = set(resource_id for other, resource_id in resources if other == kind)
+    if ids and model.query.filter(model.id.in_(ids)).update(
+        {model.updated_at: now}, synchronize_session=False) != len(ids):
+      return False
+  for resource in resources:
+    bookings.forget(resource)
+  return True
+
+def exclusion_violation(error):
+  return getattr(error.orig, 'pgcode', None) == EXCLUSION_VIOLATION
+
 #----------------------------------------------------------------------------#
 # Controllers.
 #----------------------------------------------------------------------------#
 
+# not page-cached: the feed is already in memory, and the worker changes it
+# from another process, which only the feed's file tells this one about. the
+# feed's version check is the one query of a page whose feed is current; a
+# rebuild adds four.
 @app.route('/')
+@query_budget(5)
 def index():
-  recentVenues = Venue.query.order_by(db.desc(Venue.id)).limit(10).all()
-  recentArtists = Artist.query.order_by(db.desc(Artist.id)).limit(10).all()
-  return render_template('pages/home.html',venues = recentVenues, artists = recentArtists)
+  recentVenues, recentArtists, upcomingShows = home_feed.get(datetime.now())
+  return render_template('pages/home.html', venues=recentVenues,
+    artists=recentArtists, shows=upcomingShows)
 
 
 #  Venues
 #  ----------------------------------------------------------------
 
 @app.route('/venues')
+@query_budget(1)
+@cached_page('venues', 'shows')
 def venues():
-  # TODO: replace with real venues data.
-  #       num_shows should be aggregated based on number of upcoming shows per venue.
-  venue_areas = db.session.query(Venue.city,Venue.state).group_by(Venue.state,
-    Venue.city).all()
-  data = []
-  for area in venue_areas:
-    venues = db.session.query(Venue.id,Venue.name,
-      Venue.upcoming_shows_count).filter(Venue.city==area[0],Venue.state==area[1]).all()
-    data.append({
-        "city": area[0],
-        "state": area[1],
-        "venues": []
-    })
-    for venue in venues:
-      data[-1]["venues"].append({
-              "id": venue[0],
-              "name": venue[1],
-              "num_upcoming_shows":venue[2]
-      })
+  genre = genre_filter()
+  return render_template('pages/venues.html', areas=venue_directory(genre),
+    genre=genre)
 
-  return render_template('pages/venues.html', areas=data);
+@app.route('/venues/available')
+@query_budget(1)
+@cached_page('venues', 'shows')
+def available_venues_page():
+  filters = availability_filters()
+  data = None
+  if filters is not None:
+    data = available_venues(limit=app.config['AVAILABILITY_RESULTS_LIMIT'],
+      **filters)
+  return render_template('pages/available_venues.html', venues=data,
+    filters=filters or {}, genres=GENRES)
 
 @app.route('/venues/search', methods=['POST'])
+@query_budget(3)
 def search_venues():
   # TODO: implement search on artists with partial string search. Ensure it is case-insensitive.
   # seach for Hop should return "The Musical Hop".
   # search for "Music" should return "The Musical Hop" and "Park Square Live Music & Coffee"
-  results = Venue.query.filter(Venue.name.ilike('%{}%'.format(request.form['search_term']))).all()
+  results = search(Venue, request.form['search_term'])
   response={
     "count": len(results),
     "data": []
@@ -156,44 +1027,27 @@ def search_venues():
   
   return render_template('pages/search_venues.html', results=response, search_term=request.form.get('search_term', ''))
 
+@app.route('/search/suggest')
+def search_suggest():
+  # search-as-you-type for the navbar boxes, answered from memory.
+  query = request.args.get('q', '')
+  limit = app.config['SUGGEST_LIMIT']
+  return jsonify({
+    "venues": [{"id": key, "name": name} for key, name in
+      suggest_indexes[Venue].suggest(query, limit)],
+    "artists": [{"id": key, "name": name} for key, name in
+      suggest_indexes[Artist].suggest(query, limit)]
+  })
+
 @app.route('/venues/<int:venue_id>')
+@query_budget(3)
+@conditional_page(venue_validators)
+@cached_page('venue:{venue_id}')
 def show_venue(venue_id):
   # shows the venue page with the given venue_id
-  # TODO: replace with real venue data from the venues table, using venue_id
-  venue = Venue.query.get(venue_id)
-  past_shows = []
-  upcoming_shows = []
-  shows = venue.shows
-  for show in shows:
-    show_info ={
-      "artist_id": show.artist_id,
-      "artist_name": show.artist.name,
-      "artist_image_link": show.artist.image_link,
-      "start_time": str(show.start_time)
-    }
-    if(show.upcoming):
-      upcoming_shows.append(show_info)
-    else:
-      past_shows.append(show_info)
-
-  data={
-    "id": venue.id,
-    "name": venue.name,
-    "genres": venue.genres.split(','),
-    "address": venue.address,
-    "city": venue.city,
-    "state": venue.state,
-    "phone": venue.phone,
-    "website": venue.website,
-    "facebook_link": venue.facebook_link,
-    "seeking_talent": venue.seeking_talent,
-    "seeking_description": venue.seeking_description,
-    "image_link": venue.image_link,
-    "past_shows": past_shows,
-    "upcoming_shows": upcoming_shows,
-    "past_shows_count": len(past_shows),
-    "upcoming_shows_count": len(upcoming_shows)
-  }
+  data = serialize_entity(Venue, venue_id)
+  cache_tag(*['artist:{}'.format(show['artist_id'])
+    for show in data['past_shows'] + data['upcoming_shows']])
   return render_template('pages/show_venue.html', venue=data)
 
 #  Create Venue
@@ -215,12 +1069,17 @@ def create_venue_submission():
   new_venue.address = request.form['address']
   new_venue.phone = request.form['phone']
   new_venue.facebook_link = request.form['facebook_link']
-  new_venue.genres = request.form['genres']
+  new_venue.genres = genres_from_names(request.form.getlist('genres'))
   new_venue.website = request.form['website']
   new_venue.image_link = request.form['image_link']
   try:
     db.session.add(new_venue)
+    db.session.flush()
+    enqueue_feed_entity('venues', new_venue.id, new_venue.updated_at.isoformat())
+    enqueue_image(new_venue.image_link)
     db.session.commit()
+    response_cache.invalidate('venues')
+    index_entity(new_venue)
     # on successful db insert, flash success
     flash('Venue ' + request.form['name'] + ' was successfully listed!')
   except:
@@ -242,8 +1101,18 @@ def delete_venue():
   deleted_venue = Venue.query.get(venue_id)
   venueName = deleted_venue.name
   try:
+    touch_counterparts(Artist, Show.venue_id, Show.artist_id, deleted_venue.id)
+    # its shows go in one statement; the counters were settled above
+    Show.query.filter(Show.venue_id == deleted_venue.id).delete(
+      synchronize_session=False)
     db.session.delete(deleted_venue)
+    enqueue_feed_entity('venues', deleted_venue.id, 'deleted')
     db.session.commit()
+    # its shows are gone from its counterparts' booking trees as well
+    bookings.forget()
+    response_cache.invalidate('venues', 'shows',
+      'venue:{}'.format(deleted_venue.id))
+    unindex_entity(Venue, deleted_venue.id)
     flash('Venue ' + venueName + ' was successfully deleted!')
   except:
     db.session.rollback()
@@ -257,17 +1126,24 @@ def delete_venue():
 #  Artists
 #  ----------------------------------------------------------------
 @app.route('/artists')
+@query_budget(1)
+@cached_page('artists')
 def artists():
   # TODO: replace with real data returned from querying the database
-  data= Artist.query.with_entities(Artist.id, Artist.name).all()
-  return render_template('pages/artists.html', artists=data)
+  genre = genre_filter()
+  query = Artist.query.with_entities(Artist.id, Artist.name)
+  if genre is not None:
+    query = query.filter(Artist.genres.any(Genre.name == genre))
+  data = query.all()
+  return render_template('pages/artists.html', artists=data, genre=genre)
 
 @app.route('/artists/search', methods=['POST'])
+@query_budget(3)
 def search_artists():
   # TODO: implement search on artists with partial string search. Ensure it is case-insensitive.
   # seach for "A" should return "Guns N Petals", "Matt Quevado", and "The Wild Sax Band".
   # search for "band" should return "The Wild Sax Band".
-  results = Artist.query.filter(Artist.name.ilike('%{}%'.format(request.form['search_term']))).all()
+  results = search(Artist, request.form['search_term'])
 
   response={
     "count": len(results),
@@ -282,42 +1158,14 @@ def search_artists():
   return render_template('pages/search_artists.html', results=response, search_term=request.form.get('search_term', ''))
 
 @app.route('/artists/<int:artist_id>')
+@query_budget(3)
+@conditional_page(artist_validators)
+@cached_page('artist:{artist_id}')
 def show_artist(artist_id):
-  # shows the venue page with the given venue_id
-  # TODO: replace with real venue data from the venues table, using venue_id
-  artist = Artist.query.get(artist_id)
-  shows = artist.shows
-  past_shows = []
-  upcoming_shows = []
-  for show in shows:
-    show_info = {
-      "venue_id": show.venue_id,
-      "venue_name": show.venue.name,
-      "venue_image_link": show.venue.image_link,
-      "start_time": str(show.start_time)
-    }
-    if(show.upcoming):
-      upcoming_shows.append(show_info)
-    else:
-      past_shows.append(show_info)
-  data = {
-    "id": artist.id,
-    "name": artist.name,
-    "genres": artist.genres.split(','), 
-    "city": artist.city,
-    "state": artist.state,
-    "phone": artist.phone,
-    "website": artist.website,
-    "facebook_link": artist.facebook_link,
-    "seeking_venue": artist.seeking_venue,
-    "seeking_description":artist.seeking_description,
-    "image_link": artist.image_link,
-    "past_shows": past_shows,
-    "upcoming_shows": upcoming_shows,
-    "past_shows_count": len(past_shows),
-    "upcoming_shows_count": len(upcoming_shows)
-  }
-
+  # shows the artist page with the given artist_id
+  data = serialize_entity(Artist, artist_id)
+  cache_tag(*['venue:{}'.format(show['venue_id'])
+    for show in data['past_shows'] + data['upcoming_shows']])
   return render_template('pages/show_artist.html', artist=data)
 
 #  delete artist
@@ -328,8 +1176,18 @@ def delete_artist():
   deleted_artist = Artist.query.get(artist_id)
   artistName = deleted_artist.name
   try:
+    touch_counterparts(Venue, Show.artist_id, Show.venue_id, deleted_artist.id)
+    # its shows go in one statement; the counters were settled above
+    Show.query.filter(Show.artist_id == deleted_artist.id).delete(
+      synchronize_session=False)
     db.session.delete(deleted_artist)
+    enqueue_feed_entity('artists', deleted_artist.id, 'deleted')
     db.session.commit()
+    # its shows are gone from its counterparts' booking trees as well
+    bookings.forget()
+    response_cache.invalidate('artists', 'shows',
+      'artist:{}'.format(deleted_artist.id))
+    unindex_entity(Artist, deleted_artist.id)
     flash('Artist ' + artistName + ' was successfully deleted!')
   except:
     db.session.rollback()
@@ -342,23 +1200,11 @@ def delete_artist():
 #  Update
 #  ----------------------------------------------------------------
 @app.route('/artists/edit', methods=['GET'])
+@query_budget(1)
 def edit_artist():
   form = ArtistForm()
-  artist_id = request.args.get('artist_id')
-  artist = Artist.query.get(artist_id)
-  artist_info={
-    "id": artist.id,
-    "name": artist.name,
-    "genres": artist.genres.split(','),
-    "city": artist.city,
-    "state": artist.state,
-    "phone": artist.phone,
-    "website": artist.website,
-    "facebook_link": artist.facebook_link,
-    "seeking_venue": artist.seeking_venue,
-    "seeking_description": artist.seeking_description,
-    "image_link": artist.image_link
-  }
+  artist_info = serialize_entity(Artist, request.args.get('artist_id', type=int),
+    ENTITY_COLUMNS[Artist] + ('genres',))
   # TODO: populate form with fields from artist with ID <artist_id>
   return render_template('forms/edit_artist.html', form=form, artist=artist_info)
 
@@ -372,11 +1218,17 @@ def edit_artist_submission(artist_id):
   artist.state = request.form['state']
   artist.phone = request.form['phone']
   artist.facebook_link = request.form['facebook_link']
-  artist.genres = request.form['genres']
+  artist.genres = genres_from_names(request.form.getlist('genres'))
   artist.image_link = request.form['image_link']
   artist.website = request.form['website']
+  # genre changes alone do not update the Artist row
+  artist.updated_at = datetime.utcnow()
   try:
+    enqueue_feed_entity('artists', artist_id, artist.updated_at.isoformat())
+    enqueue_image(artist.image_link)
     db.session.commit()
+    response_cache.invalidate('artists', 'artist:{}'.format(artist_id))
+    index_entity(artist)
     flash("Artist {} is updated successfully".format(artist.name))
   except:
     db.session.rollback()
@@ -386,24 +1238,11 @@ def edit_artist_submission(artist_id):
   return redirect(url_for('show_artist', artist_id=artist_id))
 
 @app.route('/venues/edit', methods=['GET'])
+@query_budget(1)
 def edit_venue():
-  venue_id = request.args.get('venue_id')
   form = VenueForm()
-  venue = Venue.query.get(venue_id)
-  venue_info={
-    "id": venue.id,
-    "name": venue.name,
-    "genres": venue.genres.split(','),
-    "address": venue.address,
-    "city": venue.city,
-    "state": venue.state,
-    "phone": venue.phone,
-    "website": venue.website,
-    "facebook_link": venue.facebook_link,
-    "seeking_talent": venue.seeking_talent,
-    "seeking_description": venue.seeking_description,
-    "image_link": venue.image_link
-  }
+  venue_info = serialize_entity(Venue, request.args.get('venue_id', type=int),
+    ENTITY_COLUMNS[Venue] + ('genres',))
   # TODO: populate form with values from venue with ID <venue_id>
   return render_template('forms/edit_venue.html', form=form, venue=venue_info)
 
@@ -418,11 +1257,16 @@ def edit_venue_submission(venue_id):
   venue.address = request.form['address']
   venue.phone = request.form['phone']
   venue.facebook_link = request.form['facebook_link']
-  venue.genres = request.form['genres']
+  venue.genres = genres_from_names(request.form.getlist('genres'))
   venue.image_link = request.form['image_link']
   venue.website = request.form['website']
+  venue.updated_at = datetime.utcnow()
   try:
+    enqueue_feed_entity('venues', venue_id, venue.updated_at.isoformat())
+    enqueue_image(venue.image_link)
     db.session.commit()
+    response_cache.invalidate('venues', 'venue:{}'.format(venue_id))
+    index_entity(venue)
     flash('Venue ' + request.form['name'] + ' was successfully updated!')
   except:
     db.session.rollback()
@@ -448,13 +1292,19 @@ def create_artist_submission():
   new_artist.name = request.form['name']
   new_artist.city = request.form['city']
   new_artist.state = request.form['state']
-  new_artist.genres = request.form['genres']
+  new_artist.genres = genres_from_names(request.form.getlist('genres'))
   new_artist.phone = request.form['phone']
   new_artist.facebook_link = request.form['facebook_link']
   new_artist.image_link = request.form['image_link']
   try:
     db.session.add(new_artist)
+    db.session.flush()
+    enqueue_feed_entity('artists', new_artist.id,
+      new_artist.updated_at.isoformat())
+    enqueue_image(new_artist.image_link)
     db.session.commit()
+    response_cache.invalidate('artists')
+    index_entity(new_artist)
     # on successful db insert, flash success
     flash('Artist ' + request.form['name'] + ' was successfully listed!')
   except:
@@ -469,25 +1319,27 @@ def create_artist_submission():
 #  Shows
 #  ----------------------------------------------------------------
 
+SHOW_PAGE_FIELDS = ('venue_id', 'venue_name', 'artist_id', 'artist_name',
+  'artist_image_link', 'start_time')
+
 @app.route('/shows')
+@query_budget(1)
+@cached_page('shows', 'venues', 'artists')
 def shows():
-  # displays list of shows at /shows
-  # TODO: replace with real venues data.
-  #       num_shows should be aggregated based on number of upcoming shows per venue.
-  shows_list = Show.query.all()
-  data = []
-  for show in shows_list:
-    if(show.upcoming):
-      data.append({
-      "venue_id": show.venue_id,
-      "venue_name": show.venue.name,
-      "artist_id": show.artist_id,
-      "artist_name": show.artist.name,
-      "artist_image_link": show.artist.image_link,
-      "start_time": str(show.start_time)
-      })
+  # displays upcoming shows at /shows, one page at a time. ?after= carries
+  # the (start_time, id) of the last show on the previous page.
+  after = request.args.get('after')
+  if after is not None:
+    try:
+      after = decode_cursor(after)
+    except ValueError:
+      abort(400)
+  per_page = min(request.args.get('per_page', app.config['SHOWS_PER_PAGE'],
+    type=int), app.config['SHOWS_MAX_PER_PAGE'])
+  data = serialize_shows(SHOW_PAGE_FIELDS, after, max(per_page, 1))
 
-  return render_template('pages/shows.html', shows=data)
+  return render_template('pages/shows.html', shows=data,
+    next_cursor=data.next_cursor, per_page=request.args.get('per_page', type=int))
 
 @app.route('/shows/create')
 def create_shows():
@@ -499,9 +1351,10 @@ def create_shows():
 def create_show_submission():
   # called to create new shows in the db, upon submitting new show listing form
   # TODO: insert form data as a new Show record in the db, instead
+  form = ShowForm()
   new_show = Show()
-  new_show.artist_id = request.form['artist_id']
-  new_show.venue_id = request.form['venue_id']
+  new_show.artist_id = request.form.get('artist_id', type=int)
+  new_show.venue_id = request.form.get('venue_id', type=int)
   dateAndTime = request.form['start_time'].split(' ')
   DTList = dateAndTime[0].split('-')
   DTList += dateAndTime[1].split(':') 
@@ -509,31 +1362,824 @@ def create_show_submission():
     DTList[i] = int(DTList[i])
   new_show.start_time = datetime(DTList[0],DTList[1],DTList[2]
                                         ,DTList[3],DTList[4],DTList[5])
+  if not form.duration.validate(form):
+    flash('Show could not be listed. Duration must be between 1 and 1440 minutes.')
+    return render_template('forms/new_show.html', form=form)
+  new_show.end_time = new_show.start_time + timedelta(minutes=form.duration.data)
   now = datetime.now()
   new_show.upcoming = (now < new_show.start_time)
-  try:
-    db.session.add(new_show)
-    # update venue and artist table
-    updated_artist = Artist.query.get(new_show.artist_id)
-    updated_venue = Venue.query.get(new_show.venue_id)
-    if(new_show.upcoming):
-      updated_artist.upcoming_shows_count += 1;
-      updated_venue.upcoming_shows_count += 1;
-    else:
-      updated_artist.past_shows_count += 1;
-      updated_venue.past_shows_count += 1;
-    # on successful db insert, flash success
-    db.session.commit()
-    flash('Show was successfully listed!')
-  except:
-    db.session.rollback()
-    # TODO: on unsuccessful db insert, flash an error instead.
+  if new_show.artist_id is None or new_show.venue_id is None:
     flash('Show could not be listed. please make sure that your ids are correct')
-  finally:
-    db.session.close()
+    return redirect(url_for('index'))
+  resources = show_resources(new_show.venue_id, new_show.artist_id)
+  # the lock is held from the check to the calendar update so two requests
+  # of this process cannot both take the same slot; hold_bookings() does the
+  # same across processes.
+  with bookings.lock:
+    if not hold_bookings(resources):
+      db.session.rollback()
+      flash('Show could not be listed. please make sure that your ids are correct')
+      return redirect(url_for('index'))
+    conflicts = bookings.conflicts(resources, new_show.start_time,
+      new_show.end_time)
+    if conflicts:
+      db.session.rollback()
+      for (kind, _), start_time, end_time, _ in conflicts:
+        flash('Show could not be listed. The {} is already booked from {} to {}.'
+          .format(kind, format_datetime(start_time), format_datetime(end_time)))
+      return render_template('forms/new_show.html', form=form)
+    try:
+      # the venue and artist counters are bumped in the same flush
+      db.session.add(new_show)
+      db.session.flush()
+      if new_show.upcoming:
+        jobs.enqueue('home_feed.show', {'id': new_show.id},
+          key='home_feed:show:{}'.format(new_show.id))
+      # on successful db insert, flash success
+      db.session.commit()
+      bookings.add(resources, new_show.start_time, new_show.end_time,
+        new_show.id)
+      response_cache.invalidate('shows', 'venue:{}'.format(new_show.venue_id),
+        'artist:{}'.format(new_show.artist_id))
+      flash('Show was successfully listed!')
+    except IntegrityError as e:
+      db.session.rollback()
+      if not exclusion_violation(e):
+        flash('Show could not be listed. please make sure that your ids are correct')
+        return redirect(url_for('index'))
+      # booked by another process since the check
+      for resource in resources:
+        bookings.forget(resource)
+      flash('Show could not be listed. The venue or the artist was booked '
+        'for that time in the meantime.')
+      return render_template('forms/new_show.html', form=form)
+    except:
+      db.session.rollback()
+      # TODO: on unsuccessful db insert, flash an error instead.
+      flash('Show could not be listed. please make sure that your ids are correct')
+    finally:
+      db.session.close()
   # see: http://flask.pocoo.org/docs/1.0/patterns/flashing/
   return redirect(url_for('index'))
 
+#  API
+#  ----------------------------------------------------------------
+
+api = Blueprint('api', __name__, url_prefix='/api/v1')
+
+API_DEFAULT_FIELDS = ('genres',) + SHOW_COUNT_FIELDS
+
+def api_json(data):
+  # every API response carries show times, so they are encoded here rather
+  # than through the app's JSON provider, which differs across Flask versions.
+  return Response(json.dumps(data, default=json_default),
+    mimetype='application/json')
+
+def api_fields(allowed, default):
+  # ?fields=id,name,... projects the response; only those columns are read.
+  fields = request.args.get('fields')
+  if not fields:
+    return default
+  fields = tuple(name.strip() for name in fields.split(',') if name.strip())
+  if not fields or any(name not in allowed for name in fields):
+    abort(400)
+  return fields
+
+def api_limit():
+  limit = request.args.get('limit', app.config['API_PAGE_SIZE'], type=int)
+  return max(1, min(limit, app.config['API_MAX_PAGE_SIZE']))
+
+def api_entities(model):
+  fields = api_fields(entity_fields(model),
+    ENTITY_COLUMNS[model] + API_DEFAULT_FIELDS)
+  ids = after = None
+  try:
+    if request.args.get('ids'):
+      # ?ids=1,2,3 reads all of them in one query
+      ids = [int(entity_id) for entity_id in request.args['ids'].split(',')]
+    if request.args.get('after'):
+      after = int(request.args['after'])
+  except ValueError:
+    abort(400)
+  if ids is not None and len(ids) > app.config['API_MAX_PAGE_SIZE']:
+    abort(400)
+  page = serialize_entities(model, fields, ids=ids, after=after,
+    limit=None if ids is not None else api_limit())
+  return api_json({"data": page, "next": page.next_cursor})
+
+@api.route('/venues')
+@query_budget(2)
+def api_venues():
+  return api_entities(Venue)
+
+@api.route('/venues/available')
+@query_budget(1)
+def api_available_venues():
+  filters = availability_filters()
+  if filters is None:
+    abort(400)
+  try:
+    after = int(request.args['after']) if request.args.get('after') else None
+  except ValueError:
+    abort(400)
+  page = available_venues(after=after, limit=api_limit(), **filters)
+  return api_json({"data": page, "next": page.next_cursor})
+
+@api.route('/venues/<int:venue_id>')
+@query_budget(2)
+def api_venue(venue_id):
+  return api_json(serialize_entity(Venue, venue_id,
+    api_fields(entity_fields(Venue), entity_fields(Venue))))
+
+@api.route('/artists')
+@query_budget(2)
+def api_artists():
+  return api_entities(Artist)
+
+@api.route('/artists/<int:artist_id>')
+@query_budget(2)
+def api_artist(artist_id):
+  return api_json(serialize_entity(Artist, artist_id,
+    api_fields(entity_fields(Artist), entity_fields(Artist))))
+
+@api.route('/shows')
+@query_budget(1)
+def api_shows():
+  # all shows by default, ?upcoming=1 for the upcoming ones only.
+  fields = api_fields(tuple(SHOW_COLUMNS), tuple(SHOW_COLUMNS))
+  after = request.args.get('after')
+  if after is not None:
+    try:
+      after = decode_cursor(after)
+    except ValueError:
+      abort(400)
+  page = serialize_shows(fields, after, api_limit(),
+    upcoming=request.args.get('upcoming') in ('1', 'true'))
+  return api_json({"data": page, "next": page.next_cursor})
+
+@api.errorhandler(400)
+@api.errorhandler(404)
+def api_error(error):
+  return jsonify({"error": error.name}), error.code
+
+app.register_blueprint(api)
+
+#  Maintenance
+#  ----------------------------------------------------------------
+
+def rollover_shows():
+  # moves the shows that have started since the last run from the upcoming
+  # to the past counters of their artist and venue. every table gets a single
+  # UPDATE, no matter how many shows expired.
+  now = datetime.now()
+  expired = db.and_(Show.upcoming == True, Show.start_time <= now)
+  for model, key in ((Venue, Show.venue_id), (Artist, Show.artist_id)):
+    moved = db.select([db.func.count(Show.id)]).where(
+      db.and_(key == model.id, expired)).as_scalar()
+    model.query.filter(model.id.in_(db.select([key]).where(expired))).update({
+      model.upcoming_shows_count:
+        db.func.coalesce(model.upcoming_shows_count, 0) - moved,
+      model.past_shows_count:
+        db.func.coalesce(model.past_shows_count, 0) + moved
+    }, synchronize_session=False)
+  count = Show.query.filter(expired).update({Show.upcoming: False},
+    synchronize_session=False)
+  db.session.commit()
+  return count
+
+@app.cli.command('rollover-shows')
+def rollover_shows_command():
+  """Move started shows from the upcoming to the past counters."""
+  click.echo('{} shows rolled over'.format(rollover_shows()))
+
+def recount_shows(model, ids):
+  # recomputes the show counters of the given venues/artists from the shows
+  # table with a single UPDATE for the whole batch.
+  def counted(upcoming):
+    return db.select([db.func.count(Show.id)]).where(db.and_(
+      show_key(model) == model.id, Show.upcoming == upcoming)).as_scalar()
+  model.query.filter(model.id.in_(ids)).update({
+    model.upcoming_shows_count: counted(True),
+    model.past_shows_count: counted(False)
+  }, synchronize_session=False)
+
+def reconcile_batches(model, after=None, batch_size=5000):
+  # (id, stored, actual) rows of the venues/artists whose counters differ
+  # from their shows, a batch of ids at a time: one grouped aggregate per
+  # batch, so no statement holds its locks for long. yields (last id, diffs)
+  # once per batch.
+  key = show_key(model)
+  while True:
+    query = db.session.query(model.id).order_by(model.id)
+    if after is not None:
+      query = query.filter(model.id > after)
+    upper = query.offset(batch_size - 1).limit(1).scalar()
+    rows = db.session.query(model.id, model.upcoming_shows_count,
+      model.past_shows_count,
+      db.func.count(db.case([(Show.upcoming == True, Show.id)])),
+      db.func.count(db.case([(Show.upcoming == False, Show.id)]))
+      ).outerjoin(Show, key == model.id)
+    if after is not None:
+      rows = rows.filter(model.id > after)
+    if upper is not None:
+      rows = rows.filter(model.id <= upper)
+    rows = rows.group_by(model.id).order_by(model.id).all()
+    if not rows:
+      return
+    diffs = [(row[0], (row[1] or 0, row[2] or 0), (row[3], row[4]))
+      for row in rows if (row[1], row[2]) != (row[3], row[4])]
+    after = rows[-1][0]
+    yield after, diffs
+    if upper is None:
+      return
+
+def reconcile_counters(model, diffs):
+  # writes the recounted values with one executemany UPDATE. a row whose
+  # counters moved since they were read is left alone: the show that moved
+  # them was counted atomically, and the next run picks it up.
+  table = model.__table__
+  result = db.session.execute(table.update().where(db.and_(
+    table.c.id == db.bindparam('_id'),
+    db.func.coalesce(table.c.upcoming_shows_count, 0) == db.bindparam('_upcoming'),
+    db.func.coalesce(table.c.past_shows_count, 0) == db.bindparam('_past')
+  )).values(upcoming_shows_count=db.bindparam('upcoming'),
+    past_shows_count=db.bindparam('past'), updated_at=datetime.utcnow()), [{
+      "_id": entity_id, "_upcoming": stored[0], "_past": stored[1],
+      "upcoming": actual[0], "past": actual[1]
+    } for entity_id, stored, actual in diffs])
+  return result.rowcount
+
+def read_checkpoint(path):
+  try:
+    with open(path) as f:
+      return json.load(f)
+  except (IOError, OSError, ValueError):
+    return {}
+
+def write_checkpoint(path, checkpoint):
+  tmp = path + '.tmp'
+  with open(tmp, 'w') as f:
+    json.dump(checkpoint, f)
+  os.replace(tmp, path)
+
+@app.cli.command('reconcile-counters')
+@click.option('--dry-run', is_flag=True,
+  help='Report the counters that would change without writing them.')
+@click.option('--batch-size', type=int, default=None,
+  help='Venues/artists per batch; defaults to RECONCILE_BATCH_SIZE.')
+@click.option('--restart', is_flag=True,
+  help='Ignore the checkpoint of an interrupted run.')
+def reconcile_counters_command(dry_run, batch_size, restart):
+  """Recount venue and artist show counters from the shows table."""
+  path = app.config['RECONCILE_CHECKPOINT']
+  batch_size = batch_size or app.config['RECONCILE_BATCH_SIZE']
+  checkpoint = {} if restart or dry_run else read_checkpoint(path)
+  if checkpoint:
+    click.echo('resuming after {}'.format(', '.join('{} {}'.format(name, last)
+      for name, last in sorted(checkpoint.items()))))
+  for model in (Venue, Artist):
+    name = model.__tablename__
+    found = fixed = 0
+    for last, diffs in reconcile_batches(model, checkpoint.get(name),
+        batch_size):
+      found += len(diffs)
+      if dry_run:
+        for entity_id, stored, actual in diffs:
+          click.echo('{} {}: upcoming {} -> {}, past {} -> {}'.format(name,
+            entity_id, stored[0], actual[0], stored[1], actual[1]))
+        db.session.rollback()
+        continue
+      if diffs:
+        fixed += reconcile_counters(model, diffs)
+      db.session.commit()
+      # written only once the batch is committed, so a resumed run never
+      # skips a batch that was not applied.
+      checkpoint[name] = last
+      write_checkpoint(path, checkpoint)
+    if dry_run:
+      click.echo('{}: {} rows would change'.format(name, found))
+    else:
+      click.echo('{}: {} rows differed, {} fixed'.format(name, found, fixed))
+  if not dry_run:
+    if os.path.exists(path):
+      os.remove(path)
+    response_cache.invalidate('venues', 'artists')
+
+@app.cli.command('worker')
+@click.option('--threads', type=int, default=None,
+  help='Worker threads per process; defaults to JOB_WORKER_THREADS.')
+@click.option('--processes', type=int, default=None,
+  help='Worker processes; defaults to JOB_WORKER_PROCESSES.')
+@click.option('--burst', is_flag=True,
+  help='Exit once no job is due instead of waiting for more.')
+def worker_command(threads, processes, burst):
+  """Run queued background jobs until interrupted."""
+  threads = threads or app.config['JOB_WORKER_THREADS']
+  processes = processes or app.config['JOB_WORKER_PROCESSES']
+  click.echo('jobs: {}'.format(', '.join('{} {}'.format(count, status)
+    for status, count in sorted(jobs.counts().items())) or 'none'))
+  click.echo('{} processes x {} threads'.format(processes, threads))
+  jobs.serve_processes(processes, threads, burst)
+
+assets_cli = AppGroup('assets', help='Static asset bundles.')
+
+@assets_cli.command('build')
+def build_assets_command():
+  """Bundle, minify, fingerprint and compress the static assets."""
+  for name, path, size, gzipped, brotlied in assets.build():
+    click.echo('{} -> {}: {} bytes, {} gzip{}'.format(name,
+      os.path.relpath(path, app.static_folder), size, gzipped,
+      ', {} brotli'.format(brotlied) if brotlied is not None else ''))
+
+@assets_cli.command('images')
+@click.option('--queue', is_flag=True,
+  help='Enqueue the downloads for `flask worker` instead.')
+def cache_images_command(queue):
+  """Make thumbnails of the venue and artist images not cached yet."""
+  urls = set(url for model in (Venue, Artist) for url, in
+    db.session.query(model.image_link).filter(model.image_link.isnot(None)))
+  for url in sorted(urls):
+    if not url.startswith(('http://', 'https://')) or \
+        assets.has_image(url):
+      continue
+    if queue:
+      enqueue_image(url)
+      continue
+    try:
+      entry = assets.cache_image(url)
+    except (ValueError, OSError) as e:
+      click.echo('{}: {}'.format(url, e), err=True)
+      continue
+    if entry is None:
+      raise click.ClickException('Pillow is not installed')
+    click.echo('{}: {} copies'.format(url, len(entry['variants'])))
+  db.session.commit()
+
+app.cli.add_command(assets_cli)
+
+#  Import
+#  ----------------------------------------------------------------
+
+# rows are checked with the same forms the create pages use; these columns
+# are not on the forms but may be imported as well.
+IMPORT_ENTITIES = {
+  'venues': (Venue, VenueForm, ('id', 'seeking_talent', 'seeking_description')),
+  'artists': (Artist, ArtistForm, ('id', 'seeking_venue', 'seeking_description')),
+  'shows': (Show, ShowForm, ())
+}
+IMPORT_MAX_ERRORS = 100
+
+class ImportResult(object):
+  def __init__(self):
+    self.inserted = 0
+    self.rejected = 0
+    self.errors = []
+
+  def reject(self, line, errors):
+    self.rejected += 1
+    if len(self.errors) < IMPORT_MAX_ERRORS:
+      self.errors.append({"line": line, "errors": errors})
+
+  def as_dict(self):
+    return {"inserted": self.inserted, "rejected": self.rejected,
+      "errors": self.errors}
+
+def import_format(filename, format=None):
+  format = format or filename.rpartition('.')[2].lower()
+  if format not in ('csv', 'jsonl'):
+    raise ValueError('unsupported import format {!r}'.format(format))
+  return format
+
+def read_rows(stream, format):
+  # (line, row) pairs read lazily from a CSV or JSON lines text stream; a
+  # row that cannot be parsed comes back as the exception.
+  if format == 'csv':
+    reader = csv.DictReader(stream)
+    for row in reader:
+      yield reader.line_num, row
+  else:
+    for line, text in enumerate(stream, 1):
+      if text.strip():
+        try:
+          yield line, json.loads(text)
+        except ValueError as e:
+          yield line, e
+
+def import_datetime(value):
+  # ISO 8601 as `flask export` writes it, or anything else dateutil reads.
+  # shows are stored in naive local time.
+  moment = dateutil.parser.parse(value)
+  return moment.astimezone().replace(tzinfo=None) if moment.tzinfo else moment
+
+def import_form(form_class, row):
+  formdata = MultiDict()
+  moments = {}
+  for name, value in row.items():
+    if name == 'genres' and not isinstance(value, list):
+      value = [genre.strip() for genre in (value or '').split(',')]
+    field = getattr(form_class, name, None)
+    if getattr(field, 'field_class', None) is DateTimeField and \
+        isinstance(value, str) and value.strip():
+      # the field only reads its own format, to the second; the parsed
+      # value replaces what it read below.
+      try:
+        moments[name] = import_datetime(value)
+        value = moments[name].strftime(field.kwargs.get('format',
+          '%Y-%m-%d %H:%M:%S'))
+      except (ValueError, OverflowError):
+        pass
+    # blank cells are left out so the field falls back to its default.
+    for item in value if isinstance(value, list) else [value]:
+      if item is not None and item != '':
+        formdata.add(name, str(item))
+  form = form_class(formdata=formdata, meta={'csrf': False})
+  for name, moment in moments.items():
+    getattr(form, name).data = moment
+  return form
+
+def import_id(value):
+  # ids are positive integers, given as numbers or digits.
+  text = str(value).strip()
+  if isinstance(value, bool) or not text.isdigit() or int(text) == 0:
+    raise ValueError('must be a positive integer')
+  return int(text)
+
+def import_flag(value):
+  if isinstance(value, str):
+    return value.strip().lower() in ('1', 'true', 'yes', 'y')
+  return bool(value)
+
+def import_entity_chunk(model, records):
+  # records are (values, genre names) pairs. rows are written with one
+  # multi-row INSERT per chunk, plus one for their genre links.
+  table = model.__table__
+  ids = []
+  with_id = [values for values, _ in records if 'id' in values]
+  without_id = [values for values, _ in records if 'id' not in values]
+  if with_id:
+    db.session.execute(table.insert(), with_id)
+    if db.engine.dialect.name == 'postgresql':
+      db.session.execute(db.text("SELECT setval(pg_get_serial_sequence("
+        "'\"{0}\"', 'id'), (SELECT max(id) FROM \"{0}\"))".format(
+        table.name)))
+  if without_id and db.engine.dialect.name == 'postgresql':
+    ids = [row[0] for row in db.session.execute(
+      table.insert().values(without_id).returning(table.c.id))]
+  elif without_id:
+    entities = [model(**values) for values in without_id]
+    db.session.bulk_save_objects(entities, return_defaults=True)
+    ids = [entity.id for entity in entities]
+  ids = iter(ids)
+  genre_ids = dict(db.session.query(Genre.name, Genre.id))
+  association = GENRE_TABLES[model]
+  links = []
+  for values, names in records:
+    entity_id = values['id'] if 'id' in values else next(ids)
+    links.extend({"genre_id": genre_ids[name], prefix(model) + "_id": entity_id}
+      for name in names if name in genre_ids)
+  if links:
+    db.session.execute(association.insert(), links)
+
+def import_show_chunk(rows):
+  # rows are show values; the counters of every venue and artist touched
+  # are recomputed once for the chunk.
+  venue_ids = set(row['venue_id'] for row in rows)
+  artist_ids = set(row['artist_id'] for row in rows)
+  db.session.execute(Show.__table__.insert(), rows)
+  recount_shows(Venue, venue_ids)
+  recount_shows(Artist, artist_ids)
+  return venue_ids, artist_ids
+
+def import_rows(entity, rows):
+  # validates and inserts (line, row) pairs chunk by chunk, committing after
+  # each chunk so memory stays bounded whatever the size of the input.
+  model, form_class, extra = IMPORT_ENTITIES[entity]
+  chunk_size = app.config['IMPORT_CHUNK_SIZE']
+  result = ImportResult()
+  if model is not Show:
+    genres_from_names(GENRES)
+    db.session.commit()
+  touched = set()
+  chunk = []
+  def flush_chunk():
+    if model is Show:
+      with bookings.lock:
+        try:
+          inserted = flush_show_chunk()
+          db.session.commit()
+        finally:
+          # the trees hold the chunk's shows under placeholder keys; they are
+          # reloaded with the real ids, or without the shows on failure.
+          for _, show in chunk:
+            for resource in show_resources(show['venue_id'], show['artist_id']):
+              bookings.forget(resource)
+    else:
+      inserted = flush_entity_chunk()
+    result.inserted += inserted
+    del chunk[:]
+  def flush_entity_chunk():
+    # a row whose id is taken, in the database or earlier in the file, is
+    # rejected rather than failing the chunk's INSERT.
+    ids = [values['id'] for _, (values, _) in chunk if 'id' in values]
+    taken = set(row[0] for row in db.session.query(model.id).filter(
+      model.id.in_(ids))) if ids else set()
+    records = []
+    for line, (values, names) in chunk:
+      if 'id' in values:
+        if values['id'] in taken:
+          result.reject(line, {"id": ["{} {} already exists".format(entity[:-1],
+            values['id'])]})
+          continue
+        taken.add(values['id'])
+      records.append((line, (values, names)))
+    try:
+      import_entity_chunk(model, [record for _, record in records])
+      db.session.commit()
+      return len(records)
+    except IntegrityError:
+      # an id taken by another writer since the check: the rows are tried
+      # one at a time so only the conflicting ones are rejected.
+      db.session.rollback()
+    inserted = 0
+    for line, record in records:
+      try:
+        import_entity_chunk(model, [record])
+        db.session.commit()
+        inserted += 1
+      except IntegrityError:
+        db.session.rollback()
+        result.reject(line, {"id": ["conflicts with a stored row"]})
+    return inserted
+  def flush_show_chunk():
+    venue_ids = set(show['venue_id'] for _, show in chunk)
+    artist_ids = set(show['artist_id'] for _, show in chunk)
+    venue_ids = set(row[0] for row in db.session.query(Venue.id).filter(
+      Venue.id.in_(venue_ids)))
+    artist_ids = set(row[0] for row in db.session.query(Artist.id).filter(
+      Artist.id.in_(artist_ids)))
+    # the chunk's venues and artists are held, as by the show form, until
+    # the chunk is committed.
+    hold_bookings([('venue', venue_id) for venue_id in venue_ids] +
+      [('artist', artist_id) for artist_id in artist_ids])
+    shows = []
+    for line, show in chunk:
+      if show['venue_id'] not in venue_ids or show['artist_id'] not in artist_ids:
+        result.reject(line, {"ids": ["unknown venue_id or artist_id"]})
+        continue
+      # checked against the shows already booked and the ones earlier in
+      # the file alike.
+      resources = show_resources(show['venue_id'], show['artist_id'])
+      conflicts = bookings.conflicts(resources, show['start_time'],
+        show['end_time'])
+      if conflicts:
+        result.reject(line, {"start_time": ["the {} is already booked from "
+          "{} to {}".format(kind, start_time.isoformat(), end_time.isoformat())
+          for (kind, _), start_time, end_time, _ in conflicts]})
+        continue
+      bookings.add(resources, show['start_time'], show['end_time'], -line)
+      shows.append(show)
+    if shows:
+      venue_ids, artist_ids = import_show_chunk(shows)
+      touched.update('venue:{}'.format(i) for i in venue_ids)
+      touched.update('artist:{}'.format(i) for i in artist_ids)
+    return len(shows)
+  now = datetime.now()
+  for line, row in rows:
+    if isinstance(row, Exception) or not isinstance(row, dict):
+      result.reject(line, {"row": ["not a JSON object"]})
+      continue
+    form = import_form(form_class, row)
+    errors = {} if form.validate() else dict(form.errors)
+    entity_id = None
+    if 'id' in extra and row.get('id') not in (None, ''):
+      try:
+        entity_id = import_id(row['id'])
+      except ValueError as e:
+        errors['id'] = [str(e)]
+    if errors:
+      result.reject(line, errors)
+      continue
+    if model is Show:
+      try:
+        record = {"venue_id": int(form.venue_id.data),
+          "artist_id": int(form.artist_id.data),
+          "start_time": form.start_time.data,
+          "upcoming": form.start_time.data > now,
+          "updated_at": datetime.utcnow()}
+      except ValueError:
+        result.reject(line, {"ids": ["venue_id and artist_id must be integers"]})
+        continue
+      # an exported end_time wins over the duration, which defaults to the
+      # form's two hours.
+      try:
+        record['end_time'] = import_datetime(row['end_time']) if row.get(
+          'end_time') else form.start_time.data + timedelta(
+          minutes=form.duration.data)
+      except (TypeError, ValueError, OverflowError):
+        result.reject(line, {"end_time": ["not a date and time"]})
+        continue
+      if record['end_time'] <= record['start_time']:
+        result.reject(line, {"end_time": ["must be after start_time"]})
+        continue
+      if record['end_time'] - record['start_time'] > timedelta(
+          minutes=MAX_SHOW_MINUTES):
+        result.reject(line, {"end_time": ["must be at most {} minutes after "
+          "start_time".format(MAX_SHOW_MINUTES)]})
+        continue
+    else:
+      values = dict((name, value) for name, value in form.data.items()
+        if name != 'genres' and hasattr(model, name))
+      if entity_id is not None:
+        values['id'] = entity_id
+      for name in extra:
+        if name != 'id' and row.get(name) not in (None, ''):
+          values[name] = import_flag(row[name]) if name.startswith('seeking_') \
+            and name != 'seeking_description' else row[name]
+      values.update(upcoming_shows_count=0, past_shows_count=0,
+        updated_at=datetime.utcnow())
+      record = (values, form.genres.data)
+    chunk.append((line, record))
+    if len(chunk) >= chunk_size:
+      flush_chunk()
+  if chunk:
+    flush_chunk()
+  if result.inserted:
+    response_cache.invalidate(entity, 'shows', *touched)
+    if model is not Show:
+      # the other processes reload their search indexes once they see the
+      # tag change; without a shared cache only this one can.
+      response_cache.invalidate(SEARCH_INDEX_TAGS[model])
+      if not response_cache.shared:
+        load_search_indexes((model,))
+    jobs.enqueue('home_feed.rebuild')
+    db.session.commit()
+  return result
+
+@app.cli.command('import')
+@click.argument('entity', type=click.Choice(sorted(IMPORT_ENTITIES)))
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'format', type=click.Choice(['csv', 'jsonl']),
+  help='Defaults to the file extension.')
+def import_command(entity, path, format):
+  """Bulk import venues, artists or shows from a CSV or JSON lines file."""
+  with io.open(path, encoding='utf-8', newline='') as stream:
+    result = import_rows(entity, read_rows(stream,
+      import_format(path, format)))
+  if app.config['JOBS_EAGER']:
+    jobs.run_due()
+  click.echo('{} inserted, {} rejected'.format(result.inserted, result.rejected))
+  for error in result.errors:
+    click.echo('line {line}: {errors}'.format(**error), err=True)
+  if result.inserted and entity != 'shows' and not response_cache.shared:
+    click.echo('restart the web processes to search the new {}: with '
+      'CACHE_BACKEND={} they are not told of the import'.format(entity,
+      app.config['CACHE_BACKEND']), err=True)
+
+@app.route('/import/<entity>', methods=['POST'])
+def import_upload(entity):
+  # same as `flask import`, for a file uploaded as the 'file' field.
+  if entity not in IMPORT_ENTITIES or 'file' not in request.files:
+    abort(400)
+  upload = request.files['file']
+  try:
+    format = import_format(upload.filename or '', request.args.get('format'))
+  except ValueError:
+    abort(400)
+  stream = io.TextIOWrapper(upload.stream, encoding='utf-8', newline='')
+  return jsonify(import_rows(entity, read_rows(stream, format)).as_dict())
+
+#  Export
+#  ----------------------------------------------------------------
+
+EXPORT_ENTITIES = {'venues': Venue, 'artists': Artist, 'shows': Show}
+EXPORT_BATCH_SIZE = 1000
+
+def export_rows(model, since=None):
+  # every row of the table as a dict, read through a server-side cursor a
+  # batch at a time; since, naive UTC like updated_at, limits it to rows
+  # updated at or after it.
+  if since is not None and since.tzinfo is not None:
+    raise ValueError('since must be naive UTC, as updated_at is')
+  columns = [column.name for column in model.__table__.columns]
+  query = db.session.query(*[getattr(model, name) for name in columns])
+  if since is not None:
+    query = query.filter(model.updated_at >= since).order_by(
+      model.updated_at, model.id)
+  else:
+    query = query.order_by(model.id)
+  batch = []
+  for row in query.execution_options(stream_results=True).yield_per(
+      EXPORT_BATCH_SIZE):
+    batch.append(row)
+    if len(batch) == EXPORT_BATCH_SIZE:
+      for data in export_batch(model, columns, batch):
+        yield data
+      batch = []
+  for data in export_batch(model, columns, batch):
+    yield data
+
+def export_batch(model, columns, rows):
+  genres = {}
+  if rows and model in GENRE_TABLES:
+    genres = entity_genres(model, [row.id for row in rows])
+  for row in rows:
+    data = dict(zip(columns, row))
+    if model in GENRE_TABLES:
+      data['genres'] = ','.join(genres.get(row.id, []))
+    yield data
+
+def export_lines(model, format, since=None, watermark=None):
+  # the export as CSV or JSON lines text, a batch of lines at a time. the
+  # latest updated_at written is left in watermark['since'] for the next
+  # incremental run.
+  columns = [column.name for column in model.__table__.columns]
+  if model in GENRE_TABLES:
+    columns.append('genres')
+  buffer = io.StringIO()
+  writer = csv.DictWriter(buffer, columns) if format == 'csv' else None
+  if writer is not None:
+    writer.writeheader()
+  for count, data in enumerate(export_rows(model, since), 1):
+    if watermark is not None and (watermark.get('since') is None or
+        data['updated_at'] > watermark['since']):
+      watermark['since'] = data['updated_at']
+    if writer is not None:
+      writer.writerow(dict((name, value.isoformat() if isinstance(value,
+        datetime) else value) for name, value in data.items()))
+    else:
+      buffer.write(json.dumps(data, default=json_default) + '\n')
+    if count % EXPORT_BATCH_SIZE == 0:
+      yield buffer.getvalue()
+      buffer.seek(0)
+      buffer.truncate()
+  yield buffer.getvalue()
+
+def export_since(value):
+  # updated_at is naive UTC: a time with an offset is converted to it, and
+  # one without is taken as UTC already.
+  if not value:
+    return None
+  since = dateutil.parser.parse(value)
+  if since.tzinfo is not None:
+    since = since.astimezone(timezone.utc).replace(tzinfo=None)
+  return since
+
+@app.cli.command('export')
+@click.argument('entity', type=click.Choice(sorted(EXPORT_ENTITIES)))
+@click.option('--format', 'format', type=click.Choice(['csv', 'jsonl']),
+  default='csv')
+@click.option('--since', help='Only rows updated at or after this time.')
+@click.option('--output', type=click.File('w'), default='-')
+def export_command(entity, format, since, output):
+  """Stream all venues, artists or shows as CSV or JSON lines."""
+  try:
+    since = export_since(since)
+  except (ValueError, OverflowError):
+    raise click.BadParameter('not a date and time', param_hint='--since')
+  watermark = {}
+  for chunk in export_lines(EXPORT_ENTITIES[entity], format, since,
+      watermark):
+    output.write(chunk)
+  if watermark.get('since') is not None:
+    click.echo('watermark: {}'.format(watermark['since'].isoformat()),
+      err=True)
+
+@app.route('/export/<entity>.<format>')
+def export(entity, format):
+  if entity not in EXPORT_ENTITIES or format not in ('csv', 'jsonl'):
+    abort(404)
+  try:
+    since = export_since(request.args.get('since'))
+  except (ValueError, OverflowError):
+    abort(400)
+  return Response(stream_with_context(export_lines(EXPORT_ENTITIES[entity],
+    format, since)), mimetype='text/csv' if format == 'csv' else
+    'application/x-ndjson')
+
+#  Debug
+#  ----------------------------------------------------------------
+
+pool_monitor = PoolMonitor()
+
+def watch_pool():
+  pool_monitor.watch(db.engine)
+  for key in (db.replicas.keys if db.replicas else []):
+    pool_monitor.watch(db.replicas.engine(key))
+
+# at startup, so the counts cover every request. creating the engines opens
+# no connection yet.
+with app.app_context():
+  watch_pool()
+
+@app.route('/debug/pool')
+def debug_pool():
+  # checked-out connections, overflow and checkout waits of this process.
+  if not app.config['POOL_METRICS_ENABLED']:
+    abort(404)
+  stats = pool_monitor.stats()
+  stats['replicas'] = db.replicas.status() if db.replicas else []
+  return jsonify(stats)
+
 @app.errorhandler(404)
 def not_found_error(error):
     return render_template('errors/404.html'), 404
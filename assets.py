@@ -0,0 +1,438 @@
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import posixpath
+import re
+import tempfile
+import time
+
+from flask import request, send_file, url_for
+from markupsafe import Markup
+from werkzeug.exceptions import NotFound
+from werkzeug.utils import safe_join
+
+import media
+
+try:
+    import brotli
+except ImportError:  # optional: only gzip copies are built without it
+    brotli = None
+
+try:
+    import rjsmin
+except ImportError:  # optional: scripts are bundled unminified without it
+    rjsmin = None
+
+_STRINGS = re.compile(r'("(?:\\.|[^"\\])*"|\'(?:\\.|[^\'\\])*\')')
+_COMMENTS = re.compile(r'/\*(?!!).*?\*/', re.S)
+_SPACE = re.compile(r'\s+')
+_PUNCTUATION = re.compile(r'\s*([{};,>])\s*')
+_URL = re.compile(r'url\(\s*([\'"]?)([^\'")]+)\1\s*\)')
+_SOURCE_MAP = re.compile(r'^\s*//[#@] sourceMappingURL=.*$', re.M)
+# the name _emit() gives a built file: <stem>.<file_hash()>.<ext>
+_FINGERPRINT = re.compile(r'\.[0-9a-f]{12}\.[^./]+$')
+
+
+def minify_css(css):
+    """css without comments and the whitespace that does not matter.
+
+    Strings are left alone, and so is the space before a colon, which
+    separates a descendant selector like `a :hover`.
+    """
+    parts = _STRINGS.split(_COMMENTS.sub('', css))
+    for i in range(0, len(parts), 2):
+        part = _SPACE.sub(' ', parts[i])
+        part = _PUNCTUATION.sub(r'\1', part)
+        parts[i] = part.replace(': ', ':').replace(';}', '}')
+    return ''.join(parts).strip()
+
+
+def minify_js(js):
+    js = _SOURCE_MAP.sub('', js)
+    return rjsmin.jsmin(js) if rjsmin is not None else js.strip()
+
+
+def rebase_css_urls(css, source, static_url):
+    """Makes the relative url()s of source, a path under the static folder,
+    absolute, so they still resolve from the bundle's directory."""
+    def rebase(match):
+        quote, url = match.groups()
+        if re.match(r'^(/|#|[a-z][a-z0-9+.-]*:)', url, re.I):
+            return match.group(0)
+        path = posixpath.normpath(posixpath.join(posixpath.dirname(source), url))
+        return 'url({0}{1}/{2}{0})'.format(quote, static_url, path)
+    return _URL.sub(rebase, css)
+
+
+def file_hash(data):
+    return hashlib.sha256(data).hexdigest()[:12]
+
+
+class AssetPipeline(object):
+    """Bundles of static files, minified, fingerprinted and precompressed.
+
+    bundles maps a bundle name such as 'main.css' to the files under the
+    static folder it is made of, in order. build() writes each bundle to
+    <ASSETS_DIR>/<name>.<hash>.<ext> in the static folder, with a .gz copy
+    (and a .br one when brotli is installed) and a manifest.json naming
+    them. Bundles of earlier builds are kept for pages still referencing
+    them.
+
+    With fontTools installed, build() also cuts ASSETS_ICON_FONT down to
+    the icons the templates use, as icons.css and its fonts. With Pillow,
+    it writes ASSETS_IMAGE_WIDTHS wide copies of ASSETS_IMAGES in AVIF,
+    WebP and JPEG, as far as Pillow can write them, and cache_image(url)
+    does the same at ASSETS_THUMBNAIL_WIDTHS for a remote image.
+
+    Templates link bundles with asset_urls(name), which lists the bundle
+    file once built and its sources until then, or, in debug, as soon as a
+    source changed after the build. asset_url(path) links any other static
+    file with its hash in the query string, and responsive_image(src) an
+    image with the srcset of its copies. The static route serves the
+    precompressed copy the client accepts, and marks fingerprinted files
+    immutable for ASSETS_MAX_AGE.
+    """
+
+    def __init__(self, bundles, app=None):
+        self.bundles = bundles
+        self.app = None
+        self.manifest = {}
+        self._hashes = {}
+        self._remote = {}
+        # remote images without copies, until when to look again
+        self._missing = {}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        app.config.setdefault('ASSETS_DIR', 'dist')
+        app.config.setdefault('ASSETS_MAX_AGE', 365 * 24 * 3600)
+        app.config.setdefault('ASSETS_ICON_FONT', None)
+        app.config.setdefault('ASSETS_IMAGES', [])
+        app.config.setdefault('ASSETS_IMAGE_WIDTHS', (480, 960, 1440))
+        app.config.setdefault('ASSETS_THUMBNAIL_WIDTHS', (320, 640))
+        app.config.setdefault('ASSETS_IMAGE_QUALITY', 75)
+        app.config.setdefault('ASSETS_REMOTE_MAX_BYTES', 10 * 1024 * 1024)
+        app.config.setdefault('ASSETS_REMOTE_TIMEOUT', 10)
+        app.config.setdefault('ASSETS_REMOTE_RECHECK', 60)
+        app.jinja_env.globals.update(
+            asset_urls=self.urls, asset_url=self.url, asset_fonts=self.fonts,
+            responsive_image=self.image_tag, preload_image=self.preload_tag)
+        app.view_functions['static'] = self.send_static
+        self.manifest = self._read_manifest()
+
+    @property
+    def output_dir(self):
+        return os.path.join(self.app.static_folder, self.app.config['ASSETS_DIR'])
+
+    @property
+    def manifest_path(self):
+        return os.path.join(self.output_dir, 'manifest.json')
+
+    def _read_manifest(self):
+        try:
+            with open(self.manifest_path) as f:
+                return json.load(f)
+        except (IOError, OSError, ValueError):
+            return {}
+
+    def _source_path(self, source):
+        return os.path.join(self.app.static_folder, *source.split('/'))
+
+    def _sources(self, paths):
+        # recorded relative to the app, as templates can be sources too
+        return dict((os.path.relpath(path, self.app.root_path).replace(
+            os.sep, '/'), os.stat(path).st_mtime) for path in paths)
+
+    def _bundle(self, name, sources):
+        static_url = self.app.static_url_path
+        contents = []
+        for source in sources:
+            with open(self._source_path(source), encoding='utf-8') as f:
+                text = f.read()
+            if name.endswith('.css'):
+                contents.append(minify_css(rebase_css_urls(text, source,
+                                                           static_url)))
+            else:
+                contents.append(minify_js(text))
+        return ('\n' if name.endswith('.css') else '\n;\n').join(contents)
+
+    def build(self):
+        """Writes every bundle, the icons and the images; (name, path, bytes,
+        gzip bytes or None, brotli bytes or None) for each file."""
+        os.makedirs(self.output_dir, exist_ok=True)
+        manifest, built = {}, []
+        for name, sources in sorted(self.bundles.items()):
+            data = self._bundle(name, sources).encode('utf-8')
+            manifest[name] = {
+                'file': self._emit(name, name, data, built),
+                'sources': self._sources(self._source_path(source)
+                                         for source in sources),
+            }
+        self._build_icons(manifest, built)
+        self._build_images(manifest, built)
+        self._write(self.manifest_path, json.dumps(
+            manifest, indent=2, sort_keys=True).encode('utf-8'))
+        self.manifest = manifest
+        return built
+
+    def _emit(self, name, filename, data, built, compress=True):
+        """Writes data as <ASSETS_DIR>/<filename> with its hash before the
+        extension, and gzip/brotli copies with compress; returns the path
+        under the static folder."""
+        stem, ext = os.path.splitext(filename)
+        filename = '{}.{}{}'.format(stem, file_hash(data), ext)
+        path = os.path.join(self.output_dir, *filename.split('/'))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        sizes = [None, None]
+        self._write(path, data)
+        if compress:
+            copies = [(path + '.gz', gzip.compress(data, 9, mtime=0))]
+            if brotli is not None:
+                copies.append((path + '.br', brotli.compress(data)))
+            for i, (copy, content) in enumerate(copies):
+                self._write(copy, content)
+                sizes[i] = len(content)
+        built.append((name, path, len(data), sizes[0], sizes[1]))
+        return '{}/{}'.format(self.app.config['ASSETS_DIR'], filename)
+
+    def _build_icons(self, manifest, built):
+        font = self.app.config['ASSETS_ICON_FONT']
+        if font is None or media.TTFont is None:
+            return
+        font = self._source_path(font)
+        templates = list(media.template_files(os.path.join(
+            self.app.root_path, self.app.template_folder)))
+        codepoints, missing, fonts = media.subset_icon_font(
+            font, media.icon_names(templates))
+        if missing:
+            # pages keep linking the full icon kit rather than lose icons
+            self.app.logger.warning('no glyph in %s for %s; icons.css not '
+                                    'built', font, ', '.join(missing))
+            return
+        files = dict((flavor, self._emit('icons.' + flavor,
+                                         'fonts/icons.' + flavor, data,
+                                         built, compress=False))
+                     for flavor, data in fonts.items())
+        css = media.icon_css([(flavor, '{}/{}'.format(
+            self.app.static_url_path, files[flavor]))
+            for flavor in ('woff2', 'woff') if flavor in files], codepoints)
+        manifest['icons.css'] = {
+            'file': self._emit('icons.css', 'icons.css', css.encode('utf-8'),
+                               built),
+            'fonts': files,
+            'sources': self._sources([font] + templates),
+        }
+
+    def _build_images(self, manifest, built):
+        if not media.image_formats():
+            return
+        images = manifest['images'] = {}
+        for source in self.app.config['ASSETS_IMAGES']:
+            path = self._source_path(source)
+            with open(path, 'rb') as f:
+                data = f.read()
+            stem = posixpath.splitext(posixpath.basename(source))[0]
+            images[source] = self._image_copies(
+                'img/' + stem, data, self.app.config['ASSETS_IMAGE_WIDTHS'],
+                built)
+            images[source]['sources'] = self._sources([path])
+
+    def _image_copies(self, prefix, data, widths, built):
+        width, height, variants = media.image_variants(
+            data, widths, self.app.config['ASSETS_IMAGE_QUALITY'])
+        return {
+            'width': width,
+            'height': height,
+            'variants': [{
+                'file': self._emit(prefix, '{}-{}.{}'.format(prefix, size, ext),
+                                   content, built, compress=False),
+                'type': mimetype,
+                'width': size,
+            } for ext, mimetype, size, content in variants],
+        }
+
+    @staticmethod
+    def _write(path, content):
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path))
+        with os.fdopen(fd, 'wb') as f:
+            f.write(content)
+        os.replace(tmp, path)
+
+    def _fresh(self, entry):
+        for source, mtime in entry['sources'].items():
+            try:
+                if os.stat(os.path.join(self.app.root_path, source)
+                           ).st_mtime != mtime:
+                    return False
+            except OSError:
+                return False
+        return True
+
+    def _entry(self, entry):
+        if entry is not None and (not self.app.debug or self._fresh(entry)):
+            return entry
+        return None
+
+    def urls(self, name):
+        """URLs to link for the bundle name; none for icons.css until it is
+        built."""
+        entry = self._entry(self.manifest.get(name))
+        if entry is not None:
+            return [url_for('static', filename=entry['file'])]
+        return [self.url(source) for source in self.bundles.get(name, ())]
+
+    def fonts(self, name):
+        """URLs of the woff2 fonts of the built stylesheet name, to preload."""
+        entry = self._entry(self.manifest.get(name))
+        if entry is None or 'woff2' not in entry.get('fonts', {}):
+            return []
+        return [url_for('static', filename=entry['fonts']['woff2'])]
+
+    def cache_image(self, url):
+        """Downloads the image at url and writes its thumbnails, for
+        responsive_image(url); a no-op without Pillow."""
+        if not media.image_formats():
+            return None
+        config = self.app.config
+        data = media.fetch_image(url, config['ASSETS_REMOTE_MAX_BYTES'],
+                                 config['ASSETS_REMOTE_TIMEOUT'])
+        key = hashlib.sha256(url.encode('utf-8')).hexdigest()[:20]
+        entry = self._image_copies('remote/' + key, data,
+                                   config['ASSETS_THUMBNAIL_WIDTHS'], [])
+        entry['url'] = url
+        self._write(self._remote_path(url), json.dumps(
+            entry, sort_keys=True).encode('utf-8'))
+        self._remote[url] = entry
+        self._missing.pop(url, None)
+        return entry
+
+    def has_image(self, src):
+        """Whether responsive_image(src) has copies to offer."""
+        return self._image(src) is not None
+
+    def _remote_path(self, url):
+        key = hashlib.sha256(url.encode('utf-8')).hexdigest()[:20]
+        return os.path.join(self.output_dir, 'remote', key + '.json')
+
+    def _image(self, src):
+        if not src.startswith(('http://', 'https://')):
+            return self._entry(self.manifest.get('images', {}).get(src))
+        entry = self._remote.get(src)
+        if entry is None:
+            # cached by a worker, maybe in another process since; a miss is
+            # only looked for again after ASSETS_REMOTE_RECHECK seconds.
+            if self._missing.get(src, 0) > time.time():
+                return None
+            try:
+                with open(self._remote_path(src)) as f:
+                    entry = self._remote[src] = json.load(f)
+            except (IOError, OSError, ValueError):
+                self._missing[src] = time.time() + \
+                    self.app.config['ASSETS_REMOTE_RECHECK']
+                return None
+        return entry
+
+    def _srcsets(self, entry):
+        srcsets = {}
+        for variant in entry['variants']:
+            srcsets.setdefault(variant['type'], []).append('{} {}w'.format(
+                url_for('static', filename=variant['file']), variant['width']))
+        return [(mimetype, ', '.join(srcset)) for mimetype, srcset
+                in sorted(srcsets.items(), key=lambda item: [
+                    f[2] for f in media.IMAGE_FORMATS].index(item[0]))]
+
+    def image_tag(self, src, alt='', sizes='100vw', **attributes):
+        """<img> of src, a static path or a remote URL, wrapped in a
+        <picture> offering its AVIF/WebP/JPEG copies for sizes when it has
+        any. Images load lazily unless loading='eager' is given."""
+        attributes = dict((key.rstrip('_').replace('_', '-'), value)
+                          for key, value in attributes.items())
+        src = src or ''
+        attributes.setdefault('loading', 'lazy')
+        attributes.setdefault('decoding', 'async')
+        entry = self._image(src) if src else None
+        if entry is None:
+            local = src and not src.startswith(('http://', 'https://'))
+            return Markup('<img src="{}" alt="{}"{}>').format(
+                self.url(src) if local else src, alt, _attributes(attributes))
+        srcsets = self._srcsets(entry)
+        fallback = srcsets.pop()
+        largest = [v for v in entry['variants'] if v['type'] == fallback[0]][-1]
+        sources = Markup('').join(
+            Markup('<source type="{}" srcset="{}" sizes="{}">').format(
+                mimetype, srcset, sizes) for mimetype, srcset in srcsets)
+        return Markup('<picture>{}<img src="{}" srcset="{}" sizes="{}" '
+                      'alt="{}"{}></picture>').format(
+            sources, url_for('static', filename=largest['file']), fallback[1],
+            sizes, alt, _attributes(attributes))
+
+    def preload_tag(self, src, sizes='100vw', media_query=None):
+        """<link rel=preload> for the copies of src in the best format, which
+        browsers that cannot decode it skip."""
+        entry = self._image(src)
+        if entry is None:
+            return Markup('')
+        mimetype, srcset = self._srcsets(entry)[0]
+        return Markup('<link rel="preload" as="image" type="{}" '
+                      'imagesrcset="{}" imagesizes="{}"{}>').format(
+            mimetype, srcset, sizes, _attributes({'media': media_query}))
+
+    def url(self, filename):
+        """URL of a static file, with ?v= its content hash."""
+        digest = self._hash(filename)
+        if digest is None:
+            return url_for('static', filename=filename)
+        return url_for('static', filename=filename, v=digest)
+
+    def _hash(self, filename):
+        # hashes are kept until the file changes
+        path = self._source_path(filename)
+        try:
+            mtime = os.stat(path).st_mtime
+        except OSError:
+            return None
+        cached = self._hashes.get(filename)
+        if cached is None or cached[0] != mtime:
+            with open(path, 'rb') as f:
+                cached = self._hashes[filename] = (mtime, file_hash(f.read()))
+        return cached[1]
+
+    def _fingerprinted(self, filename):
+        # not all of ASSETS_DIR: the manifest and the remote image entries
+        # there are rewritten in place
+        if filename.startswith(self.app.config['ASSETS_DIR'] + '/') and \
+                _FINGERPRINT.search(filename):
+            return True
+        version = request.args.get('v')
+        return version is not None and version == self._hash(filename)
+
+    def send_static(self, filename):
+        path = safe_join(self.app.static_folder, filename)
+        if path is None or not os.path.isfile(path):
+            raise NotFound()
+        served, encoding = path, None
+        for name, suffix in (('br', '.br'), ('gzip', '.gz')):
+            if request.accept_encodings[name] and os.path.isfile(path + suffix):
+                served, encoding = path + suffix, name
+                break
+        mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+        response = send_file(served, mimetype=mimetype, conditional=True)
+        if encoding is not None:
+            response.content_encoding = encoding
+        response.vary.add('Accept-Encoding')
+        if self._fingerprinted(filename):
+            response.cache_control.public = True
+            response.cache_control.max_age = self.app.config['ASSETS_MAX_AGE']
+            response.cache_control.immutable = True
+            response.expires = None
+        return response
+
+
+def _attributes(attributes):
+    return Markup('').join(Markup(' {}="{}"').format(key, value)
+                           for key, value in sorted(attributes.items())
+                           if value is not None)
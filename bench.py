@@ -0,0 +1,432 @@
+"""Benchmarks every route of app.py against a seeded database.
+
+    python seed.py --database-url sqlite:///bench.db --scale medium --reset
+    python bench.py --database-url sqlite:///bench.db --save bench_baseline.json
+    python bench.py --database-url sqlite:///bench.db --compare bench_baseline.json
+
+Each route is requested through the Flask test client with the page cache
+off, recording p50/p95/p99 latency, queries per request and the peak
+memory allocated by one request. --compare exits non-zero when a route got
+slower, heavier or started running more queries than in the baseline.
+Routes with a latency budget fail the run whenever their p95 is over it;
+the availability search is held to 50 ms at seed.py's availability scale
+(10k venues, 1M shows). A last case renders /shows' template with 1,000
+shows and no database, with the memoized datetime filter and, for
+reference, with babel formatting every start time.
+
+With --concurrency it becomes a load driver instead: that many threads
+request random routes for --duration seconds, in process or against a
+running server given with --base-url.
+"""
+import json
+import os
+import platform
+import random
+import threading
+import time
+import tracemalloc
+import warnings
+from datetime import datetime, timedelta
+from fnmatch import fnmatch
+
+import click
+
+# routes that change or remove data; run only with --writes, and deletes and
+# uploads never, since a benchmark should leave the dataset as it found it.
+WRITE_ENDPOINTS = ('create_venue_submission', 'create_artist_submission',
+                   'create_show_submission', 'edit_venue_submission',
+                   'edit_artist_submission')
+SKIPPED_ENDPOINTS = ('static', 'delete_venue', 'delete_artist',
+                     'import_upload')
+# a route is a regression when it gets this much slower, and by at least
+# NOISE_MS, or runs more queries.
+NOISE_MS = 2.0
+# p95 budgets in ms, by glob of the route names.
+LATENCY_BUDGETS_MS = {
+    'GET */venues/available': 50.0,
+}
+RENDER_SHOWS = 1000
+RENDER_NAME = 'RENDER pages/shows.html {} shows'.format(RENDER_SHOWS)
+
+
+def percentile(values, p):
+    # nearest-rank percentile of a sorted list
+    if not values:
+        return 0.0
+    rank = max(int(round(p / 100.0 * len(values) + 0.5)) - 1, 0)
+    return values[min(rank, len(values) - 1)]
+
+
+def summarize(times):
+    times = sorted(times)
+    return {
+        'n': len(times),
+        'p50_ms': round(percentile(times, 50) * 1000, 3),
+        'p95_ms': round(percentile(times, 95) * 1000, 3),
+        'p99_ms': round(percentile(times, 99) * 1000, 3),
+        'mean_ms': round(sum(times) / len(times) * 1000, 3) if times else 0.0,
+    }
+
+
+class Scenario(object):
+    """One route with a way to build a fresh request for it."""
+
+    def __init__(self, name, method, build):
+        self.name = name
+        self.method = method
+        self._build = build
+
+    def request(self, rng):
+        """(url, form data) of one request."""
+        return self._build(rng)
+
+
+def window(rng):
+    start = datetime.now().replace(minute=0, second=0, microsecond=0) + \
+        timedelta(days=rng.randint(1, 60), hours=rng.choice((18, 19, 20)))
+    return {'start': start.isoformat(),
+            'end': (start + timedelta(hours=3)).isoformat()}
+
+
+def venue_form(rng, ids):
+    return {'name': 'Bench Venue {}'.format(rng.randrange(10 ** 6)),
+            'city': 'San Francisco', 'state': 'CA', 'address': '1 Bench St',
+            'phone': '555-000-0000', 'genres': 'Jazz',
+            'facebook_link': 'https://www.facebook.com/bench',
+            'website': 'https://example.com/bench',
+            'image_link': 'https://example.com/bench.jpg'}
+
+
+def artist_form(rng, ids):
+    form = venue_form(rng, ids)
+    del form['address']
+    form['name'] = 'Bench Artist {}'.format(rng.randrange(10 ** 6))
+    return form
+
+
+def show_form(rng, ids):
+    start = datetime.now() + timedelta(days=rng.randint(400, 4000),
+                                       minutes=rng.randrange(24 * 60))
+    return {'venue_id': str(rng.choice(ids['venue'])),
+            'artist_id': str(rng.choice(ids['artist'])),
+            'start_time': start.strftime('%Y-%m-%d %H:%M:%S'),
+            'duration': '90'}
+
+
+# query strings and forms of the routes that need more than their URL
+# arguments.
+QUERY_ARGS = {
+    'search_suggest': lambda rng, ids: {'q': rng.choice(('bl', 'gold', 'echo'))},
+    'available_venues_page': lambda rng, ids: window(rng),
+    'api.api_available_venues': lambda rng, ids: window(rng),
+    'edit_venue': lambda rng, ids: {'venue_id': rng.choice(ids['venue'])},
+    'edit_artist': lambda rng, ids: {'artist_id': rng.choice(ids['artist'])},
+}
+FORMS = {
+    'search_venues': lambda rng, ids: {'search_term': rng.choice(('hall', 'blue', 'o'))},
+    'search_artists': lambda rng, ids: {'search_term': rng.choice(('band', 'neon', 'a'))},
+    'create_venue_submission': venue_form,
+    'edit_venue_submission': venue_form,
+    'create_artist_submission': artist_form,
+    'edit_artist_submission': artist_form,
+    'create_show_submission': show_form,
+}
+URL_ARGS = {
+    'venue_id': lambda rng, ids: rng.choice(ids['venue']),
+    'artist_id': lambda rng, ids: rng.choice(ids['artist']),
+    'entity': lambda rng, ids: 'venues',
+    'format': lambda rng, ids: 'csv',
+}
+
+
+def build_scenarios(app, ids, writes, pattern):
+    from flask import url_for
+    scenarios, skipped = [], []
+    for rule in sorted(app.url_map.iter_rules(), key=lambda rule: rule.rule):
+        method = 'GET' if 'GET' in rule.methods else 'POST'
+        endpoint = rule.endpoint
+        if endpoint in SKIPPED_ENDPOINTS or (
+                endpoint in WRITE_ENDPOINTS and not writes):
+            skipped.append(endpoint)
+            continue
+        if method == 'POST' and endpoint not in FORMS:
+            skipped.append(endpoint)
+            continue
+        name = '{} {}'.format(method, rule.rule)
+        if pattern and not any(fnmatch(name, p) or fnmatch(endpoint, p)
+                               for p in pattern):
+            continue
+
+        def build(rng, rule=rule, endpoint=endpoint):
+            values = dict((arg, URL_ARGS[arg](rng, ids))
+                          for arg in rule.arguments)
+            values.update(QUERY_ARGS.get(endpoint, lambda rng, ids: {})(rng, ids))
+            with app.test_request_context():
+                url = url_for(endpoint, **values)
+            form = FORMS.get(endpoint)
+            return url, form(rng, ids) if form else None
+        scenarios.append(Scenario(name, method, build))
+    return scenarios, skipped
+
+
+def sample_ids(db, models, size=200):
+    ids = {}
+    for key, model in models.items():
+        ids[key] = [row[0] for row in db.session.query(model.id).order_by(
+            db.func.random()).limit(size)]
+        if not ids[key]:
+            raise click.ClickException('no {} rows; run seed.py first'.format(key))
+    return ids
+
+
+def run_benchmark(app, db, scenarios, iterations, rng):
+    from sqlalchemy import event
+    queries = [0]
+
+    def count(*args):
+        queries[0] += 1
+    event.listen(db.engine, 'before_cursor_execute', count)
+    client = app.test_client()
+    results = {}
+    try:
+        for scenario in scenarios:
+            url, data = scenario.request(rng)
+            client.open(url, method=scenario.method, data=data)  # warm up
+            times, counts, statuses = [], [], set()
+            for _ in range(iterations):
+                url, data = scenario.request(rng)
+                queries[0] = 0
+                started = time.perf_counter()
+                response = client.open(url, method=scenario.method, data=data)
+                times.append(time.perf_counter() - started)
+                counts.append(queries[0])
+                statuses.add(response.status_code)
+            # memory is measured apart so tracing does not skew the timings
+            url, data = scenario.request(rng)
+            tracemalloc.start()
+            client.open(url, method=scenario.method, data=data)
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            result = summarize(times)
+            result.update(queries=max(counts), statuses=sorted(statuses),
+                          peak_kb=round(peak / 1024.0, 1))
+            results[scenario.name] = result
+            click.echo('{:<44} p50 {:>8.2f}  p95 {:>8.2f}  p99 {:>8.2f} ms  '
+                       '{:>3} queries  {:>9.1f} KB  {}'.format(
+                           scenario.name[:44], result['p50_ms'],
+                           result['p95_ms'], result['p99_ms'],
+                           result['queries'], result['peak_kb'],
+                           ','.join(str(s) for s in result['statuses'])))
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', count)
+    return results
+
+
+def render_benchmark(app, iterations):
+    # the template alone, with one page of RENDER_SHOWS distinct start times;
+    # the first render fills the filter's cache, like the first visitor.
+    import babel.dates
+    from flask import render_template
+    from app import DATETIME_FORMATS
+    start = datetime.now().replace(second=0, microsecond=0)
+    shows = [{'venue_id': i, 'venue_name': 'Venue {}'.format(i),
+              'artist_id': i, 'artist_name': 'Artist {}'.format(i),
+              'artist_image_link': 'https://example.com/{}.jpg'.format(i),
+              'start_time': start + timedelta(hours=i)}
+             for i in range(RENDER_SHOWS)]
+    patterns = dict((name, pattern.pattern)
+                    for name, pattern in DATETIME_FORMATS.items())
+
+    def babel_filter(value, format='medium'):
+        return babel.dates.format_datetime(value, patterns.get(format, format))
+    filters = app.jinja_env.filters
+    results = {}
+    for name, datetime_filter in ((RENDER_NAME, filters['datetime']),
+                                  (RENDER_NAME + ' (babel)', babel_filter)):
+        filters['datetime'], memoized = datetime_filter, filters['datetime']
+        try:
+            with app.test_request_context('/shows'):
+                times = []
+                for _ in range(iterations + 1):
+                    started = time.perf_counter()
+                    render_template('pages/shows.html', shows=shows,
+                                    next_cursor=None, per_page=None)
+                    times.append(time.perf_counter() - started)
+                tracemalloc.start()
+                render_template('pages/shows.html', shows=shows,
+                                next_cursor=None, per_page=None)
+                peak = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+        finally:
+            filters['datetime'] = memoized
+        result = summarize(times[1:])
+        result.update(queries=0, statuses=[200],
+                      peak_kb=round(peak / 1024.0, 1))
+        results[name] = result
+        click.echo('{:<44} p50 {:>8.2f}  p95 {:>8.2f}  p99 {:>8.2f} ms  '
+                   '{:>9.1f} KB'.format(name[:44], result['p50_ms'],
+                                        result['p95_ms'], result['p99_ms'],
+                                        result['peak_kb']))
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """Lines describing every route that regressed against baseline."""
+    regressions = []
+    for name, result in sorted(results.items()):
+        base = baseline.get(name)
+        if base is None:
+            continue
+        slower = result['p95_ms'] - base['p95_ms']
+        if slower > NOISE_MS and result['p95_ms'] > base['p95_ms'] * (1 + tolerance):
+            regressions.append('{}: p95 {:.2f} ms -> {:.2f} ms'.format(
+                name, base['p95_ms'], result['p95_ms']))
+        if result['queries'] > base['queries']:
+            regressions.append('{}: {} -> {} queries'.format(
+                name, base['queries'], result['queries']))
+        if result['peak_kb'] > base['peak_kb'] * (1 + tolerance) + 64:
+            regressions.append('{}: peak {:.1f} KB -> {:.1f} KB'.format(
+                name, base['peak_kb'], result['peak_kb']))
+    return regressions
+
+
+def over_budget(results):
+    """Lines describing every route slower than its latency budget."""
+    lines = []
+    for name, result in sorted(results.items()):
+        for pattern, budget in sorted(LATENCY_BUDGETS_MS.items()):
+            if fnmatch(name, pattern) and result['p95_ms'] > budget:
+                lines.append('{}: p95 {:.2f} ms, budget {:.0f} ms'.format(
+                    name, result['p95_ms'], budget))
+    return lines
+
+
+def run_load(app, scenarios, concurrency, duration, base_url, seed):
+    # every thread has its own client (or HTTP connection per request) and
+    # picks routes at random until the time is up.
+    from urllib.request import Request, urlopen
+    from urllib.parse import urlencode
+    from urllib.error import HTTPError
+    times, errors, lock = [], [0], threading.Lock()
+    deadline = time.time() + duration
+
+    def worker(number):
+        rng = random.Random(seed + number)
+        client = app.test_client() if base_url is None else None
+        mine, failed = [], 0
+        while time.time() < deadline:
+            scenario = rng.choice(scenarios)
+            url, data = scenario.request(rng)
+            started = time.perf_counter()
+            if client is not None:
+                status = client.open(url, method=scenario.method,
+                                     data=data).status_code
+            else:
+                body = urlencode(data).encode('utf-8') if data else None
+                try:
+                    with urlopen(Request(base_url.rstrip('/') + url, data=body,
+                                         method=scenario.method)) as response:
+                        response.read()
+                        status = response.status
+                except HTTPError as e:
+                    status = e.code
+            mine.append(time.perf_counter() - started)
+            failed += status >= 500
+        with lock:
+            times.extend(mine)
+            errors[0] += failed
+
+    threads = [threading.Thread(target=worker, args=(i,))
+               for i in range(concurrency)]
+    started = time.time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    result = summarize(times)
+    result.update(concurrency=concurrency, errors=errors[0],
+                  rps=round(len(times) / (time.time() - started), 1))
+    return result
+
+
+@click.command()
+@click.option('--database-url', envvar='DATABASE_URL', required=True,
+              help='A database filled by seed.py; defaults to $DATABASE_URL.')
+@click.option('--iterations', type=int, default=30,
+              help='Timed requests per route.')
+@click.option('--route', 'pattern', multiple=True,
+              help='Only routes matching this glob (rule or endpoint).')
+@click.option('--writes', is_flag=True,
+              help='Also create and edit venues, artists and shows.')
+@click.option('--save', type=click.Path(dir_okay=False),
+              help='Write the results as a baseline.')
+@click.option('--compare', 'baseline_path', type=click.Path(dir_okay=False),
+              help='Fail when a route regressed against this baseline.')
+@click.option('--tolerance', type=float, default=0.25,
+              help='Allowed relative slowdown before --compare fails.')
+@click.option('--concurrency', type=int,
+              help='Run the load driver with this many threads instead.')
+@click.option('--duration', type=float, default=10.0,
+              help='Seconds the load driver runs.')
+@click.option('--base-url', help='Drive a running server instead of the '
+              'in-process test client (load driver only).')
+@click.option('--seed', type=int, default=0)
+def main(database_url, iterations, pattern, writes, save, baseline_path,
+         tolerance, concurrency, duration, base_url, seed):
+    """Benchmark or load-test every route of app.py."""
+    # app.py reads its settings from the environment when it is imported;
+    # pages are measured uncached and the home feed is kept apart from the
+    # one of the development database.
+    os.environ['DATABASE_URL'] = database_url
+    os.environ['CACHE_BACKEND'] = 'null'
+    os.environ.setdefault('HOME_FEED_PATH', os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), '.bench-feed.json'))
+    from app import app, db, Venue, Artist
+    app.config['WTF_CSRF_ENABLED'] = False
+    # the per-request form deprecation warnings would bury the results
+    warnings.simplefilter('ignore', DeprecationWarning)
+    rng = random.Random(seed)
+    with app.app_context():
+        ids = sample_ids(db, {'venue': Venue, 'artist': Artist})
+    scenarios, skipped = build_scenarios(app, ids, writes, pattern)
+    if skipped:
+        click.echo('skipped: {}'.format(', '.join(sorted(set(skipped)))))
+    if concurrency:
+        scenarios = [s for s in scenarios if s.method == 'GET' or writes]
+        result = run_load(app, scenarios, concurrency, duration, base_url, seed)
+        click.echo('{concurrency} threads: {rps} requests/s, p50 {p50_ms} ms, '
+                   'p95 {p95_ms} ms, p99 {p99_ms} ms, {errors} errors '
+                   'in {n} requests'.format(**result))
+        return
+    results = run_benchmark(app, db, scenarios, iterations, rng)
+    if not pattern or any(fnmatch(RENDER_NAME, p) for p in pattern):
+        results.update(render_benchmark(app, iterations))
+    if save:
+        with open(save, 'w') as f:
+            json.dump({'created': datetime.now().isoformat(),
+                       'python': platform.python_version(),
+                       'database': db.engine.dialect.name,
+                       'iterations': iterations,
+                       'routes': results}, f, indent=2, sort_keys=True)
+        click.echo('baseline written to {}'.format(save))
+    failures = over_budget(results)
+    for line in failures:
+        click.echo('OVER BUDGET ' + line, err=True)
+    if baseline_path:
+        if not os.path.exists(baseline_path):
+            raise click.ClickException('no baseline at {}; record one on this '
+                                       'machine with --save'.format(baseline_path))
+        with open(baseline_path) as f:
+            baseline = json.load(f)['routes']
+        regressions = compare(results, baseline, tolerance)
+        for line in regressions:
+            click.echo('REGRESSION ' + line, err=True)
+        if not regressions:
+            click.echo('no regressions against {}'.format(baseline_path))
+        failures += regressions
+    if failures:
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,263 @@
+import hashlib
+import os
+import pickle
+import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+
+class MemoryBackend(object):
+    """Per-process LRU store with per-entry expiry.
+
+    Tag versions are per process too, so an invalidation is only seen by
+    the process that made it; see CACHE_BACKEND in config.py.
+    """
+
+    shared = False
+
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        # tag versions are kept apart from the entries so LRU eviction can
+        # never roll a tag back to an older version.
+        self._tags = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires is not None and expires <= time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        expires = time.time() + ttl if ttl else None
+        with self._lock:
+            self._entries[key] = (expires, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._tags.clear()
+
+    def get_tag(self, tag):
+        return self._tags.get(tag)
+
+    def set_tag(self, tag, version):
+        self._tags[tag] = version
+
+
+class FileBackend(object):
+    """Store shared by every process on the host, one file per entry.
+
+    Reads touch the file, so evicting the oldest modification times drops
+    the least recently used entries.
+    """
+
+    shared = True
+
+    def __init__(self, directory, max_entries=1024):
+        self.directory = directory
+        self.max_entries = max_entries
+        self._tag_directory = os.path.join(directory, 'tags')
+        self._writes = 0
+        if not os.path.isdir(self._tag_directory):
+            os.makedirs(self._tag_directory)
+
+    def _path(self, key, directory=None):
+        name = hashlib.sha1(key.encode('utf-8')).hexdigest()
+        return os.path.join(directory or self.directory, name + '.cache')
+
+    def _read(self, path):
+        try:
+            with open(path, 'rb') as f:
+                return pickle.load(f)
+        except (IOError, OSError, EOFError, pickle.UnpicklingError):
+            return None
+
+    def _write(self, path, value):
+        # write to a temporary file and rename over the entry so concurrent
+        # readers never see a half-written file.
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path))
+        with os.fdopen(fd, 'wb') as f:
+            pickle.dump(value, f, pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, path)
+
+    def get(self, key):
+        path = self._path(key)
+        entry = self._read(path)
+        if entry is None:
+            return None
+        expires, value = entry
+        if expires is not None and expires <= time.time():
+            self.delete(key)
+            return None
+        try:
+            os.utime(path, None)
+        except OSError:
+            pass
+        return value
+
+    def set(self, key, value, ttl=None):
+        expires = time.time() + ttl if ttl else None
+        self._write(self._path(key), (expires, value))
+        self._writes += 1
+        if self._writes % 64 == 0:
+            self._evict()
+
+    def delete(self, key):
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
+
+    def clear(self):
+        for directory in (self.directory, self._tag_directory):
+            for name in os.listdir(directory):
+                if name.endswith('.cache'):
+                    try:
+                        os.remove(os.path.join(directory, name))
+                    except OSError:
+                        pass
+
+    def _evict(self):
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith('.cache'):
+                path = os.path.join(self.directory, name)
+                try:
+                    entries.append((os.path.getmtime(path), path))
+                except OSError:
+                    pass
+        entries.sort()
+        for _, path in entries[:max(len(entries) - self.max_entries, 0)]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def get_tag(self, tag):
+        return self._read(self._path(tag, self._tag_directory))
+
+    def set_tag(self, tag, version):
+        self._write(self._path(tag, self._tag_directory), version)
+
+
+class NullBackend(object):
+    """Caches nothing; for tests and for turning the cache off."""
+
+    shared = False
+
+    def get(self, key):
+        return None
+
+    def set(self, key, value, ttl=None):
+        pass
+
+    def delete(self, key):
+        pass
+
+    def clear(self):
+        pass
+
+    def get_tag(self, tag):
+        return None
+
+    def set_tag(self, tag, version):
+        pass
+
+
+class TaggedCache(object):
+    """Cache whose entries are tagged with the entities they were built from.
+
+    Every tag has a version. An entry remembers the versions of its tags
+    when it was stored, and invalidating a tag gives it a new version, so
+    all entries built from the old data miss from then on, in every process
+    sharing the backend.
+    """
+
+    def __init__(self, backend, default_ttl=60):
+        self.backend = backend
+        self.default_ttl = default_ttl
+
+    def get(self, key):
+        entry = self.backend.get(key)
+        if entry is None:
+            return None
+        value, versions = entry
+        for tag, version in versions.items():
+            if self.backend.get_tag(tag) != version:
+                self.backend.delete(key)
+                return None
+        return value
+
+    @property
+    def shared(self):
+        """Whether other processes see the tags invalidated by this one."""
+        return self.backend.shared
+
+    def versions(self, tags):
+        return dict((tag, self.backend.get_tag(tag)) for tag in tags)
+
+    def set(self, key, value, tags=(), ttl=None, versions=None):
+        """Store value under key, tagged with tags.
+
+        versions, from versions(), should be read before the data behind
+        value was queried; a tag invalidated in between then makes the new
+        entry miss instead of serving what was read before the write.
+        """
+        versions = dict(versions or {})
+        versions.update(self.versions(tag for tag in tags if tag not in versions))
+        self.backend.set(key, (value, versions),
+                         self.default_ttl if ttl is None else ttl)
+
+    def invalidate(self, *tags):
+        # a version starts with the time it was made, for changed_within()
+        for tag in tags:
+            self.backend.set_tag(tag, '{:.3f}:{}'.format(time.time(),
+                                                         uuid.uuid4().hex))
+
+    @staticmethod
+    def changed_within(versions, seconds):
+        """Whether a tag of versions, from versions(), was invalidated in
+        the last seconds."""
+        cutoff = time.time() - seconds
+        for version in versions.values():
+            try:
+                if version is not None and float(version.split(':')[0]) > cutoff:
+                    return True
+            except ValueError:
+                # a version from before they carried their time
+                pass
+        return False
+
+    def clear(self):
+        self.backend.clear()
+
+
+def create_cache(config):
+    backend = config.get('CACHE_BACKEND', 'memory')
+    max_entries = config.get('CACHE_MAX_ENTRIES', 1024)
+    if backend == 'memory':
+        store = MemoryBackend(max_entries)
+    elif backend == 'file':
+        store = FileBackend(config['CACHE_DIR'], max_entries)
+    elif backend == 'null':
+        store = NullBackend()
+    else:
+        raise ValueError('unknown CACHE_BACKEND {!r}'.format(backend))
+    return TaggedCache(store, config.get('CACHE_DEFAULT_TTL', 60))
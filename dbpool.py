@@ -0,0 +1,168 @@
+import threading
+import time
+
+from sqlalchemy import event
+from sqlalchemy.engine.url import make_url
+from sqlalchemy.pool import QueuePool
+from sqlalchemy.exc import TimeoutError
+
+
+class WaitStats(object):
+    """How long checkouts waited for a connection."""
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.timeouts = 0
+        self._lock = threading.Lock()
+
+    def record(self, seconds, timed_out=False):
+        with self._lock:
+            self.count += 1
+            self.total += seconds
+            self.max = max(self.max, seconds)
+            if timed_out:
+                self.timeouts += 1
+
+    def as_dict(self):
+        with self._lock:
+            return {
+                'count': self.count,
+                'total_ms': round(self.total * 1000, 3),
+                'avg_ms': round(self.total * 1000 / self.count, 3)
+                if self.count else 0.0,
+                'max_ms': round(self.max * 1000, 3),
+                'timeouts': self.timeouts,
+            }
+
+
+class TimedQueuePool(QueuePool):
+    """QueuePool that times how long each checkout waits for a connection.
+
+    The wait is spent in _do_get, where a full pool blocks until a
+    connection is returned or pool_timeout passes; no pool event covers it.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super(TimedQueuePool, self).__init__(*args, **kwargs)
+        self.waits = WaitStats()
+
+    def _do_get(self):
+        start = time.time()
+        try:
+            connection = super(TimedQueuePool, self)._do_get()
+        except TimeoutError:
+            self.waits.record(time.time() - start, timed_out=True)
+            raise
+        self.waits.record(time.time() - start)
+        return connection
+
+    def recreate(self):
+        # engine.dispose() swaps in a new pool; keep counting into the
+        # same stats.
+        pool = super(TimedQueuePool, self).recreate()
+        pool.waits = self.waits
+        return pool
+
+
+def engine_options(config):
+    """create_engine() options for the database URI from the DB_* settings.
+
+    Explicit SQLALCHEMY_ENGINE_OPTIONS in the config take precedence.
+    """
+    url = make_url(config['SQLALCHEMY_DATABASE_URI'])
+    backend = url.get_backend_name()
+    options = {}
+    if backend != 'sqlite' or url.database not in (None, '', ':memory:'):
+        # an in-memory SQLite database lives in its single connection and
+        # keeps Flask-SQLAlchemy's StaticPool.
+        options.update(
+            poolclass=TimedQueuePool,
+            pool_size=config['DB_POOL_SIZE'],
+            max_overflow=config['DB_MAX_OVERFLOW'],
+            pool_timeout=config['DB_POOL_TIMEOUT'],
+            pool_recycle=config['DB_POOL_RECYCLE'],
+            pool_pre_ping=config['DB_POOL_PRE_PING'],
+        )
+    timeout = config.get('DB_STATEMENT_TIMEOUT')
+    if backend == 'postgresql' and timeout:
+        options['connect_args'] = {
+            'options': '-c statement_timeout={:d}'.format(timeout)}
+    elif backend == 'sqlite' and 'poolclass' in options:
+        # pooled connections move between request threads
+        options['connect_args'] = {'check_same_thread': False}
+    options.update(config.get('SQLALCHEMY_ENGINE_OPTIONS') or {})
+    return options
+
+
+class PoolMonitor(object):
+    """Connection pool metrics collected through SQLAlchemy pool events."""
+
+    def __init__(self):
+        self._engines = []
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.checkins = 0
+        self.connects = 0
+        self.invalidations = 0
+        self.checked_out = 0
+        self.peak_checked_out = 0
+
+    def watch(self, engine):
+        with self._lock:
+            if engine in self._engines:
+                return
+            self._engines.append(engine)
+        event.listen(engine, 'connect', self._on_connect)
+        event.listen(engine, 'checkout', self._on_checkout)
+        event.listen(engine, 'checkin', self._on_checkin)
+        event.listen(engine, 'invalidate', self._on_invalidate)
+
+    def _on_connect(self, dbapi_connection, connection_record):
+        with self._lock:
+            self.connects += 1
+
+    def _on_checkout(self, dbapi_connection, connection_record, connection_proxy):
+        with self._lock:
+            self.checkouts += 1
+            self.checked_out += 1
+            self.peak_checked_out = max(self.peak_checked_out, self.checked_out)
+
+    def _on_checkin(self, dbapi_connection, connection_record):
+        with self._lock:
+            self.checkins += 1
+            self.checked_out = max(self.checked_out - 1, 0)
+
+    def _on_invalidate(self, dbapi_connection, connection_record, exception):
+        with self._lock:
+            self.invalidations += 1
+
+    def stats(self):
+        with self._lock:
+            data = {
+                'checked_out': self.checked_out,
+                'peak_checked_out': self.peak_checked_out,
+                'checkouts': self.checkouts,
+                'checkins': self.checkins,
+                'connects': self.connects,
+                'invalidations': self.invalidations,
+            }
+            engines = list(self._engines)
+        pools = []
+        for engine in engines:
+            pool = engine.pool
+            info = {'url': repr(engine.url), 'class': type(pool).__name__,
+                    'status': pool.status()}
+            if isinstance(pool, QueuePool):
+                info.update(size=pool.size(), idle=pool.checkedin(),
+                            checked_out=pool.checkedout(),
+                            overflow=max(pool.overflow(), 0),
+                            max_overflow=pool._max_overflow,
+                            timeout=pool.timeout())
+            waits = getattr(pool, 'waits', None)
+            if waits is not None:
+                info['wait'] = waits.as_dict()
+            pools.append(info)
+        data['pools'] = pools
+        return data
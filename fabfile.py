@@ -1,3 +1,4 @@
+import os
 from fabric.api import local, settings, abort
 from fabric.contrib.console import confirm
 
@@ -5,9 +6,19 @@ from fabric.contrib.console import confirm
 
 
 def test():
+    # runs the test suite, then seeds a small dataset and fails when a route
+    # got slower or runs more queries than recorded in bench_baseline.json
+    # (python bench.py --save). the baseline is machine-specific and not
+    # committed; without one the routes are only held to their latency
+    # budgets.
+    compare = "--compare bench_baseline.json" if os.path.exists(
+        "bench_baseline.json") else ""
     with settings(warn_only=True):
         result = local(
-            "python test_tasks.py -v && python test_users.py -v", capture=True
+            "python -m pytest tests/ && "
+            "python seed.py --database-url sqlite:///bench.db --reset && "
+            "python bench.py --database-url sqlite:///bench.db " + compare,
+            capture=True
         )
     if result.failed and not confirm("Tests failed. Continue?"):
         abort("Aborted at user request.")
@@ -38,18 +49,25 @@ def heroku():
     local("git push heroku master")
 
 
+def heroku_worker():
+    # the Procfile's worker runs the queued jobs; heroku starts only the web
+    # process of a new app, so the worker is scaled up explicitly.
+    local("heroku ps:scale worker=1")
+
+
 def heroku_test():
-    local(
-        "heroku run python test_tasks.py -v && heroku run python test_users.py -v"
-    )
+    # the suite on a one-off dyno; pytest is not among the app's
+    # requirements, so it is installed there first.
+    local('heroku run "pip install pytest && python -m pytest tests/"')
 
 
 def deploy():
+    # test() has run the suite before anything is pushed
     pull()
     test()
     commit()
     heroku()
-    heroku_test()
+    heroku_worker()
 
 # rollback
 
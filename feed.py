@@ -0,0 +1,183 @@
+import json
+import os
+import tempfile
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+
+try:
+    import fcntl
+except ImportError:  # Windows, where only one process may serve the feed
+    fcntl = None
+
+
+class HomeFeed(object):
+    """Recent venues and artists and the next upcoming shows, kept in memory.
+
+    load(size, shows) builds the feed from the database: the size newest
+    venues and artists and the next shows upcoming shows, plus whether
+    more upcoming shows exist. Afterwards the jobs of the views keep it
+    current and it is only rebuilt when it runs short, or, when version is
+    given, when the database moved on without it: load() stores a token of
+    the rows the feed was read from under 'version', read before them, and
+    version(data) reads that token as it is now. get() rebuilds a feed
+    whose token differs, so writes whose jobs have not run, or never will
+    without a worker, still show. Every change is also written to a
+    small JSON file, which a restarted process reads instead of querying
+    and which tells each process when another one changed the feed. Every
+    change is read, made and written under an flock on path + '.lock', so
+    processes sharing the file do not undo each other's changes.
+    """
+
+    def __init__(self, path, load, size=10, version=None):
+        self.path = path
+        self.size = size
+        self._load = load
+        self._version = version
+        self._data = None
+        self._mtime = None
+        self._lock = threading.RLock()
+
+    def get(self, now):
+        """(venues, artists, shows) to render, shows starting after now."""
+        with self._lock:
+            data = self._current()
+            if self._version is not None and \
+                    data.get('version') != self._version(data):
+                data = self._rebuild()
+            shows = [show for show in data['shows'] if show['start_time'] > now]
+            if len(shows) < self.size and data['more_shows']:
+                data = self._rebuild()
+                shows = [show for show in data['shows']
+                         if show['start_time'] > now]
+            return (data['venues'][:self.size], data['artists'][:self.size],
+                    shows[:self.size])
+
+    def entity_changed(self, section, item):
+        """A venue or artist item (id, name, image_link) was created or edited."""
+        with self._locked():
+            data = self._current()
+            entities = data[section]
+            for i, entity in enumerate(entities):
+                if entity['id'] == item['id']:
+                    entities[i] = item
+                    break
+            else:
+                if len(entities) < self.size or item['id'] > entities[-1]['id']:
+                    entities.append(item)
+                    entities.sort(key=lambda entity: -entity['id'])
+                    del entities[self.size:]
+            prefix = section[:-1] + '_'
+            for show in data['shows']:
+                if show[prefix + 'id'] == item['id']:
+                    show[prefix + 'name'] = item['name']
+                    show[prefix + 'image_link'] = item['image_link']
+            self._save(self._stamped(data))
+
+    def entity_removed(self, section, entity_id):
+        with self._locked():
+            data = self._current()
+            if any(entity['id'] == entity_id for entity in data[section]):
+                # the next newest one has to be read back in
+                self._rebuild()
+                return
+            key = section[:-1] + '_id'
+            data['shows'] = [show for show in data['shows']
+                             if show[key] != entity_id]
+            self._save(self._stamped(data))
+
+    def show_added(self, show):
+        with self._locked():
+            data = self._current()
+            shows = data['shows']
+            if any(known['id'] == show['id'] for known in shows):
+                return
+            if (not data['more_shows'] or not shows or
+                    show['start_time'] < shows[-1]['start_time']):
+                shows.append(show)
+                shows.sort(key=lambda show: (show['start_time'], show['id']))
+                if len(shows) > 2 * self.size:
+                    del shows[2 * self.size:]
+                    data['more_shows'] = True
+            # a later show is left out, but the feed still matches
+            self._save(self._stamped(data))
+
+    def invalidate(self):
+        """Rebuild from the database, e.g. after a bulk import."""
+        with self._locked():
+            self._rebuild()
+
+    @contextmanager
+    def _locked(self):
+        with self._lock:
+            lock = None
+            if fcntl is not None:
+                try:
+                    lock = open(self.path + '.lock', 'a')
+                    fcntl.flock(lock, fcntl.LOCK_EX)
+                except (IOError, OSError):
+                    # like the file itself, the lock is best effort
+                    if lock is not None:
+                        lock.close()
+                    lock = None
+            try:
+                yield
+            finally:
+                if lock is not None:
+                    lock.close()
+
+    def _current(self):
+        mtime = self._file_mtime()
+        if self._data is not None and mtime == self._mtime:
+            return self._data
+        data = self._read() if mtime is not None else None
+        if data is None:
+            return self._rebuild()
+        self._data, self._mtime = data, mtime
+        return data
+
+    def _stamped(self, data):
+        # a change made by a job brings the feed up to date with the write
+        # the job was queued for; the jobs of any other writes follow.
+        if self._version is not None:
+            data['version'] = self._version(data)
+        return data
+
+    def _rebuild(self):
+        data = self._load(self.size, 2 * self.size)
+        self._save(data)
+        return data
+
+    def _file_mtime(self):
+        # every save renames a new file into place, so the inode tells
+        # writes apart even where mtimes are coarse.
+        try:
+            stat = os.stat(self.path)
+            return stat.st_ino, stat.st_mtime_ns
+        except OSError:
+            return None
+
+    def _read(self):
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+            for show in data['shows']:
+                show['start_time'] = datetime.strptime(show['start_time'],
+                                                       '%Y-%m-%dT%H:%M:%S.%f')
+            return data
+        except (IOError, OSError, ValueError, KeyError, TypeError):
+            return None
+
+    def _save(self, data):
+        self._data = data
+        shows = [dict(show, start_time=show['start_time'].strftime(
+            '%Y-%m-%dT%H:%M:%S.%f')) for show in data['shows']]
+        try:
+            fd, tmp = tempfile.mkstemp(dir=os.path.dirname(self.path) or '.')
+            with os.fdopen(fd, 'w') as f:
+                json.dump(dict(data, shows=shows), f)
+            os.replace(tmp, self.path)
+            self._mtime = self._file_mtime()
+        except (IOError, OSError):
+            # the in-memory feed still works without its copy on disk
+            self._mtime = None
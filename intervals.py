@@ -0,0 +1,202 @@
+import random
+import threading
+from collections import OrderedDict
+
+
+class _Node(object):
+    __slots__ = ('item', 'priority', 'left', 'right', 'max_end')
+
+    def __init__(self, item):
+        self.item = item
+        self.priority = random.random()
+        self.left = self.right = None
+        self.max_end = item[1]
+
+
+def _max_end(node):
+    return node.max_end if node is not None else None
+
+
+def _update(node):
+    node.max_end = max(end for end in (node.item[1], _max_end(node.left),
+                                       _max_end(node.right)) if end is not None)
+    return node
+
+
+def _rotate_right(node):
+    left = node.left
+    node.left, left.right = left.right, node
+    _update(node)
+    return _update(left)
+
+
+def _rotate_left(node):
+    right = node.right
+    node.right, right.left = right.left, node
+    _update(node)
+    return _update(right)
+
+
+def _insert(node, new):
+    if node is None:
+        return new
+    if new.item < node.item:
+        node.left = _insert(node.left, new)
+        if node.left.priority > node.priority:
+            node = _rotate_right(node)
+    else:
+        node.right = _insert(node.right, new)
+        if node.right.priority > node.priority:
+            node = _rotate_left(node)
+    return _update(node)
+
+
+def _merge(left, right):
+    if left is None or right is None:
+        return left if left is not None else right
+    if left.priority > right.priority:
+        left.right = _merge(left.right, right)
+        return _update(left)
+    right.left = _merge(left, right.left)
+    return _update(right)
+
+
+def _remove(node, item, removed):
+    if node is None:
+        return None
+    if item == node.item:
+        removed.append(node)
+        return _merge(node.left, node.right)
+    if item < node.item:
+        node.left = _remove(node.left, item, removed)
+    else:
+        node.right = _remove(node.right, item, removed)
+    return _update(node)
+
+
+class IntervalTree(object):
+    """Half-open [start, end) intervals, each with a key.
+
+    A treap ordered by start and augmented with the largest end of every
+    subtree, so an overlap query only descends into subtrees that can
+    still hold an overlapping interval: O(log n + hits) expected.
+    """
+
+    def __init__(self, intervals=()):
+        self._root = None
+        self._size = 0
+        for start, end, key in intervals:
+            self.add(start, end, key)
+
+    def __len__(self):
+        return self._size
+
+    def add(self, start, end, key):
+        self._root = _insert(self._root, _Node((start, end, key)))
+        self._size += 1
+
+    def remove(self, start, end, key):
+        removed = []
+        self._root = _remove(self._root, (start, end, key), removed)
+        self._size -= len(removed)
+        return bool(removed)
+
+    def __iter__(self):
+        stack, node = [], self._root
+        while stack or node is not None:
+            while node is not None:
+                stack.append(node)
+                node = node.left
+            node = stack.pop()
+            yield node.item
+            node = node.right
+
+    def overlapping(self, start, end):
+        """(start, end, key) of every interval overlapping [start, end)."""
+        hits = []
+        stack = [self._root]
+        while stack:
+            node = stack.pop()
+            if node is None or node.max_end <= start:
+                continue
+            stack.append(node.left)
+            if node.item[0] < end:
+                if node.item[1] > start:
+                    hits.append(node.item)
+                stack.append(node.right)
+        return sorted(hits)
+
+
+class BookingCalendar(object):
+    """Bookings of venues and artists, one IntervalTree per resource.
+
+    A resource is a (kind, id) pair. Its tree is loaded through loader the
+    first time it is asked about and kept while it is among the
+    max_resources most recently used. Callers hold lock across checking
+    for conflicts, committing the show and adding it here.
+
+    The trees only see this process's writes, so they are a pre-filter:
+    version(resource), when given, returns a token that changes whenever
+    another process books or frees the resource, and a tree loaded under an
+    older token is reloaded; confirm(resource, bookings), when given,
+    returns those of the overlapping bookings that still stand, and the
+    others are dropped from the tree instead of being reported.
+    """
+
+    def __init__(self, loader, max_resources=10000, version=None, confirm=None):
+        self.lock = threading.RLock()
+        self._loader = loader
+        self._max_resources = max_resources
+        self._version = version
+        self._confirm = confirm
+        self._trees = OrderedDict()
+
+    def _tree(self, resource):
+        # the version is read before the load, so a write in between makes
+        # the next call reload again rather than keep the older shows.
+        version = self._version(resource) if self._version else None
+        entry = self._trees.get(resource)
+        if entry is None or entry[0] != version:
+            entry = self._trees[resource] = (
+                version, IntervalTree(self._loader(resource)))
+            while len(self._trees) > self._max_resources:
+                self._trees.popitem(last=False)
+        else:
+            self._trees.move_to_end(resource)
+        return entry[1]
+
+    def conflicts(self, resources, start, end):
+        """(resource, start, end, key) of every booking overlapping [start, end)."""
+        with self.lock:
+            found = []
+            for resource in resources:
+                tree = self._tree(resource)
+                hits = tree.overlapping(start, end)
+                if hits and self._confirm is not None:
+                    standing = set(self._confirm(resource, hits))
+                    for hit in hits:
+                        if hit not in standing:
+                            tree.remove(*hit)
+                    hits = [hit for hit in hits if hit in standing]
+                found.extend((resource,) + booking for booking in hits)
+            return found
+
+    def add(self, resources, start, end, key):
+        with self.lock:
+            for resource in resources:
+                if resource in self._trees:
+                    self._trees[resource][1].add(start, end, key)
+
+    def remove(self, resources, start, end, key):
+        with self.lock:
+            for resource in resources:
+                if resource in self._trees:
+                    self._trees[resource][1].remove(start, end, key)
+
+    def forget(self, resource=None):
+        """Drop one resource, or all of them, to be reloaded when needed."""
+        with self.lock:
+            if resource is None:
+                self._trees.clear()
+            else:
+                self._trees.pop(resource, None)
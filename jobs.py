@@ -0,0 +1,276 @@
+import json
+import multiprocessing
+import os
+import signal
+import socket
+import threading
+import traceback
+from datetime import datetime, timedelta
+
+from flask import g, has_request_context
+from sqlalchemy import and_, func, or_, select
+from sqlalchemy.dialects import postgresql
+
+
+class JobQueue(object):
+    """Background jobs stored in a database table.
+
+    enqueue() adds a job to the caller's session, so it is committed, or
+    rolled back, together with the change it derives from. Workers claim
+    due jobs with SELECT ... FOR UPDATE SKIP LOCKED and a conditional
+    UPDATE, so a job is handed to one worker at a time even where SKIP
+    LOCKED is not supported. A failing job is retried with exponential
+    backoff until JOB_MAX_ATTEMPTS, and a job whose worker died is taken
+    over once its JOB_LEASE has passed. Jobs run at least once, so
+    handlers must be idempotent.
+
+    With JOBS_EAGER set, the jobs a request enqueued, and only those, are
+    run at the end of that request instead, for development without
+    `flask worker`.
+    """
+
+    def __init__(self, table, session, app=None):
+        self.table = table
+        self.session = session
+        self.handlers = {}
+        self.app = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        app.config.setdefault('JOBS_EAGER', False)
+        app.config.setdefault('JOB_MAX_ATTEMPTS', 5)
+        app.config.setdefault('JOB_RETRY_BACKOFF', 10)
+        app.config.setdefault('JOB_LEASE', 300)
+        app.config.setdefault('JOB_POLL_INTERVAL', 1.0)
+        app.config.setdefault('JOB_RETENTION', 7 * 24 * 3600)
+        app.after_request(self._run_eager)
+
+    def task(self, name):
+        """Registers a handler, called with the job's payload dict."""
+        def decorator(handler):
+            self.handlers[name] = handler
+            return handler
+        return decorator
+
+    def enqueue(self, name, payload=None, key=None, delay=0, eager=True):
+        """Adds a job to the current transaction.
+
+        A job whose key is already in the table, whether pending or
+        finished, is not added again; keys are kept for JOB_RETENTION.
+        eager=False leaves the job to a worker even with JOBS_EAGER, for
+        jobs too slow to hold up a request, like remote fetches.
+        """
+        if name not in self.handlers:
+            raise ValueError('no job handler named {!r}'.format(name))
+        values = {
+            'name': name,
+            'payload': json.dumps(payload or {}, sort_keys=True),
+            'idempotency_key': key,
+            'status': 'queued',
+            'attempts': 0,
+            'max_attempts': self.app.config['JOB_MAX_ATTEMPTS'],
+            'run_at': datetime.utcnow() + timedelta(seconds=delay),
+            'created_at': datetime.utcnow(),
+        }
+        dialect = self.session.get_bind().dialect.name
+        if key is None:
+            statement = self.table.insert()
+        elif dialect == 'postgresql':
+            statement = postgresql.insert(self.table).on_conflict_do_nothing(
+                index_elements=['idempotency_key'])
+        elif dialect == 'sqlite':
+            statement = self.table.insert().prefix_with('OR IGNORE')
+        else:
+            exists = self.session.execute(select([self.table.c.id]).where(
+                self.table.c.idempotency_key == key)).first()
+            if exists is not None:
+                return
+            statement = self.table.insert()
+        result = self.session.execute(statement.values(values))
+        if eager and has_request_context() and result.rowcount == 1:
+            g.setdefault('jobs_enqueued', []).append(
+                result.inserted_primary_key[0])
+
+    def _due(self, now):
+        t = self.table
+        lease = timedelta(seconds=self.app.config['JOB_LEASE'])
+        return or_(and_(t.c.status == 'queued', t.c.run_at <= now),
+                   and_(t.c.status == 'running', t.c.locked_at < now - lease))
+
+    def claim(self, worker, limit=1, ids=None):
+        """Marks up to limit due jobs, of ids when given, as running for
+        worker and returns them."""
+        t = self.table
+        now = datetime.utcnow()
+        due = self._due(now)
+        if ids is not None:
+            due = and_(due, t.c.id.in_(ids))
+        ids = [row[0] for row in self.session.execute(
+            select([t.c.id]).where(due).order_by(t.c.run_at, t.c.id)
+            .limit(limit).with_for_update(skip_locked=True))]
+        claimed = []
+        for job_id in ids:
+            # the row may have been claimed since it was read where the
+            # database does not lock it; only one UPDATE can still match.
+            result = self.session.execute(t.update().where(
+                and_(t.c.id == job_id, due)).values(
+                    status='running', locked_by=worker, locked_at=now,
+                    attempts=t.c.attempts + 1))
+            if result.rowcount == 1:
+                claimed.append(job_id)
+        rows = self.session.execute(select([t]).where(
+            t.c.id.in_(claimed)).order_by(t.c.run_at, t.c.id)).fetchall() \
+            if claimed else []
+        self.session.commit()
+        return rows
+
+    def run(self, job, worker):
+        """Runs one claimed job and records how it went."""
+        t = self.table
+        handler = self.handlers.get(job.name)
+        try:
+            if handler is None:
+                raise LookupError('no job handler named {!r}'.format(job.name))
+            handler(json.loads(job.payload))
+            self.session.commit()
+        except Exception:
+            self.session.rollback()
+            error = traceback.format_exc()
+            if job.attempts >= job.max_attempts:
+                values = {'status': 'failed', 'finished_at': datetime.utcnow()}
+                self.app.logger.error('job %s %s failed for good after %d '
+                                      'attempts', job.id, job.name, job.attempts)
+            else:
+                backoff = self.app.config['JOB_RETRY_BACKOFF'] * 2 ** (job.attempts - 1)
+                values = {'status': 'queued', 'run_at': datetime.utcnow() +
+                          timedelta(seconds=backoff)}
+                self.app.logger.warning('job %s %s failed, retrying in %ds',
+                                        job.id, job.name, backoff)
+            values.update(last_error=error[-4000:], locked_by=None,
+                          locked_at=None)
+            ok = False
+        else:
+            values = {'status': 'done', 'finished_at': datetime.utcnow(),
+                      'locked_by': None, 'locked_at': None}
+            ok = True
+        # a worker that overran its lease no longer owns the job.
+        self.session.execute(t.update().where(and_(
+            t.c.id == job.id, t.c.locked_by == worker)).values(values))
+        self.session.commit()
+        return ok
+
+    def run_next(self, worker):
+        """Claims and runs one due job; False when none was due."""
+        jobs = self.claim(worker)
+        for job in jobs:
+            self.run(job, worker)
+        return bool(jobs)
+
+    def run_due(self, worker=None, limit=None):
+        """Runs due jobs in this thread until none is left (or limit ran)."""
+        worker = worker or worker_name()
+        ran = 0
+        while limit is None or ran < limit:
+            if not self.run_next(worker):
+                break
+            ran += 1
+        return ran
+
+    def _run_eager(self, response):
+        # jobs of a rolled back transaction are gone, and delayed ones are
+        # not due yet; both are left out by claim().
+        ids = g.pop('jobs_enqueued', None)
+        if self.app.config['JOBS_EAGER'] and ids:
+            worker = worker_name()
+            for job in self.claim(worker, len(ids), ids):
+                self.run(job, worker)
+        return response
+
+    def prune(self, now=None):
+        """Deletes jobs finished longer than JOB_RETENTION ago."""
+        now = now or datetime.utcnow()
+        cutoff = now - timedelta(seconds=self.app.config['JOB_RETENTION'])
+        result = self.session.execute(self.table.delete().where(and_(
+            self.table.c.status.in_(['done', 'failed']),
+            self.table.c.finished_at < cutoff)))
+        self.session.commit()
+        return result.rowcount
+
+    def counts(self):
+        """Number of jobs in each status."""
+        t = self.table
+        return dict(self.session.execute(select([t.c.status, func.count()])
+                                         .group_by(t.c.status)).fetchall())
+
+    def work(self, stop, burst=False):
+        """One worker thread: runs jobs until stop is set, or, with burst,
+        until no job is due."""
+        worker = worker_name()
+        interval = self.app.config['JOB_POLL_INTERVAL']
+        while not stop.is_set():
+            try:
+                with self.app.app_context():
+                    ran = self.run_next(worker)
+            except Exception:
+                # e.g. the database went away; try again after a pause
+                self.app.logger.exception('worker %s could not claim a job',
+                                          worker)
+                ran = False
+            if not ran:
+                if burst:
+                    return
+                stop.wait(interval)
+
+    def serve(self, threads=1, burst=False):
+        """Runs threads workers in this process until SIGINT/SIGTERM."""
+        stop = threading.Event()
+
+        def shutdown(signum, frame):
+            stop.set()
+        if threading.current_thread() is threading.main_thread():
+            signal.signal(signal.SIGTERM, shutdown)
+            signal.signal(signal.SIGINT, shutdown)
+        workers = [threading.Thread(target=self.work, args=(stop, burst),
+                                    name='job-worker-{}'.format(i))
+                   for i in range(threads)]
+        for worker in workers:
+            worker.start()
+        pruned = datetime.utcnow()
+        while any(worker.is_alive() for worker in workers):
+            stop.wait(1.0)
+            if datetime.utcnow() - pruned > timedelta(minutes=10):
+                with self.app.app_context():
+                    self.prune()
+                pruned = datetime.utcnow()
+        for worker in workers:
+            worker.join()
+
+    def serve_processes(self, processes, threads=1, burst=False):
+        """Forks processes workers, each with threads worker threads."""
+        if processes <= 1:
+            return self.serve(threads, burst)
+        # connections must not be shared with the children
+        with self.app.app_context():
+            self.session.remove()
+            self.session.get_bind().dispose()
+        children = [multiprocessing.Process(target=self.serve,
+                                            args=(threads, burst))
+                    for _ in range(processes)]
+        for child in children:
+            child.start()
+
+        def shutdown(signum, frame):
+            for child in children:
+                if child.is_alive():
+                    os.kill(child.pid, signal.SIGTERM)
+        signal.signal(signal.SIGTERM, shutdown)
+        signal.signal(signal.SIGINT, shutdown)
+        for child in children:
+            child.join()
+
+
+def worker_name():
+    return '{}:{}:{}'.format(socket.gethostname(), os.getpid(),
+                             threading.current_thread().name)
@@ -0,0 +1,244 @@
+import http.client
+import io
+import ipaddress
+import os
+import re
+import socket
+from urllib.parse import urlsplit
+from urllib.request import (HTTPHandler, HTTPRedirectHandler, HTTPSHandler,
+                            ProxyHandler, Request, build_opener)
+
+try:
+    from fontTools import subset as font_subset
+    from fontTools.ttLib import TTFont
+except ImportError:  # optional: pages keep the remote icon kit without it
+    TTFont = None
+
+try:
+    from PIL import Image, ImageOps, features
+except ImportError:  # optional: images are linked as they are without it
+    Image = None
+
+_ICON = re.compile(r'\bfa-([a-z0-9-]+)')
+# fa- classes that style an icon rather than name one.
+ICON_MODIFIERS = frozenset([
+    'lg', '2x', '3x', '4x', '5x', 'fw', 'ul', 'li', 'border', 'spin', 'pulse',
+    'rotate-90', 'rotate-180', 'rotate-270', 'flip-horizontal',
+    'flip-vertical', 'stack', 'stack-1x', 'stack-2x', 'inverse',
+    'pull-left', 'pull-right',
+])
+# the templates use FontAwesome 5 names; the vendored font is 4.1, whose
+# glyphs are named like quote_left. these are the ones that differ beyond
+# - and _. 4.1 has no moon, so adjust, a half-filled circle, stands in.
+ICON_ALIASES = {
+    'users': 'group',
+    'globe-americas': 'globe',
+    'phone-alt': 'phone',
+    'facebook-f': 'facebook',
+    'moon': 'adjust',
+}
+
+# best first; Pillow writes AVIF and WebP only when built with them. the
+# last field is added to the quality asked for: AVIF at 55 looks about like
+# JPEG or WebP at 75.
+IMAGE_FORMATS = (
+    ('avif', 'AVIF', 'image/avif', -20),
+    ('webp', 'WEBP', 'image/webp', 0),
+    ('jpg', 'JPEG', 'image/jpeg', 0),
+)
+
+
+def icon_names(paths):
+    """Icon names of the fa- classes used in the files at paths."""
+    names = set()
+    for path in paths:
+        with open(path, encoding='utf-8') as f:
+            names.update(_ICON.findall(f.read()))
+    return sorted(names - ICON_MODIFIERS)
+
+
+def subset_icon_font(font_path, names):
+    """(codepoints by icon name, names without a glyph, {flavor: font bytes})
+    of the font cut down to the glyphs of names. woff2 is only written when
+    brotli is installed."""
+    font = TTFont(font_path)
+    codepoints = dict((glyph, codepoint) for codepoint, glyph
+                      in font.getBestCmap().items())
+    found, missing = {}, []
+    for name in names:
+        glyph = ICON_ALIASES.get(name, name.replace('-', '_'))
+        if glyph in codepoints:
+            found[name] = codepoints[glyph]
+        else:
+            missing.append(name)
+    fonts = {}
+    for flavor in ('woff2', 'woff'):
+        options = font_subset.Options()
+        options.flavor = flavor
+        options.layout_features = []
+        options.notdef_outline = True
+        # FontForge's own tables, which fontTools cannot subset
+        options.drop_tables += ['FFTM', 'webf']
+        subsetter = font_subset.Subsetter(options)
+        subsetter.populate(unicodes=sorted(set(found.values())))
+        font = TTFont(font_path)
+        subsetter.subset(font)
+        buffer = io.BytesIO()
+        try:
+            font_subset.save_font(font, buffer, options)
+        except ImportError:
+            continue
+        fonts[flavor] = buffer.getvalue()
+    return found, missing, fonts
+
+
+def icon_css(fonts, codepoints):
+    """Stylesheet for the fa- classes of codepoints in the subset fonts,
+    given as (flavor, url) pairs."""
+    rules = [
+        '@font-face{font-family:"FontAwesome";src:' + ','.join(
+            'url({}) format("{}")'.format(url, flavor) for flavor, url in fonts) +
+        ';font-weight:normal;font-style:normal;font-display:block}',
+        '.fa,.fas,.far,.fab{display:inline-block;font:normal normal normal '
+        '14px/1 FontAwesome;font-size:inherit;text-rendering:auto;'
+        '-webkit-font-smoothing:antialiased;-moz-osx-font-smoothing:grayscale}',
+    ]
+    rules.extend('.fa-{}:before{{content:"\\{:x}"}}'.format(name, codepoint)
+                 for name, codepoint in sorted(codepoints.items()))
+    return '\n'.join(rules) + '\n'
+
+
+def image_formats():
+    """(extension, Pillow format, mimetype, quality offset) Pillow can write
+    here, best first."""
+    if Image is None:
+        return []
+    return [entry for entry in IMAGE_FORMATS
+            if entry[1] == 'JPEG' or features.check(entry[0])]
+
+
+def image_variants(data, widths, quality=75):
+    """(width, height, [(extension, mimetype, width, bytes)]) of the image in
+    data resized to each of widths it is wider than, in every format of
+    image_formats(). An image narrower than all of widths keeps its size."""
+    image = ImageOps.exif_transpose(Image.open(io.BytesIO(data)))
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if 'A' in image.getbands() or
+                              'transparency' in image.info else 'RGB')
+    width, height = image.size
+    sizes = sorted(set(w for w in widths if w < width)) or [width]
+    variants = []
+    for size in sizes:
+        resized = image if size == width else image.resize(
+            (size, max(1, round(height * size / width))), Image.LANCZOS)
+        for extension, format, mimetype, offset in image_formats():
+            frame = resized
+            if format == 'JPEG' and frame.mode == 'RGBA':
+                frame = Image.new('RGB', frame.size, (255, 255, 255))
+                frame.paste(resized, mask=resized.getchannel('A'))
+            buffer = io.BytesIO()
+            frame.save(buffer, format, quality=quality + offset,
+                       **({'optimize': True, 'progressive': True}
+                          if format == 'JPEG' else {}))
+            variants.append((extension, mimetype, size, buffer.getvalue()))
+    return width, height, variants
+
+
+def check_public_url(url):
+    """Raises ValueError unless url is http(s) on a host with only public
+    addresses, so user-supplied links cannot reach internal services."""
+    parts = urlsplit(url)
+    if parts.scheme not in ('http', 'https') or not parts.hostname:
+        raise ValueError('not an http(s) URL: {!r}'.format(url))
+    try:
+        addresses = socket.getaddrinfo(parts.hostname, parts.port or
+                                       (443 if parts.scheme == 'https' else 80))
+    except socket.gaierror as e:
+        raise ValueError('cannot resolve {}: {}'.format(parts.hostname, e))
+    for address in addresses:
+        if not ipaddress.ip_address(address[4][0].split('%')[0]).is_global:
+            raise ValueError('{} is not a public host'.format(parts.hostname))
+
+
+def _public_connection(address, timeout=socket._GLOBAL_DEFAULT_TIMEOUT,
+                       source_address=None):
+    # socket.create_connection() that checks the addresses it connects to,
+    # so a host cannot resolve to a public address for check_public_url()
+    # and to an internal one a moment later for the request.
+    host, port = address
+    error = None
+    for family, kind, proto, _, sockaddr in socket.getaddrinfo(
+            host, port, 0, socket.SOCK_STREAM):
+        if not ipaddress.ip_address(sockaddr[0].split('%')[0]).is_global:
+            raise ValueError('{} is not a public host'.format(host))
+        sock = socket.socket(family, kind, proto)
+        try:
+            if timeout is not socket._GLOBAL_DEFAULT_TIMEOUT:
+                sock.settimeout(timeout)
+            if source_address:
+                sock.bind(source_address)
+            sock.connect(sockaddr)
+            return sock
+        except OSError as e:
+            error = e
+            sock.close()
+    raise error or OSError('cannot resolve {}'.format(host))
+
+
+class _PublicHTTPConnection(http.client.HTTPConnection):
+
+    def __init__(self, *args, **kwargs):
+        http.client.HTTPConnection.__init__(self, *args, **kwargs)
+        self._create_connection = _public_connection
+
+
+class _PublicHTTPSConnection(http.client.HTTPSConnection):
+    # the certificate is still checked against the host name
+
+    def __init__(self, *args, **kwargs):
+        http.client.HTTPSConnection.__init__(self, *args, **kwargs)
+        self._create_connection = _public_connection
+
+
+class _PublicHTTPHandler(HTTPHandler):
+
+    def http_open(self, req):
+        return self.do_open(_PublicHTTPConnection, req)
+
+
+class _PublicHTTPSHandler(HTTPSHandler):
+
+    def https_open(self, req):
+        return self.do_open(_PublicHTTPSConnection, req, context=self._context)
+
+
+class _PublicRedirects(HTTPRedirectHandler):
+
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        check_public_url(newurl)
+        return HTTPRedirectHandler.redirect_request(self, req, fp, code, msg,
+                                                    headers, newurl)
+
+
+def fetch_image(url, max_bytes, timeout):
+    """The body of the image at url, at most max_bytes long."""
+    check_public_url(url)
+    # no proxies: the connection has to go to the address that was checked
+    opener = build_opener(ProxyHandler({}), _PublicHTTPHandler(),
+                          _PublicHTTPSHandler(), _PublicRedirects())
+    request = Request(url, headers={'User-Agent': 'Fyyur image cache'})
+    with opener.open(request, timeout=timeout) as response:
+        mimetype = response.headers.get_content_type()
+        if not mimetype.startswith('image/'):
+            raise ValueError('{} is {}, not an image'.format(url, mimetype))
+        data = response.read(max_bytes + 1)
+    if len(data) > max_bytes:
+        raise ValueError('{} is over {} bytes'.format(url, max_bytes))
+    return data
+
+
+def template_files(directory):
+    for root, _, files in os.walk(directory):
+        for name in sorted(files):
+            if name.endswith('.html'):
+                yield os.path.join(root, name)
@@ -0,0 +1,42 @@
+"""trigram search indexes
+
+Revision ID: 7e3b5a1c2d48
+Revises: 4c1d2e8f9a07
+Create Date: 2026-10-18 10:03:17.228904
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '7e3b5a1c2d48'
+down_revision = '4c1d2e8f9a07'
+branch_labels = None
+depends_on = None
+
+SEARCH_COLUMNS = {
+    'Venue': ['name', 'city', 'state', 'genres'],
+    'Artist': ['name', 'city', 'state', 'genres'],
+}
+
+
+def upgrade():
+    # pg_trgm GIN indexes let the ILIKE '%term%' searches use an index; other
+    # databases are served by the in-process index in search.py.
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    for table, columns in SEARCH_COLUMNS.items():
+        for column in columns:
+            op.create_index('ix_{}_{}_trgm'.format(table.lower(), column), table,
+                            [column], unique=False, postgresql_using='gin',
+                            postgresql_ops={column: 'gin_trgm_ops'})
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    for table, columns in SEARCH_COLUMNS.items():
+        for column in columns:
+            op.drop_index('ix_{}_{}_trgm'.format(table.lower(), column),
+                          table_name=table)
@@ -0,0 +1,119 @@
+"""normalize genres
+
+Revision ID: b5f0c3d9e612
+Revises: 7e3b5a1c2d48
+Create Date: 2026-10-18 11:26:52.730115
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b5f0c3d9e612'
+down_revision = '7e3b5a1c2d48'
+branch_labels = None
+depends_on = None
+
+GENRES = [
+    'Alternative', 'Blues', 'Classical', 'Country', 'Electronic', 'Folk',
+    'Funk', 'Hip-Hop', 'Heavy Metal', 'Instrumental', 'Jazz',
+    'Musical Theatre', 'Pop', 'Punk', 'R&B', 'Reggae', 'Rock n Roll', 'Soul',
+    'Other',
+]
+
+
+def genre_key(name):
+    return ''.join(c for c in name.lower() if c.isalnum())
+
+
+KNOWN_GENRES = dict((genre_key(name), name) for name in GENRES)
+
+
+def canonical_genre(name):
+    """The form genre a legacy string stands for, ignoring case, spaces and
+    punctuation; anything else becomes 'Other', as the listing pages only
+    filter by the form's genres."""
+    return KNOWN_GENRES.get(genre_key(name), 'Other')
+
+
+# owner table, association table, owner key column, type of the old column
+OWNERS = [
+    ('Venue', 'venue_genres', 'venue_id', sa.Text()),
+    ('Artist', 'artist_genres', 'artist_id', sa.String(length=120)),
+]
+
+
+def upgrade():
+    genres = op.create_table('genres',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('name', sa.String(length=50), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('name')
+    )
+    for table, association, key, _ in OWNERS:
+        op.create_table(association,
+        sa.Column('genre_id', sa.Integer(), nullable=False),
+        sa.Column(key, sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['genre_id'], ['genres.id'], ),
+        sa.ForeignKeyConstraint([key], ['{}.id'.format(table)], ),
+        sa.PrimaryKeyConstraint('genre_id', key)
+        )
+        op.create_index(op.f('ix_{}_{}'.format(association, key)), association,
+                        [key], unique=False)
+
+    # move the comma-joined strings into the association tables
+    bind = op.get_bind()
+    owned = {}
+    for table, _, _, _ in OWNERS:
+        owner = sa.table(table, sa.column('id'), sa.column('genres'))
+        owned[table] = [
+            (row.id, [canonical_genre(name) for name in
+                      (row.genres or '').split(',') if name.strip()])
+            for row in bind.execute(sa.select([owner.c.id, owner.c.genres]))
+        ]
+    names = list(GENRES)
+    op.bulk_insert(genres, [{'id': i + 1, 'name': name}
+                            for i, name in enumerate(names)])
+    ids = dict((name, i + 1) for i, name in enumerate(names))
+    for table, association, key, _ in OWNERS:
+        links = set((ids[name], owner_id) for owner_id, row_names in owned[table]
+                    for name in row_names)
+        if links:
+            op.bulk_insert(sa.table(association, sa.column('genre_id'),
+                                    sa.column(key)),
+                           [{'genre_id': genre_id, key: owner_id}
+                            for genre_id, owner_id in sorted(links)])
+        op.drop_column(table, 'genres')
+    if bind.dialect.name == 'postgresql':
+        op.execute("SELECT setval('genres_id_seq', {})".format(len(names)))
+
+
+def downgrade():
+    bind = op.get_bind()
+    genres = sa.table('genres', sa.column('id'), sa.column('name'))
+    for table, association, key, column_type in OWNERS:
+        op.add_column(table, sa.Column('genres', column_type, nullable=True))
+        links = sa.table(association, sa.column('genre_id'), sa.column(key))
+        joined = {}
+        for owner_id, name in bind.execute(
+                sa.select([links.c[key], genres.c.name]).select_from(
+                    links.join(genres, links.c.genre_id == genres.c.id)).order_by(
+                    links.c[key], genres.c.name)):
+            joined.setdefault(owner_id, []).append(name)
+        owner = sa.table(table, sa.column('id'), sa.column('genres'))
+        bind.execute(owner.update().values(genres=''))
+        for owner_id, names in joined.items():
+            bind.execute(owner.update().where(owner.c.id == owner_id).values(
+                genres=','.join(names)))
+        op.alter_column(table, 'genres', existing_type=column_type,
+                        nullable=False)
+        if bind.dialect.name == 'postgresql':
+            # restore the trigram index dropped together with the column
+            op.create_index('ix_{}_genres_trgm'.format(table.lower()), table,
+                            ['genres'], unique=False, postgresql_using='gin',
+                            postgresql_ops={'genres': 'gin_trgm_ops'})
+        op.drop_index(op.f('ix_{}_{}'.format(association, key)),
+                      table_name=association)
+        op.drop_table(association)
+    op.drop_table('genres')
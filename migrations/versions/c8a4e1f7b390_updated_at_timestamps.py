@@ -0,0 +1,39 @@
+"""updated_at timestamps
+
+Revision ID: c8a4e1f7b390
+Revises: b5f0c3d9e612
+Create Date: 2026-10-18 13:41:09.617532
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c8a4e1f7b390'
+down_revision = 'b5f0c3d9e612'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # existing rows start out as modified now, in UTC like the utcnow() the
+    # application writes; it keeps the column current from then on. SQLite
+    # cannot add a NOT NULL column with a non-constant default, so the
+    # column is added nullable, filled, then tightened.
+    if op.get_bind().dialect.name == 'postgresql':
+        now = "timezone('utc', now())"
+    else:
+        now = 'CURRENT_TIMESTAMP'
+    for table in ('Venue', 'Artist', 'shows'):
+        op.add_column(table, sa.Column('updated_at', sa.DateTime(), nullable=True))
+        op.execute(sa.table(table, sa.column('updated_at')).update().values(
+            updated_at=sa.text(now)))
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.alter_column('updated_at', existing_type=sa.DateTime(),
+                                  nullable=False)
+
+
+def downgrade():
+    for table in ('shows', 'Artist', 'Venue'):
+        op.drop_column(table, 'updated_at')
@@ -0,0 +1,76 @@
+"""show end_time and no double bookings
+
+Revision ID: e7a3c5b8d914
+Revises: d2e6f9a1c584
+Create Date: 2026-10-18 16:20:45.513077
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e7a3c5b8d914'
+down_revision = 'd2e6f9a1c584'
+branch_labels = None
+depends_on = None
+
+# the columns are timestamps without time zone, so the ranges are tsrange
+# rather than tstzrange.
+EXCLUSION_CONSTRAINTS = {
+    'ex_shows_venue_id_during': 'venue_id',
+    'ex_shows_artist_id_during': 'artist_id',
+}
+
+
+def overlapping_shows(bind, column, limit=20):
+    """(id, id) pairs of shows of the same venue or artist that overlap."""
+    return bind.execute(sa.text(
+        'SELECT a.id, b.id FROM shows a JOIN shows b ON a.{0} = b.{0} '
+        'AND a.id < b.id AND a.start_time < b.end_time '
+        'AND b.start_time < a.end_time ORDER BY a.id, b.id '
+        'LIMIT {1}'.format(column, limit))).fetchall()
+
+
+def upgrade():
+    # existing shows are taken to last the default two hours.
+    op.add_column('shows', sa.Column('end_time', sa.DateTime(), nullable=True))
+    if op.get_bind().dialect.name == 'postgresql':
+        op.execute("UPDATE shows SET end_time = start_time + interval '2 hours'")
+    else:
+        op.execute("UPDATE shows SET end_time = datetime(start_time, '+2 hours')")
+    with op.batch_alter_table('shows') as batch_op:
+        batch_op.alter_column('end_time', existing_type=sa.DateTime(),
+                              nullable=False)
+        batch_op.create_check_constraint('ck_shows_end_after_start',
+                                         'end_time > start_time')
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    # btree_gist lets the integer ids take part in the GiST index behind
+    # each exclusion constraint; the app checks the same thing in-process
+    # on other databases.
+    # the constraints cannot be added over shows that already overlap, so
+    # those are listed for someone to move or delete first.
+    for column in EXCLUSION_CONSTRAINTS.values():
+        pairs = overlapping_shows(op.get_bind(), column)
+        if pairs:
+            raise RuntimeError(
+                'shows with the same {} overlap, so double bookings cannot be '
+                'excluded; move or delete one show of each pair (show ids, '
+                'first {}) and upgrade again: {}'.format(
+                    column, len(pairs),
+                    ', '.join('{}/{}'.format(*pair) for pair in pairs)))
+    op.execute('CREATE EXTENSION IF NOT EXISTS btree_gist')
+    for name, column in EXCLUSION_CONSTRAINTS.items():
+        op.execute('ALTER TABLE shows ADD CONSTRAINT {} EXCLUDE USING gist '
+                   '({} WITH =, tsrange(start_time, end_time) WITH &&)'.format(
+                       name, column))
+
+
+def downgrade():
+    if op.get_bind().dialect.name == 'postgresql':
+        for name in EXCLUSION_CONSTRAINTS:
+            op.drop_constraint(name, 'shows', type_='exclude')
+    with op.batch_alter_table('shows') as batch_op:
+        batch_op.drop_constraint('ck_shows_end_after_start', type_='check')
+        batch_op.drop_column('end_time')
@@ -0,0 +1,150 @@
+import json
+import logging
+import re
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from flask import current_app, g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r'\b\d+(?:\.\d+)?\b')
+_PARAMS = re.compile(r'\(\s*(?:\?|%\(\w+\)s|%s|:\w+)(?:\s*,\s*(?:\?|%\(\w+\)s|%s|:\w+))*\s*\)')
+_SPACE = re.compile(r'\s+')
+
+
+def fingerprint(statement):
+    """The statement with literals and parameter lists collapsed, so every
+    execution of the same query shape maps to the same string."""
+    statement = _STRING.sub('?', statement)
+    statement = _NUMBER.sub('?', statement)
+    statement = _PARAMS.sub('(...)', statement)
+    return _SPACE.sub(' ', statement).strip()
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+class RequestProfile(object):
+    """Queries run while one request was handled."""
+
+    def __init__(self):
+        self.started = time.time()
+        self.count = 0
+        self.seconds = 0.0
+        self.statements = OrderedDict()
+
+    def record(self, statement, seconds):
+        self.count += 1
+        self.seconds += seconds
+        key = fingerprint(statement)
+        count, total = self.statements.get(key, (0, 0.0))
+        self.statements[key] = (count + 1, total + seconds)
+
+    def repeated(self, threshold):
+        """(fingerprint, count, seconds) of the statements run at least
+        threshold times, the usual sign of an N+1 query."""
+        return [(key, count, total) for key, (count, total)
+                in self.statements.items() if count >= threshold]
+
+
+class QueryProfiler(object):
+    """Per-request SQL profiling, on when PROFILER_ENABLED is set.
+
+    Every request gets a Server-Timing header with its query count and
+    database time, and one JSON log line that also lists the statements
+    repeated PROFILER_REPEAT_THRESHOLD times or more.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        app.config.setdefault('PROFILER_ENABLED', False)
+        app.config.setdefault('PROFILER_REPEAT_THRESHOLD', 5)
+        app.config.setdefault('PROFILER_ENFORCE_BUDGETS', False)
+        if not app.config['PROFILER_ENABLED']:
+            return
+        event.listen(Engine, 'before_cursor_execute', self._before_execute)
+        event.listen(Engine, 'after_cursor_execute', self._after_execute)
+        app.before_request(self._start)
+        app.after_request(self._finish)
+
+    @staticmethod
+    def current():
+        if has_request_context():
+            return getattr(g, '_query_profile', None)
+        return None
+
+    def _start(self):
+        g._query_profile = RequestProfile()
+
+    def _before_execute(self, conn, cursor, statement, parameters, context,
+                        executemany):
+        if self.current() is not None:
+            conn.info.setdefault('_profiler_started', []).append(time.time())
+
+    def _after_execute(self, conn, cursor, statement, parameters, context,
+                       executemany):
+        profile = self.current()
+        started = conn.info.get('_profiler_started')
+        if profile is not None and started:
+            profile.record(statement, time.time() - started.pop())
+
+    def _finish(self, response):
+        profile = self.current()
+        if profile is None:
+            return response
+        elapsed = time.time() - profile.started
+        response.headers.add('Server-Timing',
+                             'db;dur={:.1f};desc="{} queries"'.format(
+                                 profile.seconds * 1000, profile.count))
+        response.headers.add('Server-Timing',
+                             'app;dur={:.1f}'.format(elapsed * 1000))
+        repeated = profile.repeated(
+            self.app.config['PROFILER_REPEAT_THRESHOLD'])
+        level = logging.WARNING if repeated else logging.INFO
+        self.app.logger.log(level, json.dumps({
+            'event': 'request_queries',
+            'method': request.method,
+            'path': request.full_path.rstrip('?'),
+            'endpoint': request.endpoint,
+            'status': response.status_code,
+            'queries': profile.count,
+            'db_ms': round(profile.seconds * 1000, 3),
+            'total_ms': round(elapsed * 1000, 3),
+            'repeated': [{'statement': key[:300], 'count': count,
+                          'db_ms': round(total * 1000, 3)}
+                         for key, count, total in repeated],
+        }))
+        return response
+
+
+def query_budget(limit):
+    """Declares the most queries a view may run for one request.
+
+    Going over is logged, and raises QueryBudgetExceeded when
+    PROFILER_ENFORCE_BUDGETS is set, which is how tests catch N+1
+    regressions. Only checked while the profiler is on.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            response = view(*args, **kwargs)
+            profile = QueryProfiler.current()
+            if profile is not None and profile.count > limit:
+                message = '{} ran {} queries, over its budget of {}'.format(
+                    request.endpoint, profile.count, limit)
+                if current_app.config['PROFILER_ENFORCE_BUDGETS']:
+                    raise QueryBudgetExceeded(message)
+                current_app.logger.warning(message)
+            return response
+        wrapper.query_budget = limit
+        return wrapper
+    return decorator
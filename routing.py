@@ -0,0 +1,231 @@
+import os
+import threading
+import time
+
+from flask import g, has_request_context, request, session as cookie
+from flask_sqlalchemy import SQLAlchemy, SignallingSession, get_state
+from sqlalchemy import event, orm
+from sqlalchemy.exc import DBAPIError, SQLAlchemyError
+from sqlalchemy.sql.dml import UpdateBase
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+# 0 while a replica has replayed everything it received, else how long ago
+# it replayed the last transaction. None on a primary.
+_LAG_SQL = """
+SELECT CASE
+  WHEN NOT pg_is_in_recovery() THEN NULL
+  WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+  ELSE extract(epoch FROM now() - pg_last_xact_replay_timestamp())
+END
+"""
+
+
+class ReplicaSet(object):
+    """Round-robin over the replica binds that passed their last check.
+
+    A replica is probed every check_interval by a daemon thread of each
+    process, never by the request asking for it: it must accept a
+    connection and, on PostgreSQL, be no more than max_lag seconds behind
+    its primary. One that fails, or whose connection breaks mid-request,
+    is skipped until a later probe succeeds.
+    """
+
+    def __init__(self, get_engine, keys, check_interval=5.0, max_lag=None):
+        self._get_engine = get_engine
+        self.keys = list(keys)
+        self.check_interval = check_interval
+        self.max_lag = max_lag
+        self._states = dict((key, {'up': True, 'next_check': 0.0,
+                                   'checked_at': None, 'lag': None})
+                            for key in self.keys)
+        self._engines = {}
+        self._next = 0
+        self._lock = threading.Lock()
+        self._prober_pid = None
+
+    @property
+    def lag_bound(self):
+        """Seconds a replica in use may be behind, or None without max_lag:
+        the lag allowed at its last probe plus the time until the next."""
+        if self.max_lag is None:
+            return None
+        return self.max_lag + self.check_interval
+
+    def choose(self):
+        """(key, engine) of the next healthy replica, or None."""
+        with self._lock:
+            start = self._next
+            self._next = (self._next + 1) % max(len(self.keys), 1)
+        for offset in range(len(self.keys)):
+            key = self.keys[(start + offset) % len(self.keys)]
+            if self._is_up(key):
+                return key, self.engine(key)
+        return None
+
+    def engine(self, key):
+        engine = self._engines.get(key)
+        if engine is None:
+            engine = self._engines[key] = self._get_engine(key)
+            event.listen(engine, 'handle_error',
+                         lambda context: self._on_error(key, context))
+        return engine
+
+    def mark_down(self, key):
+        with self._lock:
+            state = self._states[key]
+            state['up'] = False
+            state['next_check'] = time.time() + self.check_interval
+
+    def status(self):
+        with self._lock:
+            return [dict(self._states[key], key=key) for key in self.keys]
+
+    def check(self):
+        """Probes every replica whose check is due."""
+        for key in self.keys:
+            now = time.time()
+            with self._lock:
+                state = self._states[key]
+                if now < state['next_check']:
+                    continue
+                state['next_check'] = now + self.check_interval
+            up, lag = self._probe(self.engine(key))
+            with self._lock:
+                state.update(up=up, lag=lag, checked_at=now)
+
+    def _is_up(self, key):
+        self._start_prober()
+        with self._lock:
+            return self._states[key]['up']
+
+    def _start_prober(self):
+        # one prober per process: a forked web worker starts its own
+        pid = os.getpid()
+        with self._lock:
+            if self._prober_pid == pid:
+                return
+            self._prober_pid = pid
+        threading.Thread(target=self._probe_forever, name='replica-prober',
+                         daemon=True).start()
+
+    def _probe_forever(self):
+        while True:
+            try:
+                self.check()
+            except Exception:
+                # e.g. a bad replica URI; its state stays as it was
+                pass
+            time.sleep(min(self.check_interval, 1.0))
+
+    def _probe(self, engine):
+        try:
+            with engine.connect() as connection:
+                if connection.dialect.name == 'postgresql':
+                    lag = connection.execute(_LAG_SQL).scalar()
+                    lag = float(lag) if lag is not None else None
+                    return (lag is None or self.max_lag is None or
+                            lag <= self.max_lag), lag
+                connection.execute('SELECT 1')
+                return True, None
+        except SQLAlchemyError:
+            return False, None
+
+    def _on_error(self, key, context):
+        error = context.sqlalchemy_exception
+        if context.is_disconnect or (isinstance(error, DBAPIError) and
+                                     error.connection_invalidated):
+            self.mark_down(key)
+
+
+class RoutingSession(SignallingSession):
+    """Sends the reads of safe requests to a replica, everything else to
+    the primary.
+
+    A request that writes, flushes or locks rows stays on the primary for
+    the rest of its session, and so does one of a client that wrote within
+    REPLICA_STICKY_SECONDS, so a redirect after a POST reads what the POST
+    just committed.
+    """
+
+    def get_bind(self, mapper=None, clause=None):
+        bind = SignallingSession.get_bind(self, mapper, clause)
+        db = get_state(self.app).db
+        if bind is not db.engine or not db.replicas or not has_request_context():
+            return bind
+        if self._flushing or isinstance(clause, UpdateBase) or \
+                getattr(clause, '_for_update_arg', None) is not None:
+            self.info['primary'] = True
+            g.db_wrote = True
+        if self.info.get('primary') or not g.get('db_read_replica'):
+            return bind
+        if 'db_replica' not in g:
+            # one replica per request, so its queries see one snapshot
+            g.db_replica = db.replicas.choose()
+        return g.db_replica[1] if g.db_replica is not None else bind
+
+
+class RoutingSQLAlchemy(SQLAlchemy):
+    """Flask-SQLAlchemy with GET requests read from SQLALCHEMY_REPLICA_URIS.
+
+    The replicas are added to SQLALCHEMY_BINDS as replica_0, replica_1, ...
+    No model is bound to them, so create_all() and migrations leave them
+    alone; they are filled by the database's own replication.
+    """
+
+    def __init__(self, *args, **kwargs):
+        self.replicas = None
+        self._replica_keys = ()
+        super(RoutingSQLAlchemy, self).__init__(*args, **kwargs)
+
+    def init_app(self, app):
+        app.config.setdefault('SQLALCHEMY_REPLICA_URIS', [])
+        app.config.setdefault('REPLICA_CHECK_INTERVAL', 5)
+        app.config.setdefault('REPLICA_MAX_LAG', None)
+        app.config.setdefault('REPLICA_STICKY_SECONDS', 10)
+        binds = dict(app.config.get('SQLALCHEMY_BINDS') or {})
+        keys = []
+        for i, uri in enumerate(app.config['SQLALCHEMY_REPLICA_URIS']):
+            keys.append('replica_{}'.format(i))
+            binds[keys[-1]] = uri
+        app.config['SQLALCHEMY_BINDS'] = binds
+        self._replica_keys = tuple(keys)
+        super(RoutingSQLAlchemy, self).init_app(app)
+        if keys:
+            self.replicas = ReplicaSet(
+                lambda key: self.get_engine(app, bind=key), keys,
+                app.config['REPLICA_CHECK_INTERVAL'],
+                app.config['REPLICA_MAX_LAG'])
+        app.before_request(self._route_request)
+        app.after_request(self._stick_to_primary)
+
+    def _execute_for_all_tables(self, app, bind, operation, skip_tables=False):
+        # create_all()/drop_all() never touch the replicas
+        if bind == '__all__':
+            app = self.get_app(app)
+            bind = [None] + [key for key in app.config.get('SQLALCHEMY_BINDS')
+                             or () if key not in self._replica_keys]
+        return super(RoutingSQLAlchemy, self)._execute_for_all_tables(
+            app, bind, operation, skip_tables)
+
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+    def _route_request(self):
+        g.db_read_replica = (request.method in SAFE_METHODS and
+                             cookie.get('_db_primary_until', 0) < time.time())
+
+    def use_primary(self):
+        """Sends the rest of the current request's reads to the primary."""
+        g.db_read_replica = False
+
+    def read_replica(self):
+        """Whether the current request has read from a replica."""
+        return g.get('db_replica') is not None
+
+    def _stick_to_primary(self, response):
+        if self.replicas and (request.method not in SAFE_METHODS or
+                              g.get('db_wrote')):
+            cookie['_db_primary_until'] = time.time() + \
+                self.get_app().config['REPLICA_STICKY_SECONDS']
+        return response
@@ -0,0 +1,221 @@
+import bisect
+import heapq
+import threading
+from collections import defaultdict
+
+
+def trigrams(text):
+    # every three-character run of the lowered text, spaces included, so the
+    # trigrams of any substring are a subset of the trigrams of the text.
+    text = text.lower()
+    return set(text[i:i + 3] for i in range(len(text) - 2))
+
+
+def word_trigrams(text):
+    # pg_trgm style trigrams: each word padded with two leading blanks and
+    # one trailing blank.
+    grams = set()
+    for word in ''.join(c if c.isalnum() else ' ' for c in text.lower()).split():
+        word = '  ' + word + ' '
+        grams.update(word[i:i + 3] for i in range(len(word) - 2))
+    return grams
+
+
+def similarity(a, b):
+    # same measure as pg_trgm's similarity(): shared trigrams over all
+    # distinct trigrams of both strings.
+    return gram_similarity(word_trigrams(a), word_trigrams(b))
+
+
+def gram_similarity(a, b):
+    if not a or not b:
+        return 0.0
+    shared = len(a & b)
+    return float(shared) / (len(a) + len(b) - shared)
+
+
+class TrigramIndex(object):
+    """In-process case-insensitive substring index.
+
+    Stands in for the pg_trgm GIN indexes when the database is not
+    PostgreSQL. Each document is a key plus a few text fields, the first of
+    which is the name used for ranking.
+    """
+
+    def __init__(self):
+        self.loaded = False
+        self._docs = {}
+        # word trigrams of each name, for ranking without recomputing them
+        self._name_grams = {}
+        self._postings = defaultdict(set)
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._docs)
+
+    def load(self, documents):
+        with self._lock:
+            self._docs.clear()
+            self._name_grams.clear()
+            self._postings.clear()
+            for document in documents:
+                self.add(*document)
+            self.loaded = True
+
+    def add(self, key, *fields):
+        fields = tuple((field or '').lower() for field in fields)
+        with self._lock:
+            self.remove(key)
+            self._docs[key] = fields
+            self._name_grams[key] = word_trigrams(fields[0]) if fields else set()
+            for field in fields:
+                for gram in trigrams(field):
+                    self._postings[gram].add(key)
+
+    def remove(self, key):
+        with self._lock:
+            fields = self._docs.pop(key, None)
+            if fields is None:
+                return
+            del self._name_grams[key]
+            for field in fields:
+                for gram in trigrams(field):
+                    keys = self._postings.get(gram)
+                    if keys is not None:
+                        keys.discard(key)
+                        if not keys:
+                            del self._postings[gram]
+
+    def search(self, term, limit=None, ranked=True):
+        """Keys of the documents containing term, best name match first, or
+        in name order without ranked, which skips scoring every match."""
+        term = term.lower()
+        with self._lock:
+            grams = trigrams(term)
+            if grams:
+                postings = sorted((self._postings.get(gram, ()) for gram in grams),
+                                  key=len)
+                candidates = set(postings[0]).intersection(*postings[1:])
+            else:
+                candidates = set(self._docs)
+            if len(term) > 3 or not grams:
+                # a three-character term is one of the trigrams it was
+                # looked up by, and so already in every candidate.
+                candidates = [key for key in candidates if any(
+                    term in field for field in self._docs[key])]
+            if ranked:
+                term_grams = word_trigrams(term)
+                hits = [(-gram_similarity(self._name_grams[key], term_grams),
+                         self._docs[key][0], key) for key in candidates]
+            else:
+                hits = [(0, self._docs[key][0], key) for key in candidates]
+        if limit is not None and limit < len(hits):
+            hits = heapq.nsmallest(limit, hits)
+        else:
+            hits.sort()
+        return [key for _, _, key in hits]
+
+
+class SuggestIndex(object):
+    """In-memory name index for search-as-you-type.
+
+    Names starting with the query are a range of a sorted array of the
+    names, already in the order they are listed in. Next come names with a
+    later word starting with it, merged from the runs of a sorted array of
+    (word, name, key) entries, one run per word, and last, for queries of
+    three characters or more, matches inside words from a name-only
+    TrigramIndex, in name order as well. Each step only runs while the
+    earlier ones found fewer than limit names.
+    """
+
+    def __init__(self):
+        self.loaded = False
+        self._names = {}
+        self._sorted = []
+        self._words = []
+        self._infix = TrigramIndex()
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._names)
+
+    def load(self, names):
+        with self._lock:
+            self._names = dict(names)
+            self._sorted = sorted((name.lower(), key)
+                                  for key, name in self._names.items())
+            self._words = sorted((word, name, key) for name, key in self._sorted
+                                 for word in self._split(name))
+            self._infix.load(self._names.items())
+            self.loaded = True
+
+    def add(self, key, name):
+        with self._lock:
+            self.remove(key)
+            self._names[key] = name
+            name = name.lower()
+            bisect.insort(self._sorted, (name, key))
+            for word in self._split(name):
+                bisect.insort(self._words, (word, name, key))
+            self._infix.add(key, name)
+
+    def remove(self, key):
+        with self._lock:
+            name = self._names.pop(key, None)
+            if name is None:
+                return
+            name = name.lower()
+            _remove_sorted(self._sorted, (name, key))
+            for word in self._split(name):
+                _remove_sorted(self._words, (word, name, key))
+            self._infix.remove(key)
+
+    def suggest(self, query, limit=10):
+        """(key, name) pairs for names matching query, prefixes first."""
+        query = query.strip().lower()
+        if not query:
+            return []
+        with self._lock:
+            hits = []
+            i = bisect.bisect_left(self._sorted, (query,))
+            while len(hits) < limit and i < len(self._sorted) and \
+                    self._sorted[i][0].startswith(query):
+                hits.append(self._sorted[i][1])
+                i += 1
+            if len(hits) < limit:
+                words = self._split(query)
+                first = words[0] if words else query
+                seen = set(hits)
+                for name, key in heapq.merge(*self._runs(first)):
+                    if len(hits) == limit:
+                        break
+                    if key not in seen and query in name and \
+                            not name.startswith(query):
+                        seen.add(key)
+                        hits.append(key)
+            if len(hits) < limit and len(query) >= 3:
+                seen = set(hits)
+                infix = self._infix.search(query, limit + len(hits),
+                                           ranked=False)
+                hits += [key for key in infix if key not in seen]
+            return [(key, self._names[key]) for key in hits[:limit]]
+
+    def _runs(self, prefix):
+        # (name, key) of the entries of each word starting with prefix
+        words, runs = self._words, []
+        i = bisect.bisect_left(words, (prefix,))
+        while i < len(words) and words[i][0].startswith(prefix):
+            end = bisect.bisect_left(words, (words[i][0] + '\0',))
+            runs.append(words[k][1:] for k in range(i, end))
+            i = end
+        return runs
+
+    @staticmethod
+    def _split(name):
+        return ''.join(c if c.isalnum() else ' ' for c in name.lower()).split()
+
+
+def _remove_sorted(items, item):
+    i = bisect.bisect_left(items, item)
+    if i < len(items) and items[i] == item:
+        del items[i]
@@ -0,0 +1,195 @@
+"""Fills a database with a synthetic booking dataset for benchmarks.
+
+    python seed.py --database-url sqlite:///bench.db --scale large --reset
+
+Venues, artists and shows are written with multi-row INSERTs in chunks,
+with no two shows of a venue or an artist overlapping, so the data also
+loads under the PostgreSQL exclusion constraints. The same --seed always
+produces the same data. Tables missing from the database are created with
+create_all(); on PostgreSQL run `flask db upgrade` first so the indexes and
+constraints of the migrations are in place.
+"""
+import os
+import random
+from datetime import datetime, timedelta
+
+import click
+
+# (venues, artists, shows)
+SCALES = {
+    'small': (100, 1000, 10000),
+    'medium': (1000, 10000, 100000),
+    'large': (1000, 10000, 1000000),
+    # the scale the availability search is held to its budget at
+    'availability': (10000, 10000, 1000000),
+}
+CHUNK_SIZE = 10000
+# shows start on a grid of slots this long; a show never outlasts its slot.
+SLOT_HOURS = 4
+
+CITIES = [
+    ('San Francisco', 'CA'), ('Oakland', 'CA'), ('Los Angeles', 'CA'),
+    ('New York', 'NY'), ('Brooklyn', 'NY'), ('Austin', 'TX'),
+    ('Houston', 'TX'), ('Chicago', 'IL'), ('Seattle', 'WA'),
+    ('Portland', 'OR'), ('Nashville', 'TN'), ('New Orleans', 'LA'),
+    ('Denver', 'CO'), ('Atlanta', 'GA'), ('Boston', 'MA'), ('Miami', 'FL'),
+]
+WORDS = [
+    'Blue', 'Velvet', 'Electric', 'Golden', 'Midnight', 'Silver', 'Wild',
+    'Crimson', 'Hollow', 'Neon', 'Rusty', 'Lucky', 'Echo', 'Northern',
+    'Sunset', 'Copper', 'Stone', 'Paper', 'Ghost', 'Honey',
+]
+VENUE_NOUNS = ['Hall', 'Room', 'Lounge', 'Club', 'Theatre', 'Bar', 'Garden',
+               'Warehouse', 'Cafe', 'Ballroom']
+ARTIST_NOUNS = ['Band', 'Collective', 'Trio', 'Quartet', 'Orchestra',
+                'Project', 'Sound', 'Kids', 'Brothers', 'Sisters']
+
+
+def name(rng, nouns, number):
+    return '{} {} {} {}'.format(rng.choice(WORDS), rng.choice(WORDS),
+                                rng.choice(nouns), number)
+
+
+def insert_chunks(db, table, rows):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == CHUNK_SIZE:
+            db.session.execute(table.insert(), chunk)
+            chunk = []
+    if chunk:
+        db.session.execute(table.insert(), chunk)
+
+
+def entity_rows(rng, count, nouns, extra, now):
+    for i in range(1, count + 1):
+        city, state = rng.choice(CITIES)
+        row = {
+            'id': i, 'name': name(rng, nouns, i), 'city': city,
+            'state': state, 'phone': '555-{:03d}-{:04d}'.format(
+                rng.randrange(1000), rng.randrange(10000)),
+            'image_link': 'https://picsum.photos/seed/{}{}/300'.format(
+                nouns[0].lower(), i),
+            'facebook_link': 'https://www.facebook.com/{}{}'.format(
+                nouns[0].lower(), i),
+            'website': 'https://example.com/{}{}'.format(nouns[0].lower(), i),
+            'seeking_description': None,
+            'upcoming_shows_count': 0, 'past_shows_count': 0,
+            'updated_at': now,
+        }
+        row.update(extra(i))
+        yield row
+
+
+def genre_rows(rng, count, key, genre_ids):
+    for i in range(1, count + 1):
+        for genre_id in rng.sample(genre_ids, rng.randint(1, 3)):
+            yield {'genre_id': genre_id, key: i}
+
+
+def show_rows(rng, venues, artists, shows, now):
+    # every slot books a random set of venues, each with a different artist,
+    # so no venue or artist is ever in two shows at once. the slots run from
+    # half the span in the past to half of it in the future.
+    per_slot = max(1, min(venues, artists) // 5)
+    slots = (shows + per_slot - 1) // per_slot
+    first = now.replace(minute=0, second=0, microsecond=0) - timedelta(
+        hours=slots * SLOT_HOURS // 2)
+    made = 0
+    for slot in range(slots):
+        start = first + timedelta(hours=slot * SLOT_HOURS)
+        booked = min(per_slot, shows - made)
+        for venue_id, artist_id in zip(rng.sample(range(1, venues + 1), booked),
+                                       rng.sample(range(1, artists + 1), booked)):
+            start_time = start + timedelta(minutes=rng.choice((0, 30, 60)))
+            yield {
+                'start_time': start_time,
+                'end_time': start_time + timedelta(
+                    minutes=rng.choice((60, 90, 120, 150))),
+                'venue_id': venue_id, 'artist_id': artist_id,
+                'upcoming': start_time > now, 'updated_at': now,
+            }
+        made += booked
+
+
+def seed(venues, artists, shows, random_seed=0):
+    from app import (app, db, Venue, Artist, Show, Genre, GENRES,
+                     venue_genres, artist_genres, genres_from_names,
+                     reconcile_batches, reconcile_counters)
+    rng = random.Random(random_seed)
+    now = datetime.now()
+    genres_from_names(GENRES)
+    db.session.commit()
+    genre_ids = [row[0] for row in db.session.query(Genre.id).order_by(Genre.id)]
+
+    insert_chunks(db, Venue.__table__, entity_rows(rng, venues, VENUE_NOUNS,
+        lambda i: {'address': '{} {} St'.format(rng.randint(1, 999),
+                                                 rng.choice(WORDS)),
+                   'seeking_talent': rng.random() < 0.3}, now))
+    insert_chunks(db, Artist.__table__, entity_rows(rng, artists, ARTIST_NOUNS,
+        lambda i: {'seeking_venue': rng.random() < 0.3}, now))
+    insert_chunks(db, venue_genres, genre_rows(rng, venues, 'venue_id',
+                                               genre_ids))
+    insert_chunks(db, artist_genres, genre_rows(rng, artists, 'artist_id',
+                                                genre_ids))
+    db.session.commit()
+    insert_chunks(db, Show.__table__, show_rows(rng, venues, artists, shows,
+                                                now))
+    db.session.commit()
+    if db.engine.dialect.name == 'postgresql':
+        for table in ('Venue', 'Artist', 'shows'):
+            db.session.execute(db.text(
+                "SELECT setval(pg_get_serial_sequence('\"{0}\"', 'id'), "
+                "(SELECT max(id) FROM \"{0}\"))".format(table)))
+    # the rows went in without the ORM, so the counters are filled in
+    # afterwards the way `flask reconcile-counters` does it.
+    for model in (Venue, Artist):
+        for _, diffs in reconcile_batches(model):
+            if diffs:
+                reconcile_counters(model, diffs)
+            db.session.commit()
+    # the persisted home feed describes the old data; the next process to
+    # serve / rebuilds it.
+    if os.path.exists(app.config['HOME_FEED_PATH']):
+        os.remove(app.config['HOME_FEED_PATH'])
+
+
+@click.command()
+@click.option('--database-url', envvar='DATABASE_URL', required=True,
+              help='Database to fill; defaults to $DATABASE_URL.')
+@click.option('--scale', type=click.Choice(sorted(SCALES)), default='small')
+@click.option('--venues', type=int, help='Overrides the scale.')
+@click.option('--artists', type=int, help='Overrides the scale.')
+@click.option('--shows', type=int, help='Overrides the scale.')
+@click.option('--seed', 'random_seed', type=int, default=0)
+@click.option('--reset', is_flag=True,
+              help='Drop and recreate every table first.')
+def main(database_url, scale, venues, artists, shows, random_seed, reset):
+    """Fill a database with synthetic venues, artists and shows."""
+    # app.py reads its settings from the environment when it is imported;
+    # the home feed cleared below is bench.py's, not the one of the
+    # development database.
+    os.environ['DATABASE_URL'] = database_url
+    os.environ.setdefault('HOME_FEED_PATH', os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), '.bench-feed.json'))
+    from app import app, db
+    default_venues, default_artists, default_shows = SCALES[scale]
+    venues = venues or default_venues
+    artists = artists or default_artists
+    shows = shows if shows is not None else default_shows
+    with app.app_context():
+        if reset:
+            db.drop_all()
+        db.create_all()
+        if db.session.execute('SELECT count(*) FROM "Venue"').scalar():
+            raise click.ClickException('the database already has venues; '
+                                       'pass --reset to replace them')
+        started = datetime.now()
+        seed(venues, artists, shows, random_seed)
+        click.echo('{} venues, {} artists, {} shows in {:.1f}s'.format(
+            venues, artists, shows,
+            (datetime.now() - started).total_seconds()))
+
+
+if __name__ == '__main__':
+    main()
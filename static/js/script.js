@@ -2,3 +2,29 @@ window.parseISOString = function parseISOString(s) {
   var b = s.split(/\D+/);
   return new Date(Date.UTC(b[0], --b[1], b[2], b[3], b[4], b[5], b[6]));
 };
+
+// fills the navbar search box's datalist from /search/suggest as you type.
+document.addEventListener('DOMContentLoaded', function() {
+  var inputs = document.querySelectorAll('input[data-suggest]');
+  Array.prototype.forEach.call(inputs, function(input) {
+    var list = document.getElementById(input.getAttribute('list'));
+    var kind = input.getAttribute('data-suggest');
+    var pending = null;
+    input.addEventListener('input', function() {
+      if (pending) { pending.abort(); }
+      if (!input.value) { list.innerHTML = ''; return; }
+      pending = new XMLHttpRequest();
+      pending.open('GET', '/search/suggest?q=' + encodeURIComponent(input.value));
+      pending.onload = function() {
+        if (pending.status !== 200) { return; }
+        list.innerHTML = '';
+        JSON.parse(pending.responseText)[kind].forEach(function(item) {
+          var option = document.createElement('option');
+          option.value = item.name;
+          list.appendChild(option);
+        });
+      };
+      pending.send();
+    });
+  });
+});
@@ -0,0 +1,90 @@
+import os
+import sys
+import tempfile
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import event
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# app.py reads its settings from the environment when it is imported
+_tmp = tempfile.mkdtemp(prefix='fyyur-tests-')
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(_tmp, 'test.db')
+os.environ['CACHE_BACKEND'] = 'null'
+os.environ['HOME_FEED_PATH'] = os.path.join(_tmp, 'feed.json')
+# so tests can turn PROFILER_ENFORCE_BUDGETS on
+os.environ['PROFILER_ENABLED'] = '1'
+# queued jobs run at the end of their request, without a worker
+os.environ['JOBS_EAGER'] = '1'
+
+import app as fyyur  # noqa: E402
+
+
+@pytest.fixture
+def app():
+    fyyur.app.config.update(TESTING=True, WTF_CSRF_ENABLED=False)
+    with fyyur.app.app_context():
+        fyyur.db.create_all()
+        reset_state()
+        yield fyyur.app
+        fyyur.db.session.remove()
+        fyyur.db.drop_all()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+def reset_state():
+    # the in-process indexes, calendar and feed outlive a test's database
+    for model in (fyyur.Venue, fyyur.Artist):
+        fyyur.search_indexes[model] = fyyur.TrigramIndex()
+        fyyur.suggest_indexes[model] = fyyur.SuggestIndex()
+    fyyur.search_index_versions.clear()
+    fyyur.bookings.forget()
+    if os.path.exists(fyyur.home_feed.path):
+        os.remove(fyyur.home_feed.path)
+    fyyur.home_feed._data = None
+
+
+@contextmanager
+def count_queries():
+    """Collects the SQL statements run inside the block."""
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+    event.listen(fyyur.db.engine, 'before_cursor_execute', record)
+    try:
+        yield statements
+    finally:
+        event.remove(fyyur.db.engine, 'before_cursor_execute', record)
+
+
+def add_venue(name='Venue', city='San Francisco', state='CA', **fields):
+    venue = fyyur.Venue(name=name, city=city, state=state,
+                        address='1 Main St', phone='123-123-1234',
+                        image_link='https://example.com/v.jpg', **fields)
+    fyyur.db.session.add(venue)
+    return venue
+
+
+def add_artist(name='Artist', city='San Francisco', state='CA', **fields):
+    artist = fyyur.Artist(name=name, city=city, state=state,
+                          phone='123-123-1234',
+                          image_link='https://example.com/a.jpg', **fields)
+    fyyur.db.session.add(artist)
+    return artist
+
+
+def add_show(venue, artist, start_time, hours=2):
+    show = fyyur.Show(venue_id=venue.id, artist_id=artist.id,
+                      start_time=start_time,
+                      end_time=start_time + timedelta(hours=hours),
+                      upcoming=start_time > datetime.now())
+    fyyur.db.session.add(show)
+    return show
@@ -0,0 +1,82 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from conftest import add_artist, add_show, add_venue, count_queries, fyyur
+
+
+def test_api_writes_show_times_as_iso_8601(client):
+    venue, artist = add_venue(), add_artist()
+    fyyur.db.session.flush()
+    start = datetime.now().replace(microsecond=0) + timedelta(days=3)
+    add_show(venue, artist, start)
+    fyyur.db.session.commit()
+
+    response = client.get('/api/v1/shows?fields=id,start_time,end_time')
+    assert response.mimetype == 'application/json'
+    show = response.get_json()['data'][0]
+    assert show['start_time'] == start.isoformat()
+    assert show['end_time'] == (start + timedelta(hours=2)).isoformat()
+
+    data = client.get('/api/v1/venues/{}'.format(venue.id)).get_json()
+    assert data['upcoming_shows'][0]['start_time'] == start.isoformat()
+    data = client.get('/api/v1/artists?fields=id,upcoming_shows').get_json()
+    assert data['data'][0]['upcoming_shows'][0]['start_time'] == \
+        start.isoformat()
+
+
+def test_api_pages_follow_the_next_cursor(client):
+    for i in range(5):
+        add_venue('Venue {}'.format(i))
+    fyyur.db.session.commit()
+    names, url = [], '/api/v1/venues?fields=id,name&limit=2'
+    while True:
+        data = client.get(url).get_json()
+        names += [venue['name'] for venue in data['data']]
+        if data['next'] is None:
+            break
+        url = '/api/v1/venues?fields=id,name&limit=2&after=' + data['next']
+    assert names == ['Venue {}'.format(i) for i in range(5)]
+    assert client.get('/api/v1/venues?fields=nope').get_json() == {
+        'error': 'Bad Request'}
+
+
+def test_api_reads_the_ids_asked_for_in_one_query(client):
+    for i in range(4):
+        add_venue('Venue {}'.format(i)).genres = fyyur.genres_from_names(
+            ['Jazz'])
+    fyyur.db.session.commit()
+    with count_queries() as statements:
+        response = client.get('/api/v1/venues?ids=3,1&fields=name,genres')
+    assert len(statements) == 1, statements
+    assert response.get_json() == {'next': None, 'data': [
+        {'id': 1, 'name': 'Venue 0', 'genres': ['Jazz']},
+        {'id': 3, 'name': 'Venue 2', 'genres': ['Jazz']}]}
+
+
+@pytest.mark.parametrize('url', ['/api/v1/venues', '/api/v1/venues/1',
+                                 '/api/v1/artists', '/api/v1/shows'])
+def test_api_rejects_unknown_fields(client, url):
+    add_venue()
+    fyyur.db.session.commit()
+    for fields in ('nope', 'name,nope', ','):
+        response = client.get(url + '?fields=' + fields)
+        assert response.status_code == 400, fields
+        assert response.get_json() == {'error': 'Bad Request'}
+
+
+def test_api_projections_hold_only_the_fields_asked_for(client):
+    venue, artist = add_venue(), add_artist()
+    fyyur.db.session.flush()
+    add_show(venue, artist, datetime.now() + timedelta(days=3))
+    fyyur.db.session.commit()
+    for url, keys in [
+            ('/api/v1/venues?fields=name,city', {'id', 'name', 'city'}),
+            ('/api/v1/artists?fields=upcoming_shows_count',
+             {'id', 'upcoming_shows_count'}),
+            ('/api/v1/shows?fields=venue_name', {'id', 'venue_name'})]:
+        data = client.get(url).get_json()['data']
+        assert data and all(set(row) == keys for row in data), url
+    data = client.get('/api/v1/venues/{}?fields=phone'.format(
+        venue.id)).get_json()
+    assert data == {'id': venue.id, 'phone': '123-123-1234'}
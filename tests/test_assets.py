@@ -0,0 +1,66 @@
+import gzip
+
+import pytest
+
+from conftest import fyyur
+
+
+@pytest.fixture
+def static(app, tmp_path, monkeypatch):
+    monkeypatch.setattr(app, 'static_folder', str(tmp_path))
+    (tmp_path / 'dist').mkdir()
+    (tmp_path / 'dist' / 'remote').mkdir()
+    for name in ('dist/main.0123456789ab.css', 'plain.css',
+                 'dist/manifest.json', 'dist/remote/0123456789abcdef0123.json'):
+        data = b'body{color:red}'
+        (tmp_path / name).write_bytes(data)
+        (tmp_path / (name + '.gz')).write_bytes(gzip.compress(data))
+    return tmp_path
+
+
+def test_the_precompressed_copy_the_client_accepts_is_served(client, static):
+    response = client.get('/static/plain.css',
+                          headers={'Accept-Encoding': 'gzip, deflate'})
+    assert response.content_encoding == 'gzip'
+    assert gzip.decompress(response.data) == b'body{color:red}'
+    assert response.mimetype == 'text/css'
+    assert 'Accept-Encoding' in response.vary
+
+    response = client.get('/static/plain.css')
+    assert response.content_encoding is None
+    assert response.data == b'body{color:red}'
+    assert 'Accept-Encoding' in response.vary
+
+
+def test_only_fingerprinted_files_are_immutable(client, static):
+    response = client.get('/static/dist/main.0123456789ab.css')
+    assert response.cache_control.immutable
+    assert response.cache_control.max_age == \
+        fyyur.app.config['ASSETS_MAX_AGE']
+
+    for path in ('plain.css', 'dist/manifest.json',
+                 'dist/remote/0123456789abcdef0123.json'):
+        response = client.get('/static/' + path)
+        assert not response.cache_control.immutable, path
+
+    digest = fyyur.assets._hash('plain.css')
+    response = client.get('/static/plain.css?v=' + digest)
+    assert response.cache_control.immutable
+    response = client.get('/static/plain.css?v=stale')
+    assert not response.cache_control.immutable
+
+
+def test_paths_outside_the_static_folder_are_not_served(client, static):
+    assert client.get('/static/../conftest.py').status_code == 404
+    assert client.get('/static/missing.css').status_code == 404
+
+
+@pytest.mark.parametrize('layout', ['layouts/main.html', 'layouts/form.html'])
+def test_the_layouts_link_the_bundles(app, layout):
+    with app.test_request_context('/'):
+        page = fyyur.app.jinja_env.get_template(layout).render()
+        urls = [url for name in ('main.css', 'head.js', 'main.js')
+                for url in fyyur.assets.urls(name)]
+    for url in urls:
+        assert '"{}"'.format(url) in page, url
+    assert 'ajax.googleapis.com' not in page
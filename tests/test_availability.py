@@ -0,0 +1,108 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from conftest import add_artist, add_show, add_venue, fyyur
+
+START = datetime(2030, 6, 1, 20)
+END = START + timedelta(hours=3)
+WINDOW = 'start=2030-06-01T20:00:00&end=2030-06-01T23:00:00'
+
+
+def free(**filters):
+    return [venue['name'] for venue in fyyur.available_venues(
+        START, END, **filters)]
+
+
+def booked(venue, artist, start, end):
+    show = add_show(venue, artist, start)
+    show.end_time = end
+    fyyur.db.session.commit()
+
+
+def test_shows_touching_the_window_leave_the_venue_free(app):
+    before, after = add_venue('Before'), add_venue('After')
+    artist = add_artist()
+    fyyur.db.session.flush()
+    booked(before, artist, START - timedelta(hours=2), START)
+    booked(after, artist, END, END + timedelta(hours=2))
+    assert free() == ['Before', 'After']
+
+
+@pytest.mark.parametrize('start, end', [
+    (START + timedelta(hours=1), START + timedelta(hours=2)),  # inside
+    (START - timedelta(hours=1), START + timedelta(minutes=1)),
+    (END - timedelta(minutes=1), END + timedelta(hours=1)),
+    (START - timedelta(hours=1), END + timedelta(hours=1)),  # around
+    # as long as a show may be, begun before the window and still on
+    (START - timedelta(minutes=fyyur.MAX_SHOW_MINUTES - 1),
+     START + timedelta(minutes=1)),
+])
+def test_a_show_overlapping_the_window_makes_the_venue_busy(app, start, end):
+    busy, idle = add_venue('Busy'), add_venue('Idle')
+    artist = add_artist()
+    fyyur.db.session.flush()
+    booked(busy, artist, start, end)
+    assert free() == ['Idle']
+
+
+def test_the_filters_narrow_the_free_venues(app):
+    jazz = fyyur.genres_from_names(['Jazz'])
+    add_venue('Austin Jazz', city='Austin', state='TX',
+              seeking_talent=True).genres = jazz
+    add_venue('Austin Rock', city='Austin', state='TX', seeking_talent=False)
+    add_venue('Dallas Jazz', city='Dallas', state='TX',
+              seeking_talent=True).genres = jazz
+    add_venue('Portland', city='Portland', state='OR', seeking_talent=True)
+    fyyur.db.session.commit()
+    assert free(city='AUSTIN') == ['Austin Jazz', 'Austin Rock']
+    assert free(state='TX') == ['Austin Jazz', 'Austin Rock', 'Dallas Jazz']
+    assert free(genre='Jazz') == ['Austin Jazz', 'Dallas Jazz']
+    assert free(seeking_talent=True) == ['Austin Jazz', 'Dallas Jazz',
+                                         'Portland']
+    assert free(seeking_talent=False) == ['Austin Rock']
+    assert free(city='austin', genre='Jazz', seeking_talent=True) == [
+        'Austin Jazz']
+
+
+def test_the_page_and_the_api_filter_alike(client):
+    add_venue('Austin Jazz', city='Austin', state='TX',
+              seeking_talent=True).genres = fyyur.genres_from_names(['Jazz'])
+    add_venue('Austin Rock', city='Austin', state='TX')
+    fyyur.db.session.commit()
+    query = WINDOW + '&city=austin&genre=Jazz&seeking_talent=1'
+    page = client.get('/venues/available?' + query).get_data(as_text=True)
+    assert 'Austin Jazz' in page and 'Austin Rock' not in page
+    data = client.get('/api/v1/venues/available?' + query).get_json()
+    assert [venue['name'] for venue in data['data']] == ['Austin Jazz']
+
+
+def test_the_api_pages_through_the_free_venues(client):
+    artist = add_artist()
+    venues = [add_venue('Venue {}'.format(i)) for i in range(7)]
+    fyyur.db.session.flush()
+    booked(venues[3], artist, START, END)
+    names, after = [], ''
+    while True:
+        data = client.get('/api/v1/venues/available?{}&limit=2{}'.format(
+            WINDOW, after)).get_json()
+        assert len(data['data']) <= 2
+        names += [venue['name'] for venue in data['data']]
+        if data['next'] is None:
+            break
+        after = '&after=' + data['next']
+    assert names == ['Venue {}'.format(i) for i in (0, 1, 2, 4, 5, 6)]
+
+
+@pytest.mark.parametrize('url', ['/venues/available',
+                                 '/api/v1/venues/available'])
+@pytest.mark.parametrize('query', [
+    'start=2030-06-01T20:00:00',
+    'end=2030-06-01T23:00:00',
+    'start=tonight&end=2030-06-01T23:00:00',
+    'start=2030-06-01T23:00:00&end=2030-06-01T20:00:00',
+    'start=2030-06-01T20:00:00&end=2030-06-01T20:00:00',
+    WINDOW + '&genre=Polka',
+])
+def test_a_malformed_window_is_rejected(client, url, query):
+    assert client.get(url + '?' + query).status_code == 400
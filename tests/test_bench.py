@@ -0,0 +1,19 @@
+import bench
+from conftest import fyyur
+
+
+def test_availability_routes_are_held_to_their_budget():
+    results = {'GET /venues/available': {'p95_ms': 51.0},
+               'GET /api/v1/venues/available': {'p95_ms': 12.0},
+               'GET /venues': {'p95_ms': 80.0}}
+    assert bench.over_budget(results) == [
+        'GET /venues/available: p95 51.00 ms, budget 50 ms']
+
+
+def test_render_benchmark_times_both_filters(app):
+    results = bench.render_benchmark(app, 2)
+    assert sorted(results) == [bench.RENDER_NAME,
+                               bench.RENDER_NAME + ' (babel)']
+    assert all(result['n'] == 2 for result in results.values())
+    # the memoized filter is put back afterwards
+    assert app.jinja_env.filters['datetime'] is fyyur.format_datetime
@@ -0,0 +1,92 @@
+from datetime import datetime, timedelta
+
+from sqlalchemy.exc import IntegrityError
+
+from conftest import add_artist, add_show, add_venue, fyyur
+
+
+def book(client, venue, artist, start, minutes=120):
+    return client.post('/shows/create', data={
+        'venue_id': venue, 'artist_id': artist, 'duration': minutes,
+        'start_time': start.strftime('%Y-%m-%d %H:%M:%S')},
+        follow_redirects=True)
+
+
+def seed():
+    venue, artist, other = add_venue(), add_artist(), add_artist('Other')
+    fyyur.db.session.commit()
+    return venue.id, artist.id, other.id
+
+
+def test_a_show_deleted_elsewhere_does_not_block_its_slot(client):
+    venue, artist, other = seed()
+    start = datetime.now().replace(microsecond=0) + timedelta(days=7)
+    book(client, venue, artist, start)
+    assert fyyur.Show.query.count() == 1
+    # another process deletes the show; this process's trees still hold it
+    fyyur.Show.query.delete()
+    fyyur.db.session.commit()
+    response = book(client, venue, other, start)
+    assert b'already booked' not in response.data
+    assert fyyur.Show.query.count() == 1
+
+
+def test_a_show_booked_elsewhere_blocks_its_slot(client, monkeypatch):
+    # stands in for the cache tags a shared backend keeps
+    versions = {}
+    monkeypatch.setattr(fyyur.bookings, '_version',
+                        lambda resource: versions.get(resource))
+    venue, artist, other = seed()
+    start = datetime.now().replace(microsecond=0) + timedelta(days=7)
+    book(client, venue, artist, start + timedelta(days=1))
+    # another process books the venue and invalidates its tag
+    add_show(fyyur.Venue.query.get(venue), fyyur.Artist.query.get(other), start)
+    fyyur.db.session.commit()
+    versions[('venue', venue)] = 'written elsewhere'
+    response = book(client, venue, artist, start + timedelta(hours=1))
+    assert b'The venue is already booked' in response.data
+    assert fyyur.Show.query.count() == 2
+
+
+def test_import_rejects_shows_longer_than_a_day(app):
+    venue, artist, _ = seed()
+    start = datetime(2030, 1, 1, 20)
+    rows = [(1, {'venue_id': venue, 'artist_id': artist,
+                 'start_time': start.strftime('%Y-%m-%d %H:%M:%S'),
+                 'end_time': (start + timedelta(days=2)).isoformat()}),
+            (2, {'venue_id': venue, 'artist_id': artist,
+                 'start_time': start.strftime('%Y-%m-%d %H:%M:%S'),
+                 'end_time': (start + timedelta(hours=3)).isoformat()})]
+    result = fyyur.import_rows('shows', rows)
+    assert result.inserted == 1
+    assert fyyur.Show.query.one().end_time == start + timedelta(hours=3)
+
+
+def test_a_show_booked_elsewhere_blocks_its_slot_without_a_shared_cache(client):
+    # with a per-process cache this process's trees are never told of it
+    venue, artist, other = seed()
+    start = datetime.now().replace(microsecond=0) + timedelta(days=7)
+    book(client, venue, artist, start + timedelta(days=1))
+    add_show(fyyur.Venue.query.get(venue), fyyur.Artist.query.get(other), start)
+    fyyur.db.session.commit()
+    response = book(client, venue, artist, start + timedelta(hours=1))
+    assert b'The venue is already booked' in response.data
+    assert fyyur.Show.query.count() == 2
+
+
+class ExclusionViolation(Exception):
+    pgcode = fyyur.EXCLUSION_VIOLATION
+
+
+def test_an_exclusion_violation_is_reported_as_a_booking_conflict(
+        client, monkeypatch):
+    venue, artist, _ = seed()
+
+    def commit():
+        # the insert's commit fails, as when another process took the slot
+        monkeypatch.undo()
+        raise IntegrityError('INSERT INTO shows', {}, ExclusionViolation())
+    monkeypatch.setattr(fyyur.db.session, 'commit', commit)
+    response = book(client, venue, artist, datetime(2030, 1, 1, 20))
+    assert b'was booked for that time in the meantime' in response.data
+    assert fyyur.Show.query.count() == 0
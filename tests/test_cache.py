@@ -0,0 +1,30 @@
+import importlib
+
+from cache import FileBackend, TaggedCache, create_cache
+
+
+def test_file_cache_invalidation_reaches_every_process(tmp_path):
+    # two caches on one directory stand for two web processes
+    first = TaggedCache(FileBackend(str(tmp_path)))
+    second = TaggedCache(FileBackend(str(tmp_path)))
+    first.set('page:/venues', b'old', tags=['venues'])
+    assert second.get('page:/venues') == b'old'
+    second.invalidate('venues')
+    assert first.get('page:/venues') is None
+
+
+def test_several_web_processes_default_to_the_file_cache(monkeypatch, tmp_path):
+    import config
+    monkeypatch.delenv('CACHE_BACKEND', raising=False)
+    monkeypatch.setenv('WEB_CONCURRENCY', '4')
+    try:
+        reloaded = importlib.reload(config)
+        assert reloaded.CACHE_BACKEND == 'file'
+        cache = create_cache({'CACHE_BACKEND': reloaded.CACHE_BACKEND,
+                              'CACHE_DIR': str(tmp_path)})
+        assert isinstance(cache.backend, FileBackend)
+        monkeypatch.setenv('WEB_CONCURRENCY', '1')
+        assert importlib.reload(config).CACHE_BACKEND == 'memory'
+    finally:
+        monkeypatch.undo()
+        importlib.reload(config)
@@ -0,0 +1,106 @@
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+import pytest
+from flask import template_rendered
+
+from conftest import add_artist, add_show, add_venue, count_queries, fyyur
+
+START = datetime.now().replace(microsecond=0) + timedelta(days=7)
+
+
+@pytest.fixture
+def ids(app):
+    venue, artist = add_venue('Old Hall'), add_artist('Brass Band')
+    fyyur.db.session.flush()
+    add_show(venue, artist, START)
+    fyyur.db.session.commit()
+    # an hour old, so Last-Modified, to the second, moves on any change
+    hour_ago = datetime.utcnow() - timedelta(hours=1)
+    for model in (fyyur.Venue, fyyur.Artist, fyyur.Show):
+        model.query.update({'updated_at': hour_ago})
+    fyyur.db.session.commit()
+    return {'venue': venue.id, 'artist': artist.id}
+
+
+@contextmanager
+def rendered_templates(app):
+    names = []
+
+    def record(sender, template, context, **extra):
+        names.append(template.name)
+    template_rendered.connect(record, app)
+    try:
+        yield names
+    finally:
+        template_rendered.disconnect(record, app)
+
+
+def validators(client, url):
+    response = client.get(url)
+    assert response.status_code == 200
+    return response.get_etag()[0], response.last_modified
+
+
+@pytest.mark.parametrize('url', ['/venues/{venue}', '/artists/{artist}'])
+@pytest.mark.parametrize('header', ['If-None-Match', 'If-Modified-Since'])
+def test_an_unchanged_page_is_not_modified(app, client, ids, url, header):
+    url = url.format(**ids)
+    first = client.get(url)
+    value = first.headers['ETag' if header == 'If-None-Match' else
+                          'Last-Modified']
+    with count_queries() as statements, rendered_templates(app) as templates:
+        response = client.get(url, headers={header: value})
+    assert response.status_code == 304
+    assert response.data == b''
+    # only the validators' aggregate, and no template
+    assert len(statements) == 1, statements
+    assert templates == []
+
+
+def test_a_stale_etag_gets_the_page(client, ids):
+    url = '/venues/{venue}'.format(**ids)
+    response = client.get(url, headers={'If-None-Match': '"stale"'})
+    assert response.status_code == 200
+    assert b'Old Hall' in response.data
+    assert response.get_etag()[0] != 'stale'
+
+
+def assert_changed(client, url, before):
+    etag, last_modified = validators(client, url)
+    assert etag != before[0]
+    assert last_modified > before[1]
+    response = client.get(url, headers={'If-None-Match': '"{}"'.format(
+        before[0])})
+    assert response.status_code == 200
+
+
+def test_adding_a_show_changes_both_pages(client, ids):
+    urls = ['/venues/{venue}'.format(**ids), '/artists/{artist}'.format(**ids)]
+    before = [validators(client, url) for url in urls]
+    add_show(fyyur.Venue.query.get(ids['venue']),
+             fyyur.Artist.query.get(ids['artist']), START + timedelta(days=1))
+    fyyur.db.session.commit()
+    for url, old in zip(urls, before):
+        assert_changed(client, url, old)
+
+
+def test_renaming_the_counterpart_changes_the_page(client, ids):
+    url = '/venues/{venue}'.format(**ids)
+    before = validators(client, url)
+    fyyur.Artist.query.get(ids['artist']).name = 'Wind Band'
+    fyyur.db.session.commit()
+    assert_changed(client, url, before)
+    assert b'Wind Band' in client.get(url).data
+
+
+def test_editing_the_genres_changes_the_page(client, ids):
+    url = '/venues/{venue}'.format(**ids)
+    before = validators(client, url)
+    client.post(url + '/edit', data={
+        'name': 'Old Hall', 'city': 'San Francisco', 'state': 'CA',
+        'address': '1 Main St', 'phone': '123-123-1234', 'genres': ['Folk'],
+        'facebook_link': '', 'website': '',
+        'image_link': 'https://example.com/v.jpg'}, follow_redirects=True)
+    assert_changed(client, url, before)
+    assert b'Folk' in client.get(url).data
@@ -0,0 +1,134 @@
+import threading
+from datetime import datetime, timedelta
+
+from conftest import add_artist, add_venue, fyyur
+
+THREADS = 8
+SHOWS_PER_THREAD = 25
+
+
+def worker(number, venue_ids, artist_ids, errors):
+    # every thread has an app context, and so a session, of its own
+    try:
+        with fyyur.app.app_context():
+            now = datetime.now()
+            created = []
+            for i in range(SHOWS_PER_THREAD):
+                start = now + timedelta(days=(i % 3 - 1) * 30,
+                                        hours=number * 100 + i)
+                show = fyyur.Show(venue_id=venue_ids[i % len(venue_ids)],
+                                  artist_id=artist_ids[number % len(artist_ids)],
+                                  start_time=start,
+                                  end_time=start + timedelta(hours=1),
+                                  upcoming=start > now)
+                fyyur.db.session.add(show)
+                fyyur.db.session.commit()
+                created.append(show.id)
+                if i % 4 == 3:
+                    fyyur.db.session.delete(fyyur.Show.query.get(created.pop(0)))
+                    fyyur.db.session.commit()
+            fyyur.db.session.remove()
+    except Exception as e:  # reported by the test thread
+        errors.append(e)
+
+
+def test_counters_match_the_shows_after_concurrent_writes(app):
+    venues = [add_venue('Venue {}'.format(i)) for i in range(3)]
+    artists = [add_artist('Artist {}'.format(i)) for i in range(3)]
+    fyyur.db.session.commit()
+    venue_ids = [venue.id for venue in venues]
+    artist_ids = [artist.id for artist in artists]
+    errors = []
+    threads = [threading.Thread(target=worker,
+                                args=(i, venue_ids, artist_ids, errors))
+               for i in range(THREADS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert not errors, errors
+    fyyur.db.session.expire_all()
+    Show = fyyur.Show
+    assert Show.query.count() == THREADS * (
+        SHOWS_PER_THREAD - SHOWS_PER_THREAD // 4)
+    for model, column in ((fyyur.Venue, Show.venue_id),
+                          (fyyur.Artist, Show.artist_id)):
+        for entity in model.query:
+            shows = Show.query.filter(column == entity.id)
+            assert entity.upcoming_shows_count == shows.filter(
+                Show.upcoming.is_(True)).count()
+            assert entity.past_shows_count == shows.filter(
+                Show.upcoming.is_(False)).count()
+
+
+def test_rollover_moves_started_shows_to_the_past_counters(app):
+    venue, artist = add_venue(), add_artist()
+    fyyur.db.session.flush()
+    now = datetime.now()
+    # booked while upcoming; the first has started since
+    for start in (now - timedelta(minutes=5), now + timedelta(days=1)):
+        fyyur.db.session.add(fyyur.Show(
+            venue_id=venue.id, artist_id=artist.id, start_time=start,
+            end_time=start + timedelta(hours=1), upcoming=True))
+    fyyur.db.session.commit()
+    assert (venue.upcoming_shows_count, venue.past_shows_count) == (2, 0)
+
+    assert fyyur.rollover_shows() == 1
+    fyyur.db.session.expire_all()
+    for entity in (venue, artist):
+        assert (entity.upcoming_shows_count, entity.past_shows_count) == (1, 1)
+    assert fyyur.rollover_shows() == 0
+    fyyur.db.session.expire_all()
+    assert (artist.upcoming_shows_count, artist.past_shows_count) == (1, 1)
+
+
+def test_reconcile_fixes_drifted_counters_and_reports_them(app, tmp_path,
+                                                           monkeypatch):
+    monkeypatch.setitem(app.config, 'RECONCILE_CHECKPOINT',
+                        str(tmp_path / 'checkpoint.json'))
+    venues = [add_venue('Venue {}'.format(i)) for i in range(3)]
+    artist = add_artist()
+    fyyur.db.session.flush()
+    now = datetime.now()
+    for i, venue in enumerate(venues):
+        for start in (now - timedelta(days=i + 1), now + timedelta(days=i + 1)):
+            fyyur.db.session.add(fyyur.Show(
+                venue_id=venue.id, artist_id=artist.id, start_time=start,
+                end_time=start + timedelta(hours=1), upcoming=start > now))
+    fyyur.db.session.commit()
+    table = fyyur.Venue.__table__
+    fyyur.db.session.execute(table.update().where(
+        table.c.id == venues[0].id).values(upcoming_shows_count=5))
+    fyyur.db.session.execute(table.update().where(
+        table.c.id == venues[2].id).values(past_shows_count=None))
+    fyyur.db.session.execute(fyyur.Artist.__table__.update().values(
+        upcoming_shows_count=0, past_shows_count=0))
+    fyyur.db.session.commit()
+    runner = app.test_cli_runner()
+
+    result = runner.invoke(args=['reconcile-counters', '--dry-run'])
+    assert result.exit_code == 0, result.output
+    assert 'Venue {}: upcoming 5 -> 1, past 1 -> 1'.format(venues[0].id) \
+        in result.output
+    assert 'Venue {}: upcoming 1 -> 1, past 0 -> 1'.format(venues[2].id) \
+        in result.output
+    assert 'Venue: 2 rows would change' in result.output
+    assert 'Artist: 1 rows would change' in result.output
+    fyyur.db.session.expire_all()
+    assert venues[0].upcoming_shows_count == 5
+
+    result = runner.invoke(args=['reconcile-counters', '--batch-size', '2'])
+    assert result.exit_code == 0, result.output
+    assert 'Venue: 2 rows differed, 2 fixed' in result.output
+    assert 'Artist: 1 rows differed, 1 fixed' in result.output
+    fyyur.db.session.expire_all()
+    for entity in venues + [artist]:
+        shows = fyyur.Show.query.filter(
+            (fyyur.Show.venue_id if entity in venues else
+             fyyur.Show.artist_id) == entity.id)
+        assert (entity.upcoming_shows_count, entity.past_shows_count) == (
+            shows.filter_by(upcoming=True).count(),
+            shows.filter_by(upcoming=False).count())
+    assert not (tmp_path / 'checkpoint.json').exists()
+    result = runner.invoke(args=['reconcile-counters'])
+    assert 'Venue: 0 rows differed, 0 fixed' in result.output
@@ -0,0 +1,54 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from conftest import add_artist, add_show, add_venue, count_queries, fyyur
+
+# the validators' aggregate, then the entity with its genres and its shows
+DETAIL_QUERIES = 3
+
+
+def seed_shows(shows):
+    """A venue and an artist with shows past and upcoming shows, every
+    other one with a counterpart of its own."""
+    venue, artist = add_venue(), add_artist()
+    venue.genres = fyyur.genres_from_names(['Rock n Roll', 'Jazz'])
+    artist.genres = fyyur.genres_from_names(['Jazz', 'Blues', 'Folk'])
+    fyyur.db.session.flush()
+    now = datetime.now()
+    for i in range(shows):
+        other_venue = add_venue('Venue {}'.format(i))
+        other_artist = add_artist('Artist {}'.format(i))
+        fyyur.db.session.flush()
+        for days in (-i - 1, i + 1):
+            start = now + timedelta(days=days)
+            add_show(venue, other_artist if i % 2 else artist, start)
+            add_show(other_venue if i % 2 else venue, artist,
+                     start + timedelta(hours=3))
+    fyyur.db.session.commit()
+    return venue.id, artist.id
+
+
+@pytest.mark.parametrize('shows', [1, 10, 50])
+@pytest.mark.parametrize('page', ['/venues/{venue}', '/artists/{artist}'])
+def test_detail_page_query_count_is_fixed(client, page, shows):
+    venue_id, artist_id = seed_shows(shows)
+    url = page.format(venue=venue_id, artist=artist_id)
+    with count_queries() as statements:
+        response = client.get(url)
+    assert response.status_code == 200
+    assert len(statements) == DETAIL_QUERIES, statements
+
+
+@pytest.mark.parametrize('model', ['venue', 'artist'])
+def test_detail_page_lists_every_show(app, model):
+    venue_id, artist_id = seed_shows(10)
+    if model == 'venue':
+        data = fyyur.serialize_entity(fyyur.Venue, venue_id)
+    else:
+        data = fyyur.serialize_entity(fyyur.Artist, artist_id)
+    assert data['genres'] == (['Jazz', 'Rock n Roll'] if model == 'venue'
+                              else ['Blues', 'Folk', 'Jazz'])
+    # two shows a side on even days, one on odd days
+    assert data['past_shows_count'] == len(data['past_shows']) == 15
+    assert data['upcoming_shows_count'] == len(data['upcoming_shows']) == 15
@@ -0,0 +1,165 @@
+import io
+import json
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from conftest import add_artist, add_show, add_venue, fyyur
+
+
+def seed():
+    links = {'website': 'https://example.com',
+             'facebook_link': 'https://www.facebook.com/example'}
+    venues = [add_venue('Venue {}'.format(i), **links) for i in range(3)]
+    artists = [add_artist('Artist {}'.format(i), **links) for i in range(3)]
+    fyyur.db.session.flush()
+    jazz = fyyur.Genre(name='Jazz')
+    for entity in venues + artists:
+        entity.genres = [jazz]
+    start = datetime.now().replace(microsecond=123456)
+    for i in range(6):
+        add_show(venues[i % 3], artists[i % 3],
+                 start + timedelta(days=i * 10 - 25, minutes=i), hours=1 + i)
+    fyyur.db.session.commit()
+
+
+def snapshot():
+    return {
+        'venues': sorted(fyyur.db.session.query(
+            fyyur.Venue.id, fyyur.Venue.name, fyyur.Venue.city,
+            fyyur.Venue.upcoming_shows_count, fyyur.Venue.past_shows_count)),
+        'artists': sorted(fyyur.db.session.query(
+            fyyur.Artist.id, fyyur.Artist.name, fyyur.Artist.state)),
+        'shows': sorted(fyyur.db.session.query(
+            fyyur.Show.venue_id, fyyur.Show.artist_id, fyyur.Show.start_time,
+            fyyur.Show.end_time, fyyur.Show.upcoming)),
+    }
+
+
+@pytest.mark.parametrize('format', ['csv', 'jsonl'])
+def test_export_reads_back_with_import(app, tmp_path, format):
+    seed()
+    before = snapshot()
+    runner = app.test_cli_runner()
+    paths = {}
+    for entity in ('venues', 'artists', 'shows'):
+        paths[entity] = str(tmp_path / '{}.{}'.format(entity, format))
+        result = runner.invoke(args=['export', entity, '--format', format,
+                                     '--output', paths[entity]])
+        assert result.exit_code == 0, result.output
+    fyyur.db.session.remove()
+    fyyur.db.drop_all()
+    fyyur.db.create_all()
+    for entity in ('venues', 'artists', 'shows'):
+        result = runner.invoke(args=['import', entity, paths[entity]])
+        assert result.exit_code == 0, result.output
+        assert result.output.startswith('{} inserted, 0 rejected'.format(
+            len(before[entity]))), result.output
+    assert snapshot() == before
+
+
+def test_export_since_takes_offsets_into_account(client):
+    venues = [add_venue('Venue {}'.format(i)) for i in range(3)]
+    fyyur.db.session.flush()
+    # updated_at is naive UTC
+    for venue, stamp in zip(venues, (datetime(2024, 1, 1, 0, 0),
+                                     datetime(2023, 12, 31, 23, 0),
+                                     datetime(2023, 12, 31, 21, 0))):
+        fyyur.db.session.execute(fyyur.Venue.__table__.update().where(
+            fyyur.Venue.id == venue.id).values(updated_at=stamp))
+    fyyur.db.session.commit()
+
+    def exported(since):
+        response = client.get('/export/venues.jsonl',
+                              query_string={'since': since})
+        assert response.status_code == 200
+        return [json.loads(line)['name']
+                for line in response.data.decode('utf-8').splitlines()]
+    # 22:00 UTC
+    assert exported('2024-01-01T00:00:00+02:00') == ['Venue 1', 'Venue 0']
+    assert exported('2023-12-31T22:00:00Z') == ['Venue 1', 'Venue 0']
+    assert exported('2023-12-31T22:00:00') == ['Venue 1', 'Venue 0']
+    assert exported('2023-12-31T20:00:00-02:00') == ['Venue 1', 'Venue 0']
+    assert exported('2024-01-01T00:00:00') == ['Venue 0']
+    assert client.get('/export/venues.jsonl?since=soon').status_code == 400
+
+
+def test_export_rows_reject_an_aware_since(app):
+    since = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    with pytest.raises(ValueError, match='naive UTC'):
+        list(fyyur.export_rows(fyyur.Venue, since))
+
+
+def test_jsonl_export_writes_iso_datetimes(client):
+    seed()
+    line = client.get('/export/shows.jsonl').data.decode('utf-8').split(
+        '\n')[0]
+    show = json.loads(line)
+    assert datetime.fromisoformat(show['start_time']) == \
+        fyyur.Show.query.get(show['id']).start_time
+
+
+def upload(client, entity, text):
+    response = client.post('/import/' + entity, data={
+        'file': (io.BytesIO(text.encode('utf-8')), entity + '.csv')})
+    assert response.status_code == 200
+    return response.get_json()
+
+
+VENUE_HEADER = 'id,name,city,state,address,phone,genres,website,facebook_link\n'
+
+
+def venue_line(venue_id, name):
+    return '{},{},Austin,TX,1 Main St,123-123-1234,Jazz,https://example.com,' \
+        'https://www.facebook.com/example\n'.format(venue_id, name)
+
+
+def test_import_rejects_ids_that_are_not_integers(client):
+    result = upload(client, 'venues', VENUE_HEADER + venue_line('abc', 'A') +
+                    venue_line('-3', 'B') + venue_line('', 'C') +
+                    venue_line('7', 'D'))
+    assert (result['inserted'], result['rejected']) == (2, 2)
+    assert [error['errors'] for error in result['errors']] == \
+        [{'id': ['must be a positive integer']}] * 2
+    assert sorted(fyyur.db.session.query(fyyur.Venue.name)) == [('C',), ('D',)]
+    assert fyyur.Venue.query.filter_by(name='D').one().id == 7
+
+
+def test_import_rejects_ids_already_taken(client, monkeypatch):
+    monkeypatch.setitem(fyyur.app.config, 'IMPORT_CHUNK_SIZE', 2)
+    add_venue('Stored')
+    fyyur.db.session.commit()
+    stored = fyyur.Venue.query.one().id
+    result = upload(client, 'venues', VENUE_HEADER + venue_line(stored, 'A') +
+                    venue_line(50, 'B') + venue_line(51, 'C') +
+                    venue_line(50, 'D') + venue_line(51, 'E') +
+                    venue_line(52, 'F'))
+    assert (result['inserted'], result['rejected']) == (3, 3)
+    assert [(error['line'], error['errors']) for error in result['errors']] == [
+        (2, {'id': ['venue {} already exists'.format(stored)]}),
+        (5, {'id': ['venue 50 already exists']}),
+        (6, {'id': ['venue 51 already exists']})]
+    assert sorted(fyyur.db.session.query(fyyur.Venue.id, fyyur.Venue.name)) \
+        == [(stored, 'Stored'), (50, 'B'), (51, 'C'), (52, 'F')]
+
+
+def test_import_rejects_only_the_rows_another_writer_took(client, monkeypatch):
+    # the ids are free when checked and taken by the time they are inserted
+    real_chunk = fyyur.import_entity_chunk
+
+    def racing_chunk(model, records):
+        if len(records) > 1:
+            fyyur.db.session.execute(model.__table__.insert(), [{
+                'id': 61, 'name': 'Elsewhere', 'city': 'Austin', 'state': 'TX',
+                'address': '2 Main St', 'phone': '123-123-1234',
+                'updated_at': datetime.utcnow()}])
+            fyyur.db.session.commit()
+        return real_chunk(model, records)
+    monkeypatch.setattr(fyyur, 'import_entity_chunk', racing_chunk)
+    result = upload(client, 'venues', VENUE_HEADER + venue_line(60, 'A') +
+                    venue_line(61, 'B') + venue_line(62, 'C'))
+    assert (result['inserted'], result['rejected']) == (2, 1)
+    assert result['errors'] == [
+        {'line': 3, 'errors': {'id': ['conflicts with a stored row']}}]
+    assert sorted(fyyur.db.session.query(fyyur.Venue.id, fyyur.Venue.name)) \
+        == [(60, 'A'), (61, 'Elsewhere'), (62, 'C')]
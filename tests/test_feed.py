@@ -0,0 +1,93 @@
+import multiprocessing
+from datetime import datetime, timedelta
+
+import pytest
+
+from conftest import count_queries, fyyur
+from feed import HomeFeed
+
+PROCESSES = 4
+SHOWS_PER_PROCESS = 10
+
+
+def empty_feed(size, shows):
+    return {'venues': [], 'artists': [], 'shows': [], 'more_shows': False}
+
+
+def add_shows(path, number):
+    # a process of its own, with a feed object of its own
+    feed = HomeFeed(path, empty_feed, size=100)
+    start = datetime(2030, 1, 1)
+    for i in range(SHOWS_PER_PROCESS):
+        show_id = number * SHOWS_PER_PROCESS + i + 1
+        feed.show_added({'id': show_id, 'venue_id': 1, 'artist_id': 1,
+                         'start_time': start + timedelta(hours=show_id)})
+
+
+def test_processes_sharing_the_feed_keep_each_others_changes(tmp_path):
+    path = str(tmp_path / 'feed.json')
+    HomeFeed(path, empty_feed, size=100).invalidate()
+    context = multiprocessing.get_context('fork')
+    processes = [context.Process(target=add_shows, args=(path, i))
+                 for i in range(PROCESSES)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+        assert process.exitcode == 0
+    _, _, shows = HomeFeed(path, empty_feed, size=100).get(datetime(2029, 1, 1))
+    assert sorted(show['id'] for show in shows) == list(
+        range(1, PROCESSES * SHOWS_PER_PROCESS + 1))
+
+
+FORMS = {
+    'venues': {'city': 'Austin', 'state': 'TX', 'address': '1 Main St',
+               'phone': '123-123-1234', 'genres': ['Jazz'], 'image_link': '',
+               'facebook_link': '', 'website': ''},
+    'artists': {'city': 'Austin', 'state': 'TX', 'phone': '123-123-1234',
+                'genres': ['Jazz'], 'image_link': '', 'facebook_link': '',
+                'website': ''},
+}
+
+
+@pytest.fixture(params=['eager', 'worker', 'no worker'])
+def jobs_mode(request, app, monkeypatch):
+    if request.param != 'eager':
+        monkeypatch.setitem(app.config, 'JOBS_EAGER', False)
+    return request.param
+
+
+def home(client, jobs_mode):
+    if jobs_mode == 'worker':
+        fyyur.jobs.run_due()
+    with count_queries() as statements:
+        page = client.get('/').get_data(as_text=True)
+    if jobs_mode != 'no worker':
+        # the jobs brought the feed up to date; only its version is read
+        assert len(statements) == 1, statements
+    return page
+
+
+def tile(name):
+    # the tile's link, not the flashed message naming the entity
+    return '>{}</a>'.format(name)
+
+
+@pytest.mark.parametrize('section', ['venues', 'artists'])
+def test_the_home_page_follows_writes(client, jobs_mode, section):
+    model = fyyur.HOME_FEED_MODELS[section]
+    client.get('/')  # builds the feed
+
+    client.post('/{}/create'.format(section),
+                data=dict(FORMS[section], name='Blue Note'))
+    assert tile('Blue Note') in home(client, jobs_mode)
+    entity_id = model.query.one().id
+
+    client.post('/{}/{}/edit'.format(section, entity_id),
+                data=dict(FORMS[section], name='Green Note'))
+    page = home(client, jobs_mode)
+    assert tile('Green Note') in page and tile('Blue Note') not in page
+
+    client.post('/{}/delete'.format(section),
+                data={section[:-1] + '_id': entity_id})
+    assert tile('Green Note') not in home(client, jobs_mode)
@@ -0,0 +1,33 @@
+from datetime import datetime, timedelta, timezone
+
+import babel.dates
+import pytest
+
+from conftest import fyyur
+
+# the patterns the filter used to hand babel on every call
+PATTERNS = {'full': "EEEE MMMM, d, y 'at' h:mma",
+            'medium': "EE MM, dd, y h:mma"}
+MOMENT = datetime(2024, 3, 9, 21, 5, 7, 123456)
+
+
+@pytest.mark.parametrize('format', ['full', 'medium', 'long', 'short',
+                                    'yyyy-MM-dd HH:mm'])
+@pytest.mark.parametrize('value', [
+    MOMENT,
+    MOMENT.replace(tzinfo=timezone.utc),
+    MOMENT.replace(tzinfo=timezone(timedelta(hours=-7))),
+    MOMENT.replace(tzinfo=timezone(timedelta(hours=5, minutes=30))),
+])
+def test_datetime_filter_matches_babel(value, format):
+    expected = babel.dates.format_datetime(value, PATTERNS.get(format, format))
+    assert fyyur.format_datetime(value, format) == expected
+    assert fyyur.format_datetime(value.isoformat(), format) == expected
+
+
+def test_same_instant_at_another_offset_is_not_served_from_the_cache():
+    utc = MOMENT.replace(tzinfo=timezone.utc)
+    local = utc.astimezone(timezone(timedelta(hours=2)))
+    assert utc == local
+    assert fyyur.format_datetime(utc) == 'Sat 03, 09, 2024 9:05PM'
+    assert fyyur.format_datetime(local) == 'Sat 03, 09, 2024 11:05PM'
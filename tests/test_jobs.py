@@ -0,0 +1,16 @@
+from conftest import fyyur
+
+
+def test_eager_jobs_are_only_the_ones_the_request_queued(app):
+    jobs = fyyur.jobs
+    jobs.enqueue('home_feed.rebuild', key='queued elsewhere')
+    fyyur.db.session.commit()
+    with app.test_request_context():
+        jobs.enqueue('home_feed.rebuild', key='queued here')
+        fyyur.db.session.commit()
+        jobs._run_eager(None)
+    table = jobs.table
+    statuses = dict(fyyur.db.session.execute(
+        table.select().with_only_columns([table.c.idempotency_key,
+                                          table.c.status])).fetchall())
+    assert statuses == {'queued elsewhere': 'queued', 'queued here': 'done'}
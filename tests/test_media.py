@@ -0,0 +1,35 @@
+import socket
+
+import pytest
+
+import media
+from conftest import fyyur
+
+
+def test_a_host_rebinding_to_an_internal_address_is_not_fetched(monkeypatch):
+    answers = iter(['93.184.216.34', '127.0.0.1'])
+
+    def getaddrinfo(host, port, *args):
+        # public when checked, internal when connected to
+        return [(socket.AF_INET, socket.SOCK_STREAM, 6, '',
+                 (next(answers), port))]
+    monkeypatch.setattr(media.socket, 'getaddrinfo', getaddrinfo)
+    with pytest.raises(ValueError, match='not a public host'):
+        media.fetch_image('http://rebinding.example/a.jpg', 1024, 1)
+
+
+def test_uncached_remote_images_are_not_looked_up_on_every_render(
+        app, monkeypatch):
+    assets = fyyur.assets
+    opened = []
+    real_open = open
+
+    def counting_open(path, *args, **kwargs):
+        opened.append(path)
+        return real_open(path, *args, **kwargs)
+    monkeypatch.setattr('builtins.open', counting_open)
+    url = 'https://example.com/not-cached.jpg'
+    assets._missing.pop(url, None)
+    for _ in range(3):
+        assert 'src="{}"'.format(url) in assets.image_tag(url)
+    assert opened == [assets._remote_path(url)]
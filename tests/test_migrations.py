@@ -0,0 +1,84 @@
+import importlib.util
+import os
+from datetime import datetime, timedelta
+
+import sqlalchemy as sa
+from alembic.migration import MigrationContext
+from alembic.operations import Operations
+
+from conftest import ROOT
+
+
+def load_migration(name):
+    path = os.path.join(ROOT, 'migrations', 'versions', name + '.py')
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def run(connection, function):
+    with Operations.context(MigrationContext.configure(connection)):
+        function()
+
+
+def test_updated_at_migration_runs_on_sqlite_and_backfills_utc(tmp_path):
+    migration = load_migration('c8a4e1f7b390_updated_at_timestamps')
+    engine = sa.create_engine('sqlite:///' + str(tmp_path / 'm.db'))
+    with engine.connect() as connection:
+        for table in ('Venue', 'Artist', 'shows'):
+            connection.execute('CREATE TABLE "{}" (id INTEGER PRIMARY KEY)'
+                               .format(table))
+            connection.execute('INSERT INTO "{}" (id) VALUES (1)'.format(table))
+        run(connection, migration.upgrade)
+        for table in ('Venue', 'Artist', 'shows'):
+            stamp, = connection.execute(
+                'SELECT updated_at FROM "{}"'.format(table)).fetchone()
+            stamp = datetime.strptime(stamp, '%Y-%m-%d %H:%M:%S')
+            assert abs(stamp - datetime.utcnow()) < timedelta(minutes=1)
+            column, = [column for column in sa.inspect(connection).get_columns(
+                table) if column['name'] == 'updated_at']
+            assert not column['nullable']
+
+
+def test_genre_migration_maps_legacy_names_onto_the_form_genres(tmp_path):
+    migration = load_migration('b5f0c3d9e612_normalize_genres')
+    engine = sa.create_engine('sqlite:///' + str(tmp_path / 'm.db'))
+    with engine.connect() as connection:
+        for table in ('Venue', 'Artist'):
+            connection.execute('CREATE TABLE "{}" (id INTEGER PRIMARY KEY, '
+                               'genres VARCHAR)'.format(table))
+        connection.execute('INSERT INTO "Venue" VALUES '
+                           "(1, 'Jazz,hip hop, Polka'), (2, NULL)")
+        connection.execute('INSERT INTO "Artist" VALUES '
+                           "(1, 'rock n roll,Krautrock,Schlager')")
+        run(connection, migration.upgrade)
+        genres = [name for name, in connection.execute(
+            'SELECT name FROM genres ORDER BY id')]
+        assert genres == migration.GENRES
+
+        def linked(association, key):
+            return connection.execute(
+                'SELECT {0}, name FROM {1} JOIN genres ON genres.id = genre_id '
+                'ORDER BY {0}, name'.format(key, association)).fetchall()
+        assert linked('venue_genres', 'venue_id') == [
+            (1, 'Hip-Hop'), (1, 'Jazz'), (1, 'Other')]
+        assert linked('artist_genres', 'artist_id') == [
+            (1, 'Other'), (1, 'Rock n Roll')]
+
+
+def test_overlapping_shows_are_listed_before_the_exclusion_constraints(tmp_path):
+    migration = load_migration('e7a3c5b8d914_show_end_time')
+    engine = sa.create_engine('sqlite:///' + str(tmp_path / 'm.db'))
+    with engine.connect() as connection:
+        connection.execute('CREATE TABLE shows (id INTEGER PRIMARY KEY, '
+                           'venue_id INTEGER, artist_id INTEGER, '
+                           'start_time DATETIME, end_time DATETIME)')
+        for row in [(1, 1, 1, '2030-01-01 20:00', '2030-01-01 22:00'),
+                    (2, 1, 2, '2030-01-01 21:00', '2030-01-01 23:00'),
+                    (3, 1, 3, '2030-01-01 22:00', '2030-01-02 00:00'),
+                    (4, 2, 1, '2030-01-02 20:00', '2030-01-02 22:00')]:
+            connection.execute('INSERT INTO shows VALUES (?, ?, ?, ?, ?)', row)
+        assert migration.overlapping_shows(connection, 'venue_id') == [
+            (1, 2), (2, 3)]
+        assert migration.overlapping_shows(connection, 'artist_id') == []
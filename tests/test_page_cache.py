@@ -0,0 +1,105 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from cache import MemoryBackend, TaggedCache
+from conftest import add_artist, add_show, add_venue, fyyur
+
+PAGES = ('/venues/{venue}', '/artists/{artist}', '/shows', '/venues',
+         '/artists', '/venues/{other}')
+START = datetime.now().replace(microsecond=0) + timedelta(days=7)
+
+
+@pytest.fixture
+def client(app, monkeypatch):
+    monkeypatch.setattr(fyyur, 'response_cache',
+                        TaggedCache(MemoryBackend()))
+    return app.test_client()
+
+
+@pytest.fixture
+def ids(client):
+    venue, other = add_venue('Old Hall'), add_venue('Other Room')
+    artist = add_artist('Brass Band')
+    fyyur.db.session.flush()
+    add_show(venue, artist, START)
+    fyyur.db.session.commit()
+    ids = {'venue': venue.id, 'other': other.id, 'artist': artist.id}
+    for page in PAGES:
+        assert client.get(page.format(**ids)).status_code == 200
+    return ids
+
+
+def rename_unseen(model, entity_id, name):
+    # a write the views are not told about, so cached pages keep the old name
+    model.query.filter_by(id=entity_id).update({'name': name})
+    fyyur.db.session.commit()
+
+
+def page(client, path, ids):
+    response = client.get(path.format(**ids))
+    return response.status_code, response.get_data(as_text=True)
+
+
+def assert_other_venue_still_cached(client, ids):
+    rename_unseen(fyyur.Venue, ids['other'], 'Renamed Behind The Cache')
+    assert 'Other Room' in page(client, '/venues/{other}', ids)[1]
+
+
+def test_pages_are_served_from_the_cache(client, ids):
+    rename_unseen(fyyur.Venue, ids['venue'], 'Unseen Hall')
+    for path in ('/venues/{venue}', '/artists/{artist}', '/shows', '/venues'):
+        body = page(client, path, ids)[1]
+        assert 'Old Hall' in body and 'Unseen Hall' not in body
+
+
+def test_editing_a_venue_rerenders_the_pages_showing_it(client, ids):
+    response = client.post('/venues/{venue}/edit'.format(**ids), data={
+        'name': 'New Hall', 'city': 'San Francisco', 'state': 'CA',
+        'address': '1 Main St', 'phone': '123-123-1234', 'genres': ['Jazz'],
+        'facebook_link': '', 'website': '',
+        'image_link': 'https://example.com/v.jpg'}, follow_redirects=True)
+    assert response.status_code == 200
+    for path in ('/venues/{venue}', '/artists/{artist}', '/shows', '/venues'):
+        body = page(client, path, ids)[1]
+        assert 'New Hall' in body and 'Old Hall' not in body, path
+    assert 'Jazz' in page(client, '/venues/{venue}', ids)[1]
+    assert_other_venue_still_cached(client, ids)
+
+
+def test_adding_a_show_rerenders_the_pages_listing_it(client, ids):
+    newcomer = add_artist('Newcomer')
+    fyyur.db.session.commit()
+    ids['newcomer'] = newcomer.id
+    response = client.post('/shows/create', data={
+        'venue_id': ids['venue'], 'artist_id': newcomer.id, 'duration': 120,
+        'start_time': (START + timedelta(days=1)).strftime(
+            '%Y-%m-%d %H:%M:%S')}, follow_redirects=True)
+    assert b'Show was successfully listed!' in response.data
+    for path in ('/venues/{venue}', '/shows'):
+        assert 'Newcomer' in page(client, path, ids)[1], path
+    assert 'Old Hall' in page(client, '/artists/{newcomer}', ids)[1]
+    assert_other_venue_still_cached(client, ids)
+
+
+def test_deleting_a_venue_rerenders_the_pages_listing_it(client, ids):
+    response = client.post('/venues/delete', data={'venue_id': ids['venue']},
+                           follow_redirects=True)
+    assert b'Venue Old Hall was successfully deleted!' in response.data
+    assert page(client, '/venues/{venue}', ids)[0] == 404
+    for path in ('/artists/{artist}', '/shows', '/venues'):
+        status, body = page(client, path, ids)
+        assert status == 200 and 'Old Hall' not in body, path
+    assert_other_venue_still_cached(client, ids)
+
+
+def test_deleting_an_artist_rerenders_the_pages_listing_it(client, ids):
+    response = client.post('/artists/delete',
+                           data={'artist_id': ids['artist']},
+                           follow_redirects=True)
+    assert b'Artist Brass Band was successfully deleted!' in response.data
+    assert page(client, '/artists/{artist}', ids)[0] == 404
+    for path in ('/venues/{venue}', '/shows', '/artists'):
+        status, body = page(client, path, ids)
+        assert status == 200 and 'Brass Band' not in body, path
+    assert_other_venue_still_cached(client, ids)
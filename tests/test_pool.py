@@ -0,0 +1,91 @@
+import threading
+import time
+
+import pytest
+import sqlalchemy as sa
+
+from conftest import fyyur
+from dbpool import PoolMonitor, TimedQueuePool, engine_options
+
+
+@pytest.fixture
+def engine(tmp_path):
+    config = {'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + str(tmp_path / 'p.db'),
+              'DB_POOL_SIZE': 1, 'DB_MAX_OVERFLOW': 0, 'DB_POOL_TIMEOUT': 0.2,
+              'DB_POOL_RECYCLE': 1800, 'DB_POOL_PRE_PING': False}
+    engine = sa.create_engine(config['SQLALCHEMY_DATABASE_URI'],
+                              **engine_options(config))
+    yield engine
+    engine.dispose()
+
+
+def test_checkouts_that_wait_for_a_connection_are_timed(engine):
+    assert isinstance(engine.pool, TimedQueuePool)
+    monitor = PoolMonitor()
+    monitor.watch(engine)
+    held = engine.connect()
+    waited = []
+
+    def checkout():
+        with engine.connect():
+            waited.append(True)
+    thread = threading.Thread(target=checkout)
+    thread.start()
+    time.sleep(0.1)
+    held.close()
+    thread.join()
+    assert waited
+    waits = engine.pool.waits.as_dict()
+    assert waits['count'] == 2
+    assert waits['max_ms'] >= 50
+    assert waits['timeouts'] == 0
+
+    held = engine.connect()
+    with pytest.raises(sa.exc.TimeoutError):
+        engine.connect()
+    held.close()
+    waits = engine.pool.waits.as_dict()
+    assert (waits['count'], waits['timeouts']) == (4, 1)
+    assert waits['max_ms'] >= 150
+
+    stats = monitor.stats()
+    assert (stats['checkouts'], stats['checkins'], stats['checked_out']) == \
+        (3, 3, 0)
+    assert stats['peak_checked_out'] == 1
+    pool, = stats['pools']
+    assert (pool['size'], pool['max_overflow'], pool['wait']['timeouts']) == \
+        (1, 0, 1)
+
+
+def test_waits_survive_the_pool_being_recreated(engine):
+    engine.connect().close()
+    waits = engine.pool.waits
+    engine.dispose()
+    assert engine.pool.waits is waits
+    engine.connect().close()
+    assert waits.count == 2
+
+
+def test_debug_pool_reports_this_process_when_enabled(client, monkeypatch):
+    monkeypatch.setitem(fyyur.app.config, 'POOL_METRICS_ENABLED', False)
+    assert client.get('/debug/pool').status_code == 404
+
+    monkeypatch.setitem(fyyur.app.config, 'POOL_METRICS_ENABLED', True)
+    response = client.get('/debug/pool')
+    assert response.status_code == 200
+    data = response.get_json()
+    assert set(data) >= {'checked_out', 'peak_checked_out', 'checkouts',
+                         'checkins', 'connects', 'invalidations', 'pools',
+                         'replicas'}
+    assert data['replicas'] == []
+    pool = data['pools'][0]
+    assert pool['class'] == 'TimedQueuePool'
+    assert pool['size'] == fyyur.app.config['DB_POOL_SIZE']
+    assert set(pool['wait']) == {'count', 'total_ms', 'avg_ms', 'max_ms',
+                                 'timeouts'}
+
+
+def test_the_app_engine_is_watched_from_startup(app):
+    # before any request has been handled
+    pools = fyyur.pool_monitor.stats()['pools']
+    assert repr(fyyur.db.engine.url) in [pool['url'] for pool in pools]
@@ -0,0 +1,33 @@
+import threading
+import time
+
+import sqlalchemy as sa
+
+from cache import MemoryBackend, TaggedCache
+from routing import ReplicaSet
+
+
+def test_replicas_are_probed_off_the_request_thread(tmp_path):
+    probed = []
+
+    class Probed(ReplicaSet):
+        def _probe(self, engine):
+            probed.append(threading.current_thread().name)
+            return False, None
+    engine = sa.create_engine('sqlite:///' + str(tmp_path / 'replica.db'))
+    replicas = Probed(lambda key: engine, ['replica_0'], check_interval=0.05)
+    replicas.choose()
+    deadline = time.time() + 5
+    while replicas.choose() is not None and time.time() < deadline:
+        time.sleep(0.01)
+    assert replicas.choose() is None
+    assert set(probed) == {'replica-prober'}
+
+
+def test_recent_invalidations_are_told_apart():
+    cache = TaggedCache(MemoryBackend())
+    assert not cache.changed_within(cache.versions(['venues']), 10)
+    cache.invalidate('venues')
+    assert cache.changed_within(cache.versions(['venues']), 10)
+    old = '{:.3f}:{}'.format(time.time() - 30, 'a0b1c2')
+    assert not cache.changed_within({'venues': old, 'legacy': 'a0b1c2'}, 10)
@@ -0,0 +1,65 @@
+import pytest
+
+from cache import FileBackend, TaggedCache
+from conftest import add_artist, add_venue, fyyur
+
+
+@pytest.fixture
+def enforced(app, monkeypatch):
+    monkeypatch.setitem(app.config, 'PROFILER_ENFORCE_BUDGETS', True)
+    return app
+
+
+@pytest.mark.parametrize('url', ['/venues/search', '/artists/search'])
+def test_first_search_stays_within_its_query_budget(enforced, url):
+    # more rows than one selectinload chunk of genres
+    for i in range(1000):
+        add_venue('Venue {}'.format(i))
+        add_artist('Artist {}'.format(i))
+    fyyur.db.session.commit()
+    client = enforced.test_client()
+    response = client.post(url, data={'search_term': '99'})
+    assert response.status_code == 200
+    assert b'999' in response.data
+
+
+def test_indexes_follow_writes_made_by_other_processes(app, tmp_path,
+                                                       monkeypatch):
+    monkeypatch.setattr(fyyur, 'response_cache',
+                        TaggedCache(FileBackend(str(tmp_path))))
+    # another web process, sharing the cache directory
+    elsewhere = TaggedCache(FileBackend(str(tmp_path)))
+    gone = add_venue('Velvet Room')
+    fyyur.db.session.commit()
+    client = app.test_client()
+
+    def suggested(query):
+        return [venue['name'] for venue in client.get(
+            '/search/suggest?q=' + query).get_json()['venues']]
+    assert suggested('vel') == ['Velvet Room']
+
+    fyyur.db.session.delete(gone)
+    add_venue('Velvet Underground')
+    fyyur.db.session.commit()
+    assert suggested('vel') == ['Velvet Room']  # not told yet
+    elsewhere.invalidate('search:venues')
+    assert suggested('vel') == ['Velvet Underground']
+    response = client.post('/venues/search', data={'search_term': 'velvet'})
+    assert b'Velvet Underground' in response.data
+    assert b'Velvet Room' not in response.data
+
+
+@pytest.mark.parametrize('shared', [False, True])
+def test_imported_names_are_suggested(app, tmp_path, monkeypatch, shared):
+    if shared:
+        monkeypatch.setattr(fyyur, 'response_cache',
+                            TaggedCache(FileBackend(str(tmp_path))))
+    client = app.test_client()
+    assert client.get('/search/suggest?q=imp').get_json()['artists'] == []
+    rows = [(2, {'name': 'Imported Band', 'city': 'Austin', 'state': 'TX',
+                 'phone': '123-123-1234', 'genres': 'Jazz',
+                 'website': 'https://example.com',
+                 'facebook_link': 'https://www.facebook.com/example'})]
+    assert fyyur.import_rows('artists', rows).inserted == 1
+    assert [artist['name'] for artist in client.get(
+        '/search/suggest?q=imp').get_json()['artists']] == ['Imported Band']
@@ -0,0 +1,49 @@
+import random
+import time
+
+import pytest
+
+import seed
+from search import SuggestIndex
+
+
+@pytest.fixture(scope='module')
+def index():
+    rng = random.Random(1)
+    index = SuggestIndex()
+    index.load((i, seed.name(rng, seed.ARTIST_NOUNS, i))
+               for i in range(1, 10001))
+    return index
+
+
+def test_prefixes_come_first_then_words_then_infixes():
+    index = SuggestIndex()
+    index.load([(1, 'The Band'), (2, 'Bandits'), (3, 'Husband Trio'),
+                (4, 'band of gold'), (5, 'Blue')])
+    assert [key for key, _ in index.suggest('band')] == [4, 2, 1, 3]
+    index.remove(4)
+    index.add(6, 'Bandana')
+    assert [key for key, _ in index.suggest('band', 3)] == [6, 2, 1]
+
+
+def median_seconds(function, runs=50):
+    function()
+    timings = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - started)
+    timings.sort()
+    return timings[len(timings) // 2]
+
+
+@pytest.mark.parametrize('query', ['b', 'bl', 'ban', 'and', 'o', '12',
+                                   'blue velvet', 'echo s', 'zz'])
+def test_suggest_beats_a_scan_of_the_10k_names(index, query):
+    # relative to a pass over the same names on the same machine, so a slow
+    # or busy runner does not fail it; bench.py reports the absolute times.
+    names = [(key, name.lower()) for key, name in index._names.items()]
+    scanned = median_seconds(
+        lambda: [key for key, name in names if query in name])
+    suggested = median_seconds(lambda: index.suggest(query, 8))
+    assert suggested < scanned, (suggested, scanned)
@@ -0,0 +1,103 @@
+import re
+from datetime import datetime, timedelta
+from html import unescape
+
+import pytest
+
+from conftest import add_artist, add_show, add_venue, count_queries, fyyur
+
+STATES = ('CA', 'NY', 'TX', 'WA')
+
+
+def seed_areas(areas, venues_per_area=3):
+    artist = add_artist()
+    fyyur.db.session.flush()
+    for i in range(areas):
+        for j in range(venues_per_area):
+            venue = add_venue('Venue {}-{}'.format(i, j),
+                              city='City {}'.format(i), state=STATES[i % 4])
+            fyyur.db.session.flush()
+            add_show(venue, artist, datetime.now() + timedelta(days=j + 1))
+    fyyur.db.session.commit()
+
+
+@pytest.mark.parametrize('areas', [1, 10, 100])
+def test_venues_page_runs_one_query(client, areas):
+    seed_areas(areas)
+    with count_queries() as statements:
+        response = client.get('/venues')
+    assert response.status_code == 200
+    assert response.data.count(b'City ') >= areas
+    assert len(statements) == 1, statements
+    assert 'GROUP BY' in statements[0]
+
+
+def test_venues_page_counts_upcoming_shows(client):
+    seed_areas(2, venues_per_area=2)
+    areas = fyyur.venue_directory()
+    assert sorted(area['city'] for area in areas) == ['City 0', 'City 1']
+    assert all(venue['num_upcoming_shows'] == 1
+               for area in areas for venue in area['venues'])
+
+
+def show_pages(client, url):
+    # the artist ids of every page from url on, following the next links
+    pages = []
+    while url is not None:
+        response = client.get(url)
+        assert response.status_code == 200
+        html = response.data.decode('utf-8')
+        pages.append([int(i) for i in re.findall(r'href="/artists/(\d+)"',
+                                                 html)])
+        link = re.search(r'<li class="next"><a href="([^"]+)"', html)
+        url = unescape(link.group(1)) if link else None
+    return pages
+
+
+def test_shows_pages_follow_the_cursor_to_the_last_page(client):
+    venue = add_venue()
+    artists = [add_artist('Artist {}'.format(i)) for i in range(6)]
+    fyyur.db.session.flush()
+    start = datetime.now().replace(microsecond=0) + timedelta(days=1)
+    # the first two share a start time, so only the id tells them apart
+    shows = [add_show(venue, artist, start + timedelta(hours=max(i - 1, 0)))
+             for i, artist in enumerate(artists[:5])]
+    add_show(venue, artists[5], start - timedelta(days=2))
+    fyyur.db.session.commit()
+    expected = [show.artist_id for show in sorted(
+        shows, key=lambda show: (show.start_time, show.id))]
+
+    pages = show_pages(client, '/shows?per_page=2')
+    assert pages == [expected[:2], expected[2:4], expected[4:]]
+    # a full last page has no next link either
+    assert show_pages(client, '/shows?per_page=5') == [expected]
+
+
+def test_shows_reject_a_malformed_cursor(client):
+    assert client.get('/shows?after=yesterday').status_code == 400
+
+
+def test_genre_filter_finds_venues_and_artists_by_any_of_their_genres(client):
+    jazz, blues, folk = (fyyur.Genre(name=name)
+                         for name in ('Jazz', 'Blues', 'Folk'))
+    both = add_venue('Both Venue', genres=[jazz, blues])
+    add_venue('Folk Venue', genres=[folk])
+    add_artist('Both Artist', genres=[jazz, blues])
+    add_artist('Jazz Artist', genres=[jazz])
+    fyyur.db.session.commit()
+    assert [venue['name'] for area in fyyur.venue_directory('Jazz')
+            for venue in area['venues']] == ['Both Venue']
+    assert [venue['id'] for area in fyyur.venue_directory('Blues')
+            for venue in area['venues']] == [both.id]
+    assert fyyur.venue_directory('Rock n Roll') == []
+
+    for genre, venues, artists in (
+            ('Jazz', {b'Both Venue'}, {b'Both Artist', b'Jazz Artist'}),
+            ('Blues', {b'Both Venue'}, {b'Both Artist'}),
+            ('Folk', {b'Folk Venue'}, set())):
+        page = client.get('/venues?genre=' + genre).data
+        assert set(re.findall(rb'\w+ Venue', page)) == venues
+        page = client.get('/artists?genre=' + genre).data
+        assert set(re.findall(rb'\w+ Artist', page)) == artists
+    assert client.get('/venues?genre=Polka').status_code == 400
+    assert client.get('/artists?genre=Polka').status_code == 400